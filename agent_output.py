@@ -0,0 +1,275 @@
+import argparse
+import json
+import random
+import re
+import time
+from typing import List, Optional
+
+import numpy as np
+from langchain_core.agents import AgentAction
+
+MEDICAL_ADVICE = " Consultez un professionnel de santé."
+# Type de réponse selon l'outil appelé par l'agent
+TOOL_TYPES = {"general_response": "general", "search_medical_docs": "medical"}
+FINAL_ANSWER_PREFIX = "Final Answer:"
+# Sortie de l'AgentExecutor quand max_iterations est atteint (la réponse est alors dans les étapes)
+AGENT_STOPPED_PREFIX = "Agent stopped due to"
+
+
+def with_medical_advice(text: str) -> str:
+    return text if text.rstrip().endswith(MEDICAL_ADVICE.strip()) else text + MEDICAL_ADVICE
+
+
+def build_response(response_type: str, text: str, parsed_by: str) -> dict:
+    return {
+        "type": response_type,
+        "generated_response": with_medical_advice(text) if response_type == "medical" else text,
+        "parsed_by": parsed_by
+    }
+
+
+# 🔹 Protocole structuré : étapes de l'AgentExecutor (return_intermediate_steps) et réponse finale étiquetée
+def parse_agent_steps(steps: list) -> Optional[dict]:
+    """
+    Réponse tirée de la dernière étape qui appelle un outil connu : le type vient du nom exact de l'outil,
+    le texte de son observation. None si aucune étape ne le fait (pas d'outil, outil invalide, erreur de format).
+    """
+    for action, observation in reversed(steps):
+        response_type = TOOL_TYPES.get(action.tool)
+        if response_type is not None:
+            return build_response(response_type, str(observation).strip(), "steps")
+    return None
+
+
+def parse_final_answer(text: str) -> Optional[dict]:
+    """
+    Grammaire stricte de la réponse finale, lue en un passage : ["Final Answer:"] "[TYPE: general|medical]" réponse.
+    None si le texte ne la respecte pas.
+    """
+    body = text.lstrip()
+    if not body.startswith("["):
+        # La réponse commence au premier "Final Answer:" ; la suite peut le contenir sans rien changer
+        start = body.find(FINAL_ANSWER_PREFIX)
+        body = body[start + len(FINAL_ANSWER_PREFIX):].lstrip() if start >= 0 else body
+    end = body.find("]")
+    if not body.startswith("[") or end < 0:
+        return None
+    tag, _, label = body[1:end].partition(":")
+    response_type = label.strip().lower()
+    answer = body[end + 1:].strip()
+    if tag.strip().upper() != "TYPE" or response_type not in ("general", "medical") or not answer:
+        return None
+    return build_response(response_type, answer, "final_answer")
+
+
+def agent_transcript(result: dict) -> str:
+    """
+    Transcription ReAct (Thought/Action/Observation) reconstituée, pour les heuristiques de secours.
+    """
+    parts = []
+    for action, observation in result.get("intermediate_steps", []):
+        parts.append(action.log)
+        if action.tool in TOOL_TYPES:
+            parts.append(f"Observation: {observation}")
+    output = str(result.get("output", ""))
+    if not output.startswith(AGENT_STOPPED_PREFIX):
+        parts.append(output)
+    return "\n".join(parts)
+
+
+def parse_agent_result(result: dict) -> dict:
+    """
+    Lit le résultat de AgentExecutor.ainvoke (avec return_intermediate_steps) : étapes structurées d'abord,
+    puis réponse finale étiquetée (sortie ou texte d'une étape mal formatée), et les heuristiques
+    de parse_agent_transcript en dernier recours.
+    """
+    steps = result.get("intermediate_steps", [])
+    parsed = parse_agent_steps(steps)
+    if parsed is not None:
+        return parsed
+    for text in [str(result.get("output", ""))] + [action.log for action, _ in reversed(steps)]:
+        parsed = parse_final_answer(text)
+        if parsed is not None:
+            return parsed
+    return {**parse_agent_transcript(agent_transcript(result)), "parsed_by": "fallback"}
+
+
+# 🔹 Heuristiques historiques sur la transcription brute (secours uniquement)
+def parse_agent_transcript(agent_output: str) -> dict:
+    # Find all observations
+    observations = re.findall(r"Observation:\s*(.+?)(?=\n\w+:|$)", agent_output, re.DOTALL)
+
+    # Determine response type
+    is_general_response = "general_response" in agent_output
+    is_medical_response = "search_medical_docs" in agent_output
+
+    # If observations exist, use the last one
+    if observations:
+        generated_response = observations[-1].strip()
+
+        # Determine response type
+        if is_general_response:
+            response_type = "general"
+        elif is_medical_response:
+            response_type = "medical"
+            # Append standard medical advice
+            generated_response += " Consultez un professionnel de santé."
+        else:
+            response_type = "general"
+
+        return {
+            "type": response_type,
+            "generated_response": generated_response
+        }
+
+    # Fallback parsing for Final Answer format
+    match = re.search(r"Final Answer:\s*\[TYPE:\s*(general|medical)\]\s*(.+)", agent_output, re.DOTALL)
+    if match:
+        response_type = match.group(1)
+        generated_response = match.group(2).strip()
+
+        # Append medical advice for medical responses
+        if response_type == "medical":
+            generated_response += " Consultez un professionnel de santé."
+
+        return {
+            "type": response_type,
+            "generated_response": generated_response
+        }
+
+    # Alternative observation parsing
+    observation_match = re.search(r"Observation:\s*(.+?)(?:\nThought:|$)", agent_output, re.DOTALL)
+    if observation_match:
+        generated_response = observation_match.group(1).strip()
+        response_type = "general" if is_general_response else "medical"
+
+        # Append medical advice for medical responses
+        if response_type == "medical":
+            generated_response += " Consultez un professionnel de santé."
+
+        return {
+            "type": response_type,
+            "generated_response": generated_response
+        }
+
+    # Fallback parsing for lines
+    lines = [line.strip() for line in agent_output.splitlines() if line.strip()]
+    if lines:
+        # Take the last meaningful line
+        generated_response = lines[-1]
+        response_type = "general" if is_general_response else "medical"
+
+        # Append medical advice for medical responses
+        if response_type == "medical":
+            generated_response += " Consultez un professionnel de santé."
+
+        return {
+            "type": response_type,
+            "generated_response": generated_response
+        }
+
+    # Complete fallback
+    return {
+        "type": "unknown",
+        "generated_response": "Erreur lors de la génération de la réponse."
+    }
+
+
+# 🔹 Enregistrement des résultats de l'agent (logs DEBUG) et relecture pour le benchmark
+def agent_result_record(result: dict) -> dict:
+    return {
+        "output": str(result.get("output", "")),
+        "steps": [
+            {"tool": action.tool, "tool_input": action.tool_input, "log": action.log, "observation": str(observation)}
+            for action, observation in result.get("intermediate_steps", [])
+        ],
+    }
+
+
+def agent_result_from_record(record: dict) -> dict:
+    return {
+        "output": record["output"],
+        "intermediate_steps": [
+            (AgentAction(step["tool"], step["tool_input"], step["log"]), step["observation"])
+            for step in record["steps"]
+        ],
+    }
+
+
+def fuzz_records(n: int, seed: int = 0) -> List[dict]:
+    """
+    Résultats d'agent synthétiques et étiquetés : observations bruitées qui citent les noms d'outils,
+    "Observation:" ou "Final Answer:", longues transcriptions, réponses directes et étapes en erreur.
+    """
+    rng = random.Random(seed)
+    vocabulary = ["glaucoma", "diabète", "treatment", "symptômes", "Bonjour", "merci", "general_response",
+                  "search_medical_docs", "Observation:", "Final Answer:", "Thought:", "[TYPE: general]", "\n", "🏥", "دواء"]
+    records = []
+    for _ in range(n):
+        expected_type = rng.choice(["general", "medical"])
+        tool = "general_response" if expected_type == "general" else "search_medical_docs"
+        answer = "ANSWER-%06d " % rng.randrange(10 ** 6) + " ".join(rng.choice(vocabulary) for _ in range(rng.randint(0, 400)))
+        shape = rng.choice(["step", "step", "step", "direct", "invalid_then_direct"])
+        question = " ".join(rng.choice(vocabulary[:6]) for _ in range(rng.randint(1, 8)))
+        if shape == "step":
+            steps = [{"tool": tool, "tool_input": question, "observation": answer,
+                      "log": f"Thought: {rng.choice(vocabulary)}\nAction: {tool}\nAction Input: {question}"}]
+            output = "Agent stopped due to iteration limit or time limit."
+        else:
+            steps = []
+            if shape == "invalid_then_direct":
+                steps.append({"tool": "_Exception", "tool_input": "Invalid or incomplete response",
+                              "observation": "Invalid or incomplete response",
+                              "log": f"Thought: {question}\nFinal Answer: [TYPE: {expected_type}] {answer}"})
+                output = "Agent stopped due to iteration limit or time limit."
+            else:
+                output = f"[TYPE: {expected_type}] {answer}"
+        records.append({"output": output, "steps": steps, "expected_type": expected_type,
+                        "expected_text": answer.split(" ", 1)[0]})
+    return records
+
+
+def benchmark_parsers(records: List[dict]) -> dict:
+    """
+    Précision (type et texte attendus) et temps de lecture par enregistrement du protocole structuré,
+    des heuristiques sur la sortie de l'agent (ancien comportement de l'API) et sur la transcription complète.
+    """
+    results = [agent_result_from_record(record) for record in records]
+    transcripts = [agent_transcript(result) for result in results]
+    parsers = {
+        "structured": lambda i: parse_agent_result(results[i]),
+        "legacy_output": lambda i: parse_agent_transcript(str(results[i]["output"])),
+        "legacy_transcript": lambda i: parse_agent_transcript(transcripts[i]),
+    }
+    report = {"records": len(records)}
+    for name, parse in parsers.items():
+        timings, correct = [], 0
+        for i, record in enumerate(records):
+            started = time.perf_counter()
+            parsed = parse(i)
+            timings.append((time.perf_counter() - started) * 1e6)
+            correct += parsed["type"] == record["expected_type"] and record["expected_text"] in parsed["generated_response"]
+        report[name] = {
+            "accuracy": round(correct / max(len(records), 1), 4),
+            "mean_us": round(float(np.mean(timings)), 2) if timings else None,
+            "p99_us": round(float(np.percentile(timings, 99)), 2) if timings else None,
+        }
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Précision et temps de lecture des sorties de l'agent (structuré vs heuristiques).")
+    parser.add_argument("--testset", default="./agent_output_testset.jsonl",
+                        help="Résultats d'agent enregistrés et étiquetés (JSONL, format agent_result_record + expected_type/expected_text)")
+    parser.add_argument("--fuzz", type=int, default=2000, help="Résultats synthétiques ajoutés (0 pour aucun)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    with open(args.testset, encoding="utf-8") as f:
+        recorded = [json.loads(line) for line in f if line.strip()]
+    for label, records in [("enregistrés", recorded), ("fuzz", fuzz_records(args.fuzz, args.seed))]:
+        if not records:
+            continue
+        print(f"\n📋 Résultats {label} :")
+        for key, value in benchmark_parsers(records).items():
+            print(f"{key}: {value}")
@@ -1,23 +1,66 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import StreamingResponse, Response
 from pydantic import BaseModel
-from typing import List
-from langchain_google_genai import ChatGoogleGenerativeAI
+from typing import List, TYPE_CHECKING
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 from dotenv import load_dotenv
 import os
 import uvicorn
 from langchain.agents import Tool, ZeroShotAgent, AgentExecutor
 from langchain.prompts import PromptTemplate
 from langchain.chains import LLMChain
-from ingest import create_cloud_sql_database_connection, get_embeddings, get_vector_store
-from retrieve import get_relevant_documents
-from config import TABLE_NAME
-import re
+from ingest import create_cloud_sql_database_connection, get_embeddings, get_vector_store, warm_up_engine, get_pool_stats
+from retrieve import (
+    get_relevant_documents_by_vector, aget_relevant_documents_by_vector,
+    get_hybrid_documents_by_vector, aget_hybrid_documents_by_vector, document_id
+)
+from lexical import BM25Index
+from rerank import Reranker, cross_encoder_scores, get_cross_encoder
+from agent_output import parse_agent_result, agent_result_record, with_medical_advice
+from observability import (
+    get_logger, new_trace_id, stage, register_stats, render_metrics, LLMTimingCallback,
+    REQUEST_SECONDS, TOOL_CHOICES, CACHE_EVENTS, ERRORS, AGENT_OUTPUT_PARSES
+)
+from prometheus_client import CONTENT_TYPE_LATEST
+from cache import CachedEmbeddings, SemanticResponseCache, GeneralReplyCache, embed_queries_batch, normalize_text, lazy_singleton
+from router import QueryRouter, load_focus_areas, general_intent
+from feedback import FeedbackStore, FeedbackSink
+from sessions import SessionStore, SessionTurn, rewrite_follow_up, topic_terms
+from translation import QueryNormalizer, GlossaryTranslator, LLMTranslator, RETRIEVAL_LANGUAGE
+from langchain_core.documents.base import Document
+from config import (
+    TABLE_NAME, LLM_MODEL, LLM_POOL_SIZE, DEFAULT_TEMPERATURE,
+    MAX_CONCURRENT_REQUESTS, THREAD_POOL_SIZE, BATCH_MAX_QUESTIONS, BATCH_CONCURRENCY,
+    RESPONSE_CACHE_SIZE, RESPONSE_CACHE_TTL, RESPONSE_CACHE_MIN_SIMILARITY, RESPONSE_CACHE_PATH,
+    VECTOR_INDEX_EF_SEARCH, VECTOR_INDEX_PROBES, VECTOR_BACKEND,
+    ROUTER_ENABLED, ROUTER_MIN_CONFIDENCE, CORPUS_CSV_PATH, GENERAL_REPLY_CACHE_SIZE, LOG_LEVEL,
+    FEEDBACK_DB_PATH, FEEDBACK_QUEUE_SIZE, FEEDBACK_BATCH_SIZE, FEEDBACK_FLUSH_INTERVAL,
+    SESSION_MAX_SESSIONS, SESSION_TTL, SESSION_MAX_TURNS, SESSION_DB_PATH, SESSION_SHARED,
+    SESSION_FOLLOW_UP_MAX_WORDS, SESSION_REUSE_MIN_SIMILARITY,
+    RETRIEVAL_TOP_K, LEXICAL_INDEX_PATH, HYBRID_SEARCH_ENABLED, HYBRID_CANDIDATES,
+    HYBRID_VECTOR_WEIGHT, HYBRID_LEXICAL_WEIGHT, HYBRID_RRF_K,
+    RERANK_ENABLED, RERANK_CANDIDATES, RERANK_CACHE_SIZE, RERANK_MAX_INFLIGHT, RERANK_BUDGET_MS,
+    TRANSLATION_ENABLED, TRANSLATOR, TRANSLATION_CACHE_SIZE, TRANSLATION_TIMEOUT
+)
+import json
+import logging
+import time
+
+if TYPE_CHECKING:
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+logger = get_logger()
+# Traces détaillées des chaînes LangChain seulement en DEBUG
+VERBOSE = LOG_LEVEL == "DEBUG"
 
 # Load environment variables
 load_dotenv()
 API_KEY = os.getenv('API_KEY')
-if not API_KEY:
-    raise ValueError("API_KEY is missing. Please set it in the environment variables.")
 
 SYSTEM_PROMPT = """
 Tu es AstraMed, un assistant virtuel spécialisé dans l'information médicale. Voici tes objectifs et tes règles :
@@ -29,15 +72,248 @@ Tu es AstraMed, un assistant virtuel spécialisé dans l'information médicale.
 6. Tes réponses peuvent contenir des explications médicales simplifiées, mais veille à ne pas fournir de diagnostic formel.
 """
 
+# Réponses prêtes aux intentions générales les plus fréquentes (voir router.general_intent), par langue
+CANNED_REPLIES = {
+    "greeting": {
+        "Français": "Bonjour ! Je suis AstraMed, votre assistant virtuel d'information médicale. Comment puis-je vous aider aujourd'hui ? N'oubliez pas que je ne peux pas donner d'avis médical.",
+        "English": "Hello! I'm AstraMed, your virtual medical information assistant. How can I help you today? Please remember that I cannot give medical advice.",
+        "Arabic": "مرحبا! أنا AstraMed، مساعدك الافتراضي للمعلومات الطبية. كيف يمكنني مساعدتك اليوم؟ تذكر أنني لا أستطيع تقديم استشارة طبية.",
+    },
+    "thanks": {
+        "Français": "Avec plaisir ! N'hésitez pas si vous avez d'autres questions. Pour tout diagnostic ou traitement, consultez un professionnel de santé.",
+        "English": "You're welcome! Feel free to ask if you have other questions. For any diagnosis or treatment, please consult a healthcare professional.",
+        "Arabic": "على الرحب والسعة! لا تتردد في طرح أسئلة أخرى. لأي تشخيص أو علاج، استشر أخصائي رعاية صحية.",
+    },
+    "goodbye": {
+        "Français": "Au revoir et prenez soin de vous ! N'hésitez pas à revenir si vous avez des questions.",
+        "English": "Goodbye and take care! Feel free to come back if you have any questions.",
+        "Arabic": "إلى اللقاء واعتنِ بنفسك! لا تتردد في العودة إذا كانت لديك أي أسئلة.",
+    },
+    "identity": {
+        "Français": "Je suis AstraMed, un assistant virtuel qui fournit des informations médicales générales. Je ne suis pas médecin : pour un diagnostic ou un traitement, consultez un professionnel de santé.",
+        "English": "I'm AstraMed, a virtual assistant providing general medical information. I'm not a doctor: for a diagnosis or treatment, please consult a healthcare professional.",
+        "Arabic": "أنا AstraMed، مساعد افتراضي يقدم معلومات طبية عامة. لست طبيبا: للتشخيص أو العلاج، استشر أخصائي رعاية صحية.",
+    },
+    "wellbeing": {
+        "Français": "Je vais bien, merci ! Je suis là pour répondre à vos questions d'ordre médical. Que puis-je faire pour vous ?",
+        "English": "I'm doing well, thank you! I'm here to answer your medical questions. What can I do for you?",
+        "Arabic": "أنا بخير، شكرا! أنا هنا للإجابة عن أسئلتك الطبية. كيف يمكنني مساعدتك؟",
+    },
+}
+
+# Prompt de l'agent, construit une seule fois au chargement du module
+AGENT_PROMPT = """
+Tu es AstraMed, un assistant médical spécialisé. L'entrée fournie est de la forme :
+[question]
+Langue de réponse : [language]
+
+Suis ces étapes strictement :
+1. Analyse uniquement la partie [question] pour déterminer si elle est :
+   - Médicale : Symptômes, maladies, traitements (ex: 'mal de tête', 'diabète')
+   - Générale : Salutations, questions personnelles, remerciements (ex: 'bonjour', 'merci')
+2. Si la question est GÉNÉRALE :
+   - Utilise l'outil general_response avec [question] uniquement.
+   - Réponds dans la langue spécifiée par [language].
+   - Formate ta réponse finale comme suit : "Final Answer: [TYPE: general] [réponse]"
+3. Si la question est MÉDICALE :
+   - Utilise l'outil search_medical_docs avec [question] uniquement.
+   - Intègre les sources dans ta réponse avec la mention "[Source]".
+   - Ajoute à la fin : "Consultez un professionnel de santé."
+   - Réponds dans la langue spécifiée par [language].
+   - Formate ta réponse finale comme suit : "Final Answer: [TYPE: medical] [réponse]"
+
+Exemples de réponses attendues :
+- Pour "bonjour" :
+  Thought: La question est une salutation, donc de type GÉNÉRALE.
+  Action: general_response
+  Action Input: bonjour
+  Observation: Bonjour ! Je suis AstraMed, votre assistant virtuel d'information médicale. Comment puis-je vous aider aujourd'hui ? ...
+  Final Answer: [TYPE: general] Bonjour ! Je suis AstraMed, votre assistant virtuel d'information médicale. Comment puis-je vous aider aujourd'hui ? N'oubliez pas que je ne peux pas donner d'avis médical.
+- Pour "quels sont les symptômes du diabète" :
+  Thought: La question concerne une maladie, donc de type MÉDICALE.
+  Action: search_medical_docs
+  Action Input: quels sont les symptômes du diabète
+  Observation: Les symptômes du diabète incluent ...
+  Final Answer: [TYPE: medical] Les symptômes du diabète incluent ... [Source]. Consultez un professionnel de santé.
+
+Entrée complète : {input}
+{agent_scratchpad}
+"""
+
+# Nombre max d'exécutions simultanées de l'agent par worker
+request_semaphore = asyncio.Semaphore(MAX_CONCURRENT_REQUESTS)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Pool de threads borné pour les appels sans API asynchrone native
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=THREAD_POOL_SIZE))
+    # Ressources lourdes construites avant la première requête plutôt qu'à l'import
+    await asyncio.to_thread(warm_up)
+    feedback_sink = get_feedback_sink()
+    feedback_sink.start()
+    yield
+    # Les avis encore en file sont écrits avant l'arrêt
+    await feedback_sink.close()
+
 app = FastAPI(
     title="AstraMed API",
     description="API pour AstraMed via Agent LangChain",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
-engine = create_cloud_sql_database_connection()
-embedding = get_embeddings()
-vector_store = get_vector_store(engine, TABLE_NAME, embedding)
+# 🔹 Ressources partagées : construites au premier usage ou par warm_up(), jamais à l'import du module
+@lazy_singleton
+def get_engine():
+    # Pas de connexion Cloud SQL quand l'index vectoriel est local
+    return create_cloud_sql_database_connection() if VECTOR_BACKEND == "cloudsql" else None
+
+@lazy_singleton
+def get_embedding():
+    return get_embeddings()
+
+@lazy_singleton
+def get_store():
+    return get_vector_store(get_engine(), TABLE_NAME, get_embedding())
+
+@lazy_singleton
+def get_lexical_index() -> BM25Index | None:
+    # Index BM25 construit par ingest.py ; sans lui, recherche vectorielle seule
+    return BM25Index.load(LEXICAL_INDEX_PATH) if HYBRID_SEARCH_ENABLED else None
+
+@lazy_singleton
+def get_reranker() -> Reranker | None:
+    return Reranker(
+        cross_encoder_scores,
+        cache_size=RERANK_CACHE_SIZE,
+        max_inflight=RERANK_MAX_INFLIGHT,
+        budget_ms=RERANK_BUDGET_MS
+    ) if RERANK_ENABLED else None
+
+@lazy_singleton
+def get_response_cache() -> SemanticResponseCache | None:
+    return SemanticResponseCache(
+        max_size=RESPONSE_CACHE_SIZE,
+        ttl_seconds=RESPONSE_CACHE_TTL,
+        min_similarity=RESPONSE_CACHE_MIN_SIMILARITY,
+        persist_path=RESPONSE_CACHE_PATH or None
+    ) if RESPONSE_CACHE_SIZE > 0 else None
+
+@lazy_singleton
+def get_query_router() -> QueryRouter | None:
+    return QueryRouter(
+        get_embedding(), load_focus_areas(CORPUS_CSV_PATH), ROUTER_MIN_CONFIDENCE
+    ) if ROUTER_ENABLED else None
+
+@lazy_singleton
+def get_session_store() -> SessionStore | None:
+    return SessionStore(
+        max_sessions=SESSION_MAX_SESSIONS,
+        ttl_seconds=SESSION_TTL,
+        max_turns=SESSION_MAX_TURNS,
+        persist_path=SESSION_DB_PATH or None,
+        shared=SESSION_SHARED
+    ) if SESSION_MAX_SESSIONS > 0 else None
+
+@lazy_singleton
+def get_topic_terms() -> set:
+    # Domaines focus_area : une question qui en nomme un n'est pas une relance
+    query_router = get_query_router()
+    return topic_terms(query_router.focus_areas if query_router is not None else load_focus_areas(CORPUS_CSV_PATH))
+
+@lazy_singleton
+def get_query_normalizer() -> QueryNormalizer | None:
+    # Le traducteur LLM réutilise le client Gemini à température 0 de l'agent
+    translator = GlossaryTranslator() if TRANSLATOR == "glossary" else LLMTranslator(lambda: get_llm(0.0))
+    return QueryNormalizer(
+        translator, cache_size=TRANSLATION_CACHE_SIZE, timeout_s=TRANSLATION_TIMEOUT
+    ) if TRANSLATION_ENABLED else None
+
+@lazy_singleton
+def get_feedback_sink() -> FeedbackSink:
+    return FeedbackSink(
+        FeedbackStore(FEEDBACK_DB_PATH),
+        max_queue=FEEDBACK_QUEUE_SIZE,
+        batch_size=FEEDBACK_BATCH_SIZE,
+        flush_interval=FEEDBACK_FLUSH_INTERVAL
+    )
+
+# Compteurs déjà tenus par les caches, le routeur et le pool, exportés sur /metrics (sans construire ces objets)
+register_stats(
+    "embedding_cache",
+    lambda: get_embedding().stats() if get_embedding.is_loaded() and isinstance(get_embedding(), CachedEmbeddings) else None,
+    counters=["hits", "misses", "evictions", "disk_hits"], gauges=["size"]
+)
+register_stats(
+    "response_cache",
+    lambda: get_response_cache().stats() if get_response_cache.is_loaded() and get_response_cache() else None,
+    counters=["hits", "misses", "evictions", "expirations", "synced"], gauges=["size"]
+)
+register_stats(
+    "general_reply_cache",
+    lambda: general_reply_cache.stats(),
+    counters=["canned_hits", "hits", "misses", "evictions"], gauges=["size"]
+)
+register_stats(
+    "router",
+    lambda: get_query_router().stats.stats() if get_query_router.is_loaded() and get_query_router() else None,
+    counters=["total", "routed", "agent", "llm_calls_saved"]
+)
+register_stats(
+    "sessions",
+    lambda: get_session_store().stats() if get_session_store.is_loaded() and get_session_store() else None,
+    counters=["hits", "misses", "evictions", "expirations", "rewrites", "retrieval_reuses"], gauges=["size"]
+)
+register_stats(
+    "rerank",
+    lambda: get_reranker().stats() if get_reranker.is_loaded() and get_reranker() else None,
+    counters=["reranked", "skipped_load", "skipped_budget", "pairs_scored"], gauges=["inflight", "latency_ema_ms"]
+)
+register_stats(
+    "translation",
+    lambda: get_query_normalizer().stats() if get_query_normalizer.is_loaded() and get_query_normalizer() else None,
+    counters=["translated", "failures", "cache_hits", "cache_misses"], gauges=["cache_size"]
+)
+register_stats(
+    "feedback",
+    lambda: get_feedback_sink().stats() if get_feedback_sink.is_loaded() else None,
+    counters=["accepted", "rejected", "written", "flushes", "failures"], gauges=["queued"]
+)
+register_stats(
+    "db_pool",
+    lambda: get_pool_stats(get_engine()) if get_engine.is_loaded() and get_engine() else None,
+    counters=["connects", "checkouts", "checkins", "invalidations"],
+    gauges=["open_connections", "idle_connections", "checked_out", "overflow", "utilization"]
+)
+
+def warm_up() -> None:
+    """
+    Construit connexion, vector store, caches, routeur et agent par défaut (appelé par le lifespan).
+    """
+    get_store()
+    get_lexical_index()
+    # Modèle du reranking chargé avant la première requête (plusieurs secondes sinon)
+    if get_reranker() is not None:
+        get_cross_encoder()
+    # Connexions Cloud SQL ouvertes avant la première requête (handshake du connecteur hors du chemin critique)
+    engine = get_engine()
+    if engine is not None:
+        try:
+            logger.info("pool de connexions préchauffé", extra={"warm_up": warm_up_engine(engine, get_store())})
+        except Exception:
+            logger.exception("préchauffage du pool de connexions impossible")
+    get_response_cache()
+    get_query_normalizer()
+    if get_session_store() is not None:
+        get_topic_terms()
+    get_agent_executor(DEFAULT_TEMPERATURE)
+    # Centroïdes du pré-routeur (sinon calculés à la première question ambiguë)
+    query_router = get_query_router()
+    if query_router is not None:
+        try:
+            query_router.fit()
+        except Exception:
+            logger.exception("centroïdes du routeur non calculés au démarrage")
 
 class UserInput(BaseModel):
     question: str
@@ -46,116 +322,92 @@ class UserInput(BaseModel):
     similarity_threshold: float
     session_id: str = ""
 
+class BatchInput(BaseModel):
+    questions: List[str]
+    temperature: float
+    language: str
+    similarity_threshold: float
+    session_id: str = ""
+
 class FeedbackInput(BaseModel):
     session_id: str
     question: str
     rating: int  # 1 pour 👍, 0 pour 👎
     comments: str = ""
+    focus_area: str = ""  # Domaine de la source principale de la réponse notée
+    source: str = ""
+    response_type: str = ""
 
-# Function to parse agent output more robustly
-def parse_agent_output(agent_output: str) -> dict:
-    # Find all observations
-    observations = re.findall(r"Observation:\s*(.+?)(?=\n\w+:|$)", agent_output, re.DOTALL)
-    
-    # Determine response type
-    is_general_response = "general_response" in agent_output
-    is_medical_response = "search_medical_docs" in agent_output
-    
-    # If observations exist, use the last one
-    if observations:
-        generated_response = observations[-1].strip()
-        
-        # Determine response type
-        if is_general_response:
-            response_type = "general"
-        elif is_medical_response:
-            response_type = "medical"
-            # Append standard medical advice
-            generated_response += " Consultez un professionnel de santé."
-        else:
-            response_type = "general"
-        
-        return {
-            "type": response_type,
-            "generated_response": generated_response
-        }
-    
-    # Fallback parsing for Final Answer format
-    match = re.search(r"Final Answer:\s*\[TYPE:\s*(general|medical)\]\s*(.+)", agent_output, re.DOTALL)
-    if match:
-        response_type = match.group(1)
-        generated_response = match.group(2).strip()
-        
-        # Append medical advice for medical responses
-        if response_type == "medical":
-            generated_response += " Consultez un professionnel de santé."
-        
-        return {
-            "type": response_type,
-            "generated_response": generated_response
-        }
-    
-    # Alternative observation parsing
-    observation_match = re.search(r"Observation:\s*(.+?)(?:\nThought:|$)", agent_output, re.DOTALL)
-    if observation_match:
-        generated_response = observation_match.group(1).strip()
-        response_type = "general" if is_general_response else "medical"
-        
-        # Append medical advice for medical responses
-        if response_type == "medical":
-            generated_response += " Consultez un professionnel de santé."
-        
-        return {
-            "type": response_type,
-            "generated_response": generated_response
-        }
-    
-    # Fallback parsing for lines
-    lines = [line.strip() for line in agent_output.splitlines() if line.strip()]
-    if lines:
-        # Take the last meaningful line
-        generated_response = lines[-1]
-        response_type = "general" if is_general_response else "medical"
-        
-        # Append medical advice for medical responses
-        if response_type == "medical":
-            generated_response += " Consultez un professionnel de santé."
-        
-        return {
-            "type": response_type,
-            "generated_response": generated_response
-        }
-    
-    # Complete fallback
-    return {
-        "type": "unknown",
-        "generated_response": "Erreur lors de la génération de la réponse."
-    }
-
-# Bonus function to extract sources for medical responses
-def extract_medical_sources(agent_output: str) -> List[dict]:
-    # Regex to extract sources with their details
-    source_pattern = r"🏥 *Source \d+:\s*(\w+)\s*\(Similarité:\s*([\d.]+)\)\n🔹 *Réponse \d+ *:*\s*(.+?)(?=\n🏥 *Source|\n\n|$)"
-    
-    sources = []
-    for match in re.finditer(source_pattern, agent_output, re.DOTALL | re.IGNORECASE):
-        sources.append({
-            "source": match.group(1),
-            "similarity": float(match.group(2)),
-            "content": match.group(3).strip()
-        })
-    
-    return sources
+# Recherche vectorielle, ou hybride (vecteurs + BM25) quand l'index lexical est disponible
+def search_candidates(query: str, query_vector: List[float], similarity_threshold: float, k: int) -> List[Document]:
+    lexical_index = get_lexical_index()
+    with stage("vector_search"):
+        if lexical_index is None:
+            return get_relevant_documents_by_vector(
+                query_vector, get_store(), similarity_threshold, VECTOR_INDEX_EF_SEARCH, VECTOR_INDEX_PROBES, k=k
+            )
+        return get_hybrid_documents_by_vector(
+            query, query_vector, get_store(), lexical_index, similarity_threshold, k, max(HYBRID_CANDIDATES, k),
+            (HYBRID_VECTOR_WEIGHT, HYBRID_LEXICAL_WEIGHT), HYBRID_RRF_K, VECTOR_INDEX_EF_SEARCH, VECTOR_INDEX_PROBES
+        )
+
+async def asearch_candidates(query: str, query_vector: List[float], similarity_threshold: float, k: int) -> List[Document]:
+    lexical_index = get_lexical_index()
+    with stage("vector_search"):
+        if lexical_index is None:
+            return await aget_relevant_documents_by_vector(
+                query_vector, get_store(), similarity_threshold, VECTOR_INDEX_EF_SEARCH, VECTOR_INDEX_PROBES, k=k
+            )
+        return await aget_hybrid_documents_by_vector(
+            query, query_vector, get_store(), lexical_index, similarity_threshold, k, max(HYBRID_CANDIDATES, k),
+            (HYBRID_VECTOR_WEIGHT, HYBRID_LEXICAL_WEIGHT), HYBRID_RRF_K, VECTOR_INDEX_EF_SEARCH, VECTOR_INDEX_PROBES
+        )
+
+# Avec le reranking, RERANK_CANDIDATES candidats sont reclassés par le cross-encoder et les RETRIEVAL_TOP_K
+# meilleurs gardés ; sous charge (voir Reranker), la recherche revient à RETRIEVAL_TOP_K documents sans reranking
+def retrieve_documents(query: str, query_vector: List[float], similarity_threshold: float) -> List[Document]:
+    reranker = get_reranker()
+    if reranker is None:
+        return search_candidates(query, query_vector, similarity_threshold, RETRIEVAL_TOP_K)
+    with reranker.slot() as admitted:
+        if not admitted:
+            return search_candidates(query, query_vector, similarity_threshold, RETRIEVAL_TOP_K)
+        docs = search_candidates(query, query_vector, similarity_threshold, RERANK_CANDIDATES)
+        with stage("rerank"):
+            return reranker.rerank(query, docs, RETRIEVAL_TOP_K)
+
+async def aretrieve_documents(query: str, query_vector: List[float], similarity_threshold: float) -> List[Document]:
+    reranker = get_reranker()
+    if reranker is None:
+        return await asearch_candidates(query, query_vector, similarity_threshold, RETRIEVAL_TOP_K)
+    with reranker.slot() as admitted:
+        if not admitted:
+            return await asearch_candidates(query, query_vector, similarity_threshold, RETRIEVAL_TOP_K)
+        docs = await asearch_candidates(query, query_vector, similarity_threshold, RERANK_CANDIDATES)
+        # Inférence CPU hors de la boucle d'événements
+        with stage("rerank"):
+            return await asyncio.to_thread(reranker.rerank, query, docs, RETRIEVAL_TOP_K)
 
 # Function to search medical documents
-def search_medical_docs(query: str, similarity_threshold: float) -> tuple[str, List[dict]]:
-    docs = get_relevant_documents(query, vector_store, similarity_threshold)
-    print(f"[DEBUG] Documents trouvés dansGAR vector_store : {len(docs)}")
+def search_medical_docs(query: str, similarity_threshold: float, query_vector: List[float] | None = None) -> tuple[str, List[dict]]:
+    if query_vector is None:
+        with stage("embedding"):
+            query_vector = get_embedding().embed_query(query)
+    return format_medical_docs(retrieve_documents(query, query_vector, similarity_threshold))
+
+async def asearch_medical_docs(query: str, similarity_threshold: float, query_vector: List[float] | None = None) -> tuple[str, List[dict]]:
+    if query_vector is None:
+        with stage("embedding"):
+            query_vector = await get_embedding().aembed_query(query)
+    return format_medical_docs(await aretrieve_documents(query, query_vector, similarity_threshold))
+
+def format_medical_docs(docs: List[Document]) -> tuple[str, List[dict]]:
+    logger.debug("documents trouvés dans le vector store", extra={"count": len(docs)})
     if not docs:
         return "Aucune source pertinente trouvée.", []
     
     top_docs = []
-    for doc in docs[:3]:
+    for doc in docs[:RETRIEVAL_TOP_K]:
         ans = doc.metadata.get("answer", "Réponse non disponible.")
         src = doc.metadata.get("source", "Inconnue")
         scr = doc.metadata.get("score", 0.0)
@@ -163,157 +415,683 @@ def search_medical_docs(query: str, similarity_threshold: float) -> tuple[str, L
             "message": ans,
             "metadata": {
                 "source": src,
-                "similarity_score": scr
+                "focus_area": doc.metadata.get("focus_area", ""),
+                "id": document_id(doc),
+                "similarity_score": scr,
+                **({"rerank_score": doc.metadata["rerank_score"]} if "rerank_score" in doc.metadata else {})
             }
         })
-    print(f"[DEBUG] Top 3 documents : {top_docs}")
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("top 3 documents", extra={"top_docs": top_docs})
     top_docs_str = "\n".join([f"{doc['message']}" for doc in top_docs if doc["message"] != "Réponse non disponible."])
     return top_docs_str, top_docs
 
 # Function for general responses
-def general_response(query: str) -> str:
-    llm = ChatGoogleGenerativeAI(
-        model="gemini-1.5-pro",
-        google_api_key=API_KEY,
-        temperature=0.3,
-        verbose=True
-    )
-    messages = [
-        {"role": "system", "content": SYSTEM_PROMPT},
+def get_general_llm() -> "ChatGoogleGenerativeAI":
+    # Même client que l'agent à la température par défaut, créé une seule fois
+    return get_llm(DEFAULT_TEMPERATURE)
+
+def general_messages(query: str, language: str) -> List[dict]:
+    return [
+        {"role": "system", "content": f"{SYSTEM_PROMPT}\nRéponds en {language}."},
         {"role": "user", "content": query}
     ]
-    response = llm.invoke(messages)
-    return response.content
 
-# Initialize the language model
-def get_llm(temperature: float = 0.0) -> ChatGoogleGenerativeAI:
+# Réponses générales déjà générées, par (question normalisée, langue), et réponses prêtes servies.
+# Compteurs propres au worker ; les totaux de tous les workers sont dans CACHE_EVENTS sur /metrics
+general_reply_cache = GeneralReplyCache(GENERAL_REPLY_CACHE_SIZE)
+
+def cached_general_reply(query: str, language: str) -> str | None:
+    """
+    Réponse prête (salutation, remerciement...) ou déjà générée pour cette question et cette langue, sinon None.
+    """
+    intent = general_intent(query)
+    if intent is not None and language in CANNED_REPLIES[intent]:
+        general_reply_cache.record_canned()
+        CACHE_EVENTS.labels("general_reply", "canned").inc()
+        return CANNED_REPLIES[intent][language]
+    reply = general_reply_cache.get((normalize_text(query), language))
+    CACHE_EVENTS.labels("general_reply", "miss" if reply is None else "hit").inc()
+    logger.debug("general_response", extra={"intent": intent, "cached": reply is not None})
+    return reply
+
+def general_response(query: str) -> str:
+    language = get_request_context().language
+    reply = cached_general_reply(query, language)
+    if reply is None:
+        reply = get_general_llm().invoke(general_messages(query, language)).content
+        general_reply_cache.put((normalize_text(query), language), reply)
+    return reply
+
+async def ageneral_response(query: str) -> str:
+    language = get_request_context().language
+    reply = cached_general_reply(query, language)
+    if reply is not None:
+        emit_event("token", {"text": reply})
+        return reply
+
+    llm = get_general_llm()
+    if not is_streaming():
+        reply = (await llm.ainvoke(general_messages(query, language))).content
+    else:
+        # Mode streaming : relayer chaque token au client au fil de la génération
+        chunks = []
+        async for chunk in llm.astream(general_messages(query, language)):
+            chunks.append(chunk.content)
+            emit_event("token", {"text": chunk.content})
+        reply = "".join(chunks)
+    general_reply_cache.put((normalize_text(query), language), reply)
+    return reply
+
+# Initialize the language model (one client per temperature, bounded pool)
+@lru_cache(maxsize=LLM_POOL_SIZE)
+def _pooled_llm(temperature: float) -> "ChatGoogleGenerativeAI":
+    # Vérifié ici plutôt qu'à l'import : importer api ne demande pas d'identifiants
+    if not API_KEY:
+        raise ValueError("API_KEY is missing. Please set it in the environment variables.")
+    from langchain_google_genai import ChatGoogleGenerativeAI
     return ChatGoogleGenerativeAI(
-        model="gemini-1.5-pro",
+        model=LLM_MODEL,
         google_api_key=API_KEY,
         temperature=temperature,
-        verbose=True
+        callbacks=[LLMTimingCallback()],
+        verbose=VERBOSE
+    )
+
+def get_llm(temperature: float = 0.0) -> "ChatGoogleGenerativeAI":
+    # Arrondi pour que 0.3 et 0.30000000000000004 partagent le même client
+    return _pooled_llm(round(temperature, 2))
+
+# 🔹 Registre du pipeline : outils, prompt et agents construits une seule fois
+@dataclass
+class RequestContext:
+    similarity_threshold: float = 0.5
+    language: str = "Français"
+    # Résultats de search_medical_docs déjà calculés pendant la requête, par question
+    retrievals: dict = field(default_factory=dict)
+    # Embeddings déjà calculés pendant la requête (caches, routeur), par texte : la recherche les reprend
+    query_vectors: dict = field(default_factory=dict)
+    # Requêtes de recherche en anglais (tâches lancées pendant le routage), par question
+    retrieval_queries: dict = field(default_factory=dict)
+    # File des événements SSE de /answer/stream (None hors streaming)
+    events: asyncio.Queue | None = None
+
+request_context: ContextVar[RequestContext] = ContextVar("request_context")
+
+def get_request_context() -> RequestContext:
+    ctx = request_context.get(None)
+    if ctx is None:
+        ctx = RequestContext()
+        request_context.set(ctx)
+    return ctx
+
+def is_streaming() -> bool:
+    ctx = request_context.get(None)
+    return ctx is not None and ctx.events is not None
+
+def emit_event(event: str, data: dict) -> None:
+    """
+    Publie un événement vers le client /answer/stream ; sans effet hors streaming.
+    """
+    if is_streaming():
+        request_context.get().events.put_nowait((event, data))
+
+# 🔹 Requête de recherche : le corpus MedQuAD est en anglais, les questions françaises et arabes y sont traduites
+def normalize_query(query: str) -> str:
+    query_normalizer = get_query_normalizer()
+    if query_normalizer is None:
+        return query
+    with stage("translation"):
+        normalized = query_normalizer.normalize(query)
+    return record_normalization(normalized)
+
+async def anormalize_query(query: str) -> str:
+    """
+    Requête anglaise de `query` ; sans traducteur, ou si la traduction échoue, la question elle-même.
+    """
+    query_normalizer = get_query_normalizer()
+    if query_normalizer is None:
+        return query
+    try:
+        with stage("translation"):
+            normalized = await query_normalizer.anormalize(query)
+    except Exception:
+        logger.exception("normalisation de la requête impossible")
+        return query
+    return record_normalization(normalized)
+
+def record_normalization(normalized) -> str:
+    if normalized.language != RETRIEVAL_LANGUAGE:
+        CACHE_EVENTS.labels("translation", "hit" if normalized.source == "cache" else "miss").inc()
+        logger.info("requête traduite", extra={
+            "language": normalized.language, "query": normalized.query, "translation": normalized.source
+        })
+    return normalized.query
+
+def start_retrieval_query(query: str) -> None:
+    """
+    Lance la traduction de `query` en tâche de fond (pendant le routage) ; la recherche l'attendra.
+    """
+    ctx = get_request_context()
+    key = query.strip()
+    if key not in ctx.retrieval_queries and key not in ctx.retrievals:
+        ctx.retrieval_queries[key] = asyncio.create_task(anormalize_query(key))
+
+async def aretrieval_query(query: str) -> str:
+    ctx = get_request_context()
+    key = query.strip()
+    if key not in ctx.retrieval_queries:
+        ctx.retrieval_queries[key] = asyncio.ensure_future(anormalize_query(key))
+    return await ctx.retrieval_queries[key]
+
+def cancel_retrieval_queries(ctx: RequestContext) -> None:
+    """
+    Annule les traductions encore en cours : réponse générale, erreur ou client déconnecté.
+    """
+    for task in ctx.retrieval_queries.values():
+        if not task.done():
+            task.cancel()
+
+def search_request_docs(query: str) -> tuple[str, List[dict]]:
+    """
+    search_medical_docs mémorisé sur la requête en cours : une même question n'est embarquée et recherchée qu'une fois.
+    """
+    ctx = get_request_context()
+    key = query.strip()
+    if key not in ctx.retrievals:
+        retrieval_query = normalize_query(key)
+        ctx.retrievals[key] = search_medical_docs(
+            retrieval_query, ctx.similarity_threshold, ctx.query_vectors.get(retrieval_query.strip())
+        )
+    return ctx.retrievals[key]
+
+def last_request_docs() -> List[dict] | None:
+    """
+    Documents de la dernière recherche faite par l'outil pendant la requête en cours, ou None.
+    """
+    ctx = get_request_context()
+    if not ctx.retrievals:
+        return None
+    return list(ctx.retrievals.values())[-1][1]
+
+async def asearch_request_docs(query: str) -> tuple[str, List[dict]]:
+    """
+    Version asynchrone de search_request_docs, partageant le même contexte de requête.
+    """
+    ctx = get_request_context()
+    key = query.strip()
+    if key not in ctx.retrievals:
+        retrieval_query = await aretrieval_query(key)
+        ctx.retrievals[key] = await asearch_medical_docs(
+            retrieval_query, ctx.similarity_threshold, ctx.query_vectors.get(retrieval_query.strip())
+        )
+        # Les sources partent avant la fin de l'agent pour afficher la liste tout de suite
+        top_docs_str, top_docs = ctx.retrievals[key]
+        emit_event("sources", {"answers": top_docs})
+        if top_docs:
+            emit_event("token", {"text": top_docs_str})
+    return ctx.retrievals[key]
+
+def search_medical_docs_tool(query: str) -> str:
+    return search_request_docs(query)[0]
+
+async def asearch_medical_docs_tool(query: str) -> str:
+    return (await asearch_request_docs(query))[0]
+
+TOOLS = [
+    Tool(
+        name="search_medical_docs",
+        func=search_medical_docs_tool,
+        coroutine=asearch_medical_docs_tool,
+        description="Recherche dans la base de documents médicaux. À utiliser uniquement pour les questions médicales spécifiques (symptômes, diagnostics, traitements)."
+    ),
+    Tool(
+        name="general_response",
+        func=general_response,
+        coroutine=ageneral_response,
+        description="Répond aux questions générales ou salutations en utilisant le prompt système."
+    ),
+]
+
+AGENT_PROMPT_TEMPLATE = PromptTemplate(
+    input_variables=["input", "agent_scratchpad"],
+    template=AGENT_PROMPT
+)
+
+@lru_cache(maxsize=LLM_POOL_SIZE)
+def _build_agent_executor(temperature: float) -> AgentExecutor:
+    llm_chain = LLMChain(llm=get_llm(temperature), prompt=AGENT_PROMPT_TEMPLATE)
+
+    # Initialize agent with iteration limit
+    agent_instance = ZeroShotAgent(
+        llm_chain=llm_chain,
+        tools=TOOLS,
+        verbose=VERBOSE
+    )
+    return AgentExecutor.from_agent_and_tools(
+        agent=agent_instance,
+        tools=TOOLS,
+        verbose=VERBOSE,
+        max_iterations=1,  # Limit to one iteration
+        # Réponse lue dans les étapes (outil appelé, observation) plutôt que dans le texte final
+        return_intermediate_steps=True,
+        # Texte du LLM hors format : gardé dans une étape "_Exception" pour parse_agent_result
+        handle_parsing_errors=True
     )
 
+def get_agent_executor(temperature: float = DEFAULT_TEMPERATURE) -> AgentExecutor:
+    """
+    Retourne l'AgentExecutor associé à une température, construit au premier appel puis réutilisé.
+    """
+    return _build_agent_executor(round(temperature, 2))
+
 @app.post("/feedback")
 async def feedback(feedback: FeedbackInput):
+    if feedback.rating not in (0, 1):
+        raise HTTPException(status_code=400, detail="rating doit valoir 1 (👍) ou 0 (👎).")
     try:
-        print(f"📊 Feedback reçu : {feedback.dict()}")
-        return {"message": "Feedback enregistré avec succès."}
-    except Exception as e:
-        print(f"❌ Erreur de feedback: {str(e)}")
+        accepted = get_feedback_sink().submit(feedback.dict())
+    except Exception:
+        ERRORS.labels("/feedback").inc()
+        logger.exception("erreur de feedback")
         raise HTTPException(status_code=500, detail="Erreur lors de l'enregistrement du feedback")
+    if not accepted:
+        # File pleine : le stockage ne suit pas, le client peut renvoyer l'avis plus tard
+        raise HTTPException(
+            status_code=503, detail="Feedback temporairement indisponible, réessayez plus tard.",
+            headers={"Retry-After": str(max(1, int(FEEDBACK_FLUSH_INTERVAL)))}
+        )
+    logger.info("feedback reçu", extra={"rating": feedback.rating, "focus_area": feedback.focus_area})
+    return {"message": "Feedback enregistré avec succès."}
+
+@app.get("/feedback/stats")
+async def feedback_stats():
+    """
+    Taux d'approbation par focus_area et par source (avis déjà écrits), et état de la file d'écriture.
+    """
+    feedback_sink = get_feedback_sink()
+    return {"approval": await asyncio.to_thread(feedback_sink.store.aggregate), "sink": feedback_sink.stats()}
+
+@app.middleware("http")
+async def trace_requests(request: Request, call_next):
+    """
+    Identifiant de trace par requête (X-Request-ID du client ou généré), renvoyé dans X-Trace-ID,
+    et durée de la requête dans astramed_request_seconds.
+    """
+    trace_id = new_trace_id(request.headers.get("X-Request-ID"))
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+    finally:
+        REQUEST_SECONDS.labels(request.url.path, str(status)).observe(time.perf_counter() - started)
+    response.headers["X-Trace-ID"] = trace_id
+    return response
+
+@app.get("/metrics")
+async def metrics():
+    return Response(render_metrics(), media_type=CONTENT_TYPE_LATEST)
 
 @app.get("/")
 async def root():
     return {"status": "AstraMed API is running"}
 
-@app.post("/answer")
-async def answer(user_input: UserInput):
-    try:
-        # Define tools
-        tool_search = Tool(
-            name="search_medical_docs",
-            func=lambda q: search_medical_docs(q, user_input.similarity_threshold)[0],
-            description="Recherche dans la base de documents médicaux. À utiliser uniquement pour les questions médicales spécifiques (symptômes, diagnostics, traitements)."
-        )
-        tool_general = Tool(
-            name="general_response",
-            func=general_response,
-            description="Répond aux questions générales ou salutations en utilisant le prompt système."
-        )
+@app.get("/cache/stats")
+async def cache_stats():
+    stats = {}
+    embedding = get_embedding()
+    response_cache = get_response_cache()
+    if isinstance(embedding, CachedEmbeddings):
+        stats["embeddings"] = embedding.stats()
+    if response_cache is not None:
+        stats["responses"] = response_cache.stats()
+    stats["general_replies"] = general_reply_cache.stats()
+    query_normalizer = get_query_normalizer()
+    if query_normalizer is not None:
+        stats["translations"] = query_normalizer.stats()
+    reranker = get_reranker()
+    if reranker is not None:
+        stats["rerank"] = reranker.stats()
+    return stats
 
-        # Language model with adjustable temperature
-        llm = get_llm(temperature=user_input.temperature)
+@app.get("/db/stats")
+async def db_stats():
+    """
+    Occupation du pool de connexions à la base et résultat du préchauffage.
+    """
+    engine = get_engine()
+    if engine is None:
+        return {"enabled": False}
+    return {"enabled": True, **get_pool_stats(engine)}
 
-        # Updated agent prompt with clear format and examples
-        agent_prompt = """
-Tu es AstraMed, un assistant médical spécialisé. L'entrée fournie est de la forme :
-[question]
-Langue de réponse : [language]
+@app.get("/router/stats")
+async def router_stats():
+    """
+    Décisions du pré-routeur (route et raison), histogramme des confiances et appels LLM économisés.
+    """
+    query_router = get_query_router()
+    if query_router is None:
+        return {"enabled": False}
+    return {"enabled": True, "min_confidence": query_router.min_confidence, **query_router.stats.stats()}
 
-Suis ces étapes strictement :
-1. Analyse uniquement la partie [question] pour déterminer si elle est :
-   - Médicale : Symptômes, maladies, traitements (ex: 'mal de tête', 'diabète')
-   - Générale : Salutations, questions personnelles, remerciements (ex: 'bonjour', 'merci')
-2. Si la question est GÉNÉRALE :
-   - Utilise l'outil general_response avec [question] uniquement.
-   - Réponds dans la langue spécifiée par [language].
-   - Formate ta réponse finale comme suit : "Final Answer: [TYPE: general] [réponse]"
-3. Si la question est MÉDICALE :
-   - Utilise l'outil search_medical_docs avec [question] uniquement.
-   - Intègre les sources dans ta réponse avec la mention "[Source]".
-   - Ajoute à la fin : "Consultez un professionnel de santé."
-   - Réponds dans la langue spécifiée par [language].
-   - Formate ta réponse finale comme suit : "Final Answer: [TYPE: medical] [réponse]"
+@app.get("/sessions/stats")
+async def session_stats():
+    """
+    Sessions en mémoire, relances réécrites et recherches réutilisées.
+    """
+    session_store = get_session_store()
+    if session_store is None:
+        return {"enabled": False}
+    return {"enabled": True, **session_store.stats()}
 
-Exemples de réponses attendues :
-- Pour "bonjour" :
-  Thought: La question est une salutation, donc de type GÉNÉRALE.
-  Action: general_response
-  Action Input: bonjour
-  Observation: Bonjour ! Je suis AstraMed, votre assistant virtuel d'information médicale. Comment puis-je vous aider aujourd'hui ? ...
-  Final Answer: [TYPE: general] Bonjour ! Je suis AstraMed, votre assistant virtuel d'information médicale. Comment puis-je vous aider aujourd'hui ? N'oubliez pas que je ne peux pas donner d'avis médical.
-- Pour "quels sont les symptômes du diabète" :
-  Thought: La question concerne une maladie, donc de type MÉDICALE.
-  Action: search_medical_docs
-  Action Input: quels sont les symptômes du diabète
-  Observation: Les symptômes du diabète incluent ...
-  Final Answer: [TYPE: medical] Les symptômes du diabète incluent ... [Source]. Consultez un professionnel de santé.
+@app.delete("/sessions/{session_id}")
+async def clear_session(session_id: str):
+    """
+    Oublie l'historique d'une session (mémoire et fichier SQLite).
+    """
+    session_store = get_session_store()
+    removed = await asyncio.to_thread(session_store.clear, session_id) if session_store is not None else False
+    return {"message": "Session supprimée." if removed else "Session inconnue.", "removed": removed}
 
-Entrée complète : {input}
-{agent_scratchpad}
-"""
+@app.delete("/cache/responses")
+async def invalidate_response_cache():
+    """
+    À appeler après une ré-ingestion de la table : les réponses en cache citent d'anciennes sources.
+    """
+    response_cache = get_response_cache()
+    removed = await asyncio.to_thread(response_cache.invalidate) if response_cache is not None else 0
+    return {"message": "Cache des réponses vidé.", "removed": removed}
 
-        # Configure prompt and LLM chain
-        prompt_template = PromptTemplate(
-            input_variables=["input", "agent_scratchpad"],
-            template=agent_prompt
-        )
-        llm_chain = LLMChain(llm=llm, prompt=prompt_template)
+async def run_answer(
+    user_input: UserInput,
+    events: asyncio.Queue | None = None,
+    question_vector: List[float] | None = None,
+    retrieval: tuple[str, List[dict]] | None = None
+) -> dict:
+    """
+    Exécute l'agent pour une question et construit la réponse {type, generated_response, answers}.
 
-        # Initialize agent with iteration limit
-        agent_instance = ZeroShotAgent(
-            llm_chain=llm_chain,
-            tools=[tool_search, tool_general],
-            verbose=True
-        )
-        agent_executor = AgentExecutor.from_agent_and_tools(
-            agent=agent_instance,
-            tools=[tool_search, tool_general],
-            verbose=True,
-            max_iterations=1  # Limit to one iteration
+    `question_vector` et `retrieval` (résultat de format_medical_docs) évitent de refaire l'embedding
+    et la recherche quand ils ont déjà été calculés, par exemple pour tout un lot dans /answer/batch.
+
+    Avec un session_id, une relance ("and the treatment?") est complétée par le sujet du tour précédent
+    avant l'embedding, et la recherche précédente est reprise si la question porte toujours sur le même sujet.
+    """
+    session_store = get_session_store() if user_input.session_id else None
+    question = user_input.question
+    session = None
+    if session_store is not None:
+        # Une seule lecture de la session par requête, hors de la boucle (SQLite), pour la relance et la recherche reprise
+        session = await asyncio.to_thread(session_store.get, user_input.session_id, time.time())
+        previous = session_store.last_turn(session)
+        question = rewrite_follow_up(question, previous, get_topic_terms(), SESSION_FOLLOW_UP_MAX_WORDS)
+        if question != user_input.question:
+            session_store.record_rewrite()
+            logger.info("relance réécrite", extra={"query": question})
+
+    # Paramètres propres à la requête, lus par les outils de l'agent
+    ctx = RequestContext(
+        similarity_threshold=user_input.similarity_threshold,
+        language=user_input.language,
+        events=events
+    )
+    if retrieval is not None:
+        ctx.retrievals[question.strip()] = retrieval
+    request_context.set(ctx)
+
+    embedding = get_embedding()
+    response_cache = get_response_cache()
+    query_router = get_query_router()
+
+    if question_vector is None and (response_cache is not None or session_store is not None):
+        with stage("embedding"):
+            question_vector = await embedding.aembed_query(question)
+    if question_vector is not None:
+        ctx.query_vectors[question.strip()] = question_vector
+    if session_store is not None and retrieval is None:
+        retrieval = session_store.reusable_retrieval(
+            session, question_vector, user_input.similarity_threshold, SESSION_REUSE_MIN_SIMILARITY
         )
+        if retrieval is not None:
+            ctx.retrievals[question.strip()] = retrieval
+
+    # Réponse déjà générée pour une question quasi identique : pas d'appel au LLM
+    partition = SemanticResponseCache.partition(
+        user_input.language, user_input.temperature, user_input.similarity_threshold
+    )
+    if response_cache is not None:
+        # Tier SQLite partagé (RESPONSE_CACHE_PATH) : lectures et écritures hors de la boucle
+        cached = await asyncio.to_thread(response_cache.lookup, question_vector, partition, time.time())
+        CACHE_EVENTS.labels("response", "miss" if cached is None else "hit").inc()
+        if cached is not None:
+            payload, similarity, age = cached
+            if payload["answers"]:
+                emit_event("sources", {"answers": payload["answers"]})
+            emit_event("token", {"text": payload["generated_response"]})
+            if session_store is not None:
+                await remember_turn(session_store, user_input, question, payload, question_vector)
+            return {
+                **payload,
+                "cache": {"hit": True, "similarity": round(similarity, 4), "age_seconds": round(age, 1)}
+            }
+
+    try:
+        # Traduction de la requête de recherche pendant le routage (le routeur et les caches gardent la question d'origine)
+        if retrieval is None and general_intent(question) is None:
+            start_retrieval_query(question)
+
+        # Entrées évidentes (salutations, vocabulaire médical) : l'outil est appelé directement, sans l'agent
+        route = "agent"
+        if query_router is not None:
+            def embed_question(text: str) -> List[float]:
+                # Embedding fait au plus une fois, repris ensuite par la recherche
+                if text.strip() not in ctx.query_vectors:
+                    ctx.query_vectors[text.strip()] = embedding.embed_query(text)
+                return ctx.query_vectors[text.strip()]
+            with stage("routing"):
+                decision = await asyncio.to_thread(query_router.route, question, embed_question)
+            route = decision.route
+            logger.info("route", extra={"route": decision.route, "reason": decision.reason, "confidence": round(decision.confidence, 3)})
 
-        # Format user input
-        user_query = f"{user_input.question}\nLangue de réponse : {user_input.language}"
+        if route == "general":
+            response_type = "general"
+            TOOL_CHOICES.labels("general_response", "router").inc()
+            # Pas de recherche : traduction inutile
+            cancel_retrieval_queries(ctx)
+            async with request_semaphore:
+                generated_response = await ageneral_response(question)
+        elif route == "medical":
+            # Même réponse que l'agent : l'observation de search_medical_docs
+            response_type = "medical"
+            TOOL_CHOICES.labels("search_medical_docs", "router").inc()
+            top_docs_str, _ = await asearch_request_docs(question)
+            generated_response = with_medical_advice(top_docs_str)
+        else:
+            agent_executor = get_agent_executor(user_input.temperature)
 
-        # Run the agent
-        agent_output = agent_executor.run(user_query)
-        print(f"[DEBUG] Agent output raw: {agent_output}")
+            # Format user input
+            user_query = f"{question}\nLangue de réponse : {user_input.language}"
 
-        # Parse the agent's response
-        parsed_response = parse_agent_output(agent_output)
-        response_type = parsed_response["type"]
-        generated_response = parsed_response["generated_response"]
+            # Run the agent without blocking the event loop, within the concurrency limit
+            async with request_semaphore:
+                with stage("agent"):
+                    agent_result = await agent_executor.ainvoke({"input": user_query})
+            if logger.isEnabledFor(logging.DEBUG):
+                # Même format que agent_output_testset.jsonl : les logs servent de transcriptions enregistrées
+                logger.debug("sortie brute de l'agent", extra={"agent_result": agent_result_record(agent_result)})
 
-        # Retrieve relevant documents for medical responses
+            # Parse the agent's response
+            with stage("parsing"):
+                parsed_response = parse_agent_result(agent_result)
+            AGENT_OUTPUT_PARSES.labels(parsed_response["parsed_by"]).inc()
+            response_type = parsed_response["type"]
+            generated_response = parsed_response["generated_response"]
+            TOOL_CHOICES.labels(
+                {"general": "general_response", "medical": "search_medical_docs"}.get(response_type, "none"), "agent"
+            ).inc()
+
+        # Reuse the documents the agent tool already retrieved for medical responses
         if response_type == "medical":
-            _, relevant_docs = search_medical_docs(user_input.question, user_input.similarity_threshold)
+            relevant_docs = last_request_docs()
+            if relevant_docs is None:
+                _, relevant_docs = await asearch_request_docs(question)
         else:
             relevant_docs = []
 
-        print(f"[AstraMed] Réponse finale: {response_type} - {generated_response}")
-        print(f"[DEBUG] Réponse JSON : {{'type': '{response_type}', 'generated_response': '{generated_response}', 'answers': {relevant_docs}}}")
+        logger.info("réponse finale", extra={"type": response_type, "route": route, "sources": len(relevant_docs)})
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("réponse JSON", extra={"generated_response": generated_response, "answers": relevant_docs})
 
-        # Return the final response
-        return {
+        payload = {
             "type": response_type,
             "generated_response": generated_response,
             "answers": relevant_docs if response_type == "medical" else []
         }
+        if response_cache is not None and response_type != "unknown":
+            await asyncio.to_thread(response_cache.store, question_vector, partition, payload, time.time())
+        if session_store is not None:
+            last_retrieval = list(ctx.retrievals.values())[-1] if response_type == "medical" and ctx.retrievals else None
+            await remember_turn(session_store, user_input, question, payload, question_vector, last_retrieval)
+
+        # Return the final response
+        return {**payload, "cache": {"hit": False}}
+    finally:
+        # Aucune traduction ne survit à la requête, même quand elle échoue ou est annulée
+        cancel_retrieval_queries(ctx)
+
+async def remember_turn(
+    session_store: SessionStore,
+    user_input: UserInput,
+    question: str,
+    payload: dict,
+    question_vector: List[float] | None = None,
+    retrieval: tuple | None = None
+) -> None:
+    top_metadata = payload["answers"][0]["metadata"] if payload["answers"] else {}
+    turn = SessionTurn(
+        question=user_input.question,
+        query=question,
+        response_type=payload["type"],
+        topic=top_metadata.get("focus_area", ""),
+        doc_ids=[answer["metadata"].get("id") for answer in payload["answers"] if answer["metadata"].get("id")],
+        created_at=time.time()
+    )
+    # Écriture SQLite éventuelle hors de la boucle d'événements
+    await asyncio.to_thread(
+        session_store.append, user_input.session_id, turn, question_vector, retrieval, user_input.similarity_threshold
+    )
+
+def format_sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/answer")
+async def answer(user_input: UserInput):
+    try:
+        return await run_answer(user_input)
     except Exception as e:
-        print(f"❌ Erreur détaillée: {str(e)}")
+        ERRORS.labels("/answer").inc()
+        logger.exception("erreur lors du traitement")
         raise HTTPException(status_code=500, detail=f"Erreur lors du traitement : {str(e)}")
 
+async def aembed_questions(questions: List[str]) -> List[List[float]]:
+    # Un seul appel au service d'embeddings pour tout le lot (hors questions déjà en cache)
+    embedding = get_embedding()
+    with stage("embedding"):
+        if isinstance(embedding, CachedEmbeddings):
+            return await asyncio.to_thread(embedding.embed_queries, questions)
+        return await asyncio.to_thread(embed_queries_batch, embedding, questions)
+
+@app.post("/answer/batch")
+async def answer_batch(batch_input: BatchInput):
+    """
+    Plusieurs questions en un appel : un seul lot d'embeddings, recherches lancées ensemble, questions
+    identiques traitées une fois, et au plus BATCH_CONCURRENCY agents en parallèle.
+    Les résultats suivent l'ordre d'entrée ; une question en erreur n'échoue pas tout le lot.
+    """
+    if len(batch_input.questions) > BATCH_MAX_QUESTIONS:
+        raise HTTPException(status_code=400, detail=f"Un lot contient au plus {BATCH_MAX_QUESTIONS} questions.")
+    questions = list(dict.fromkeys(question.strip() for question in batch_input.questions))
+
+    # Embeddings et recherches en amont ; en cas d'échec chaque question refait les siens dans run_answer
+    vectors = [None] * len(questions)
+    retrievals = [None] * len(questions)
+    try:
+        queries, vectors = await asyncio.gather(
+            asyncio.gather(*(anormalize_query(question) for question in questions)), aembed_questions(questions)
+        )
+        # Vecteurs de recherche : ceux des traductions anglaises, les vecteurs des questions servant aux caches
+        search_vectors = vectors if queries == questions else await aembed_questions(queries)
+        searches = await asyncio.gather(*(
+            aretrieve_documents(query, vector, batch_input.similarity_threshold)
+            for query, vector in zip(queries, search_vectors)
+        ), return_exceptions=True)
+        retrievals = [None if isinstance(docs, BaseException) else format_medical_docs(docs) for docs in searches]
+    except Exception:
+        logger.exception("embeddings du lot impossibles, traitement question par question")
+
+    batch_semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def answer_one(question: str, vector: List[float] | None, retrieval: tuple | None) -> dict:
+        item_input = UserInput(
+            question=question,
+            temperature=batch_input.temperature,
+            language=batch_input.language,
+            similarity_threshold=batch_input.similarity_threshold
+            # Pas de session_id : les questions d'un lot sont indépendantes, sans relance à compléter
+        )
+        async with batch_semaphore:
+            return await run_answer(item_input, question_vector=vector, retrieval=retrieval)
+
+    results = await asyncio.gather(
+        *(answer_one(*item) for item in zip(questions, vectors, retrievals)), return_exceptions=True
+    )
+    by_question = {}
+    for question, result in zip(questions, results):
+        if isinstance(result, BaseException):
+            ERRORS.labels("/answer/batch").inc()
+            logger.error("erreur lors du traitement", extra={"question": question}, exc_info=result)
+            by_question[question] = {"error": f"Erreur lors du traitement : {str(result)}"}
+        else:
+            by_question[question] = result
+    return {"results": [{"question": question, **by_question[question.strip()]} for question in batch_input.questions]}
+
+@app.post("/answer/stream")
+async def answer_stream(user_input: UserInput):
+    """
+    Server-sent events : `sources` dès la recherche terminée, puis `token` au fil de la génération,
+    et enfin `final` avec la même enveloppe que /answer (ou `error`).
+    """
+    events: asyncio.Queue = asyncio.Queue()
+
+    async def produce():
+        try:
+            result = await run_answer(user_input, events=events)
+            events.put_nowait(("final", result))
+        except Exception as e:
+            ERRORS.labels("/answer/stream").inc()
+            logger.exception("erreur lors du traitement")
+            events.put_nowait(("error", {"detail": f"Erreur lors du traitement : {str(e)}"}))
+        finally:
+            events.put_nowait(None)
+
+    async def event_stream():
+        # Premier octet envoyé immédiatement, avant même le démarrage de l'agent
+        yield ": AstraMed\n\n"
+        task = asyncio.create_task(produce())
+        try:
+            while (item := await events.get()) is not None:
+                yield format_sse(*item)
+        finally:
+            # Client déconnecté : inutile de poursuivre la génération
+            if not task.done():
+                task.cancel()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 if __name__ == "__main__":
     uvicorn.run(app, host="127.0.0.1", port=8181)
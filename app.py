@@ -40,6 +40,33 @@ def load_lottie_file(filepath: str):
 
 lottie_animation = load_lottie_file("Animation - 18.json")
 
+# --- Lecture du flux SSE de /answer/stream ---
+def stream_answer(payload: dict):
+    """
+    Envoie la question à /answer/stream et renvoie les événements (nom, données) au fil de l'eau.
+    """
+    # Pas de délai global : seul le silence prolongé du serveur déclenche un timeout
+    with requests.post(f"{HOST}/answer/stream", json=payload, stream=True, timeout=(10, 120)) as response:
+        if response.status_code != 200:
+            yield "error", {"detail": f"{response.status_code} - {response.text}"}
+            return
+        response.encoding = "utf-8"
+        event = "message"
+        for line in response.iter_lines(decode_unicode=True):
+            if line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                yield event, json.loads(line[len("data:"):].strip())
+
+def render_sources(similar_answers: list):
+    st.markdown("### 📚 Sources les plus pertinentes :")
+    for i, ans_data in enumerate(similar_answers):
+        source = ans_data.get("metadata", {}).get("source", "Inconnue")
+        score = ans_data.get("metadata", {}).get("similarity_score", "N/A")
+        resp_text = ans_data.get("message", "Réponse non disponible.")
+        with st.expander(f"🏥 Source {i+1}: {source} (Similarité: {score})"):
+            st.markdown(f"🔹 Réponse {i+1} : {resp_text}")
+
 # --- Gestion de la navigation ---
 if 'page' not in st.session_state:
     st.session_state.page = 'home'
@@ -91,47 +118,72 @@ elif st.session_state.page == 'chat':
         st.session_state["messages"].append({"role": "user", "content": question})
         st.chat_message("user", avatar="👤").write(question)
        
+        sources_rendered = False
+        answer_placeholder = None
+        streamed_text = ""
+        response_data = None
+        error_message = "Réponse incomplète du serveur."
+
         with st.spinner("🏥 Recherche des sources les plus pertinentes..."):
-            response = requests.post(
-                f"{HOST}/answer",
-                json={
+            try:
+                for event, data in stream_answer({
                     "question": question,
                     "temperature": temperature,
                     "similarity_threshold": similarity_threshold,
                     "language": language,
                     "session_id": "test-session"
-                },
-                timeout=30
-            )
-           
-            if response.status_code == 200:
-                response_data = response.json()
-                print(f"[DEBUG Streamlit] Réponse reçue : {response_data}")  # Log ajouté
+                }):
+                    if event == "sources" and data.get("answers") and not sources_rendered:
+                        # Les sources arrivent avant la réponse : on les affiche immédiatement
+                        render_sources(data["answers"][:3])
+                        sources_rendered = True
+                    elif event == "token":
+                        if answer_placeholder is None:
+                            st.markdown("### 🩺 Réponse :")
+                            answer_placeholder = st.chat_message("assistant", avatar="🏥").empty()
+                        streamed_text += data.get("text", "")
+                        answer_placeholder.markdown(streamed_text + "▌")
+                    elif event == "final":
+                        response_data = data
+                    elif event == "error":
+                        error_message = data.get("detail", error_message)
+            except requests.RequestException as e:
+                error_message = str(e)
+
+            if response_data is not None:
+                print(f"[DEBUG Streamlit] Réponse reçue : {response_data}")  # Log ajouté
                 response_type = response_data.get("type", "unknown")
                 generated_response = response_data.get("generated_response", "Erreur lors de la reformulation.")
                 similar_answers = response_data.get("answers", [])[:3]
 
                 if response_type == "medical" and not similar_answers:
-                    st.error("❌ Aucune source pertinente trouvée.")
+                    if answer_placeholder is not None:
+                        answer_placeholder.empty()
+                    st.error("❌ Aucune source pertinente trouvée.")
                 else:
-                    if response_type == "medical":
-                        st.markdown("### 📚 Sources les plus pertinentes :")
-                        for i, ans_data in enumerate(similar_answers):
-                            source = ans_data.get("metadata", {}).get("source", "Inconnue")
-                            score = ans_data.get("metadata", {}).get("similarity_score", "N/A")
-                            resp_text = ans_data.get("message", "Réponse non disponible.")
-                            with st.expander(f"🏥 Source {i+1}: {source} (Similarité: {score})"):
-                                st.markdown(f"🔹 Réponse {i+1} : {resp_text}")
-
-                    st.markdown("### 🩺 Réponse :")
-                    st.chat_message("assistant", avatar="🏥").write(generated_response)
+                    if response_type == "medical" and not sources_rendered:
+                        render_sources(similar_answers)
+
+                    # La réponse finale remplace le texte reçu au fil de l'eau
+                    if answer_placeholder is None:
+                        st.markdown("### 🩺 Réponse :")
+                        answer_placeholder = st.chat_message("assistant", avatar="🏥").empty()
+                    answer_placeholder.markdown(generated_response)
                     
                     st.session_state["messages"].append({
                         "role": "assistant",
                         "content": generated_response
                     })
                     
+
                     st.markdown("### 📝 Votre avis compte !")
+                    # Domaine et source de la réponse notée, pour le taux d'approbation par focus_area (/feedback/stats)
+                    top_metadata = similar_answers[0].get("metadata", {}) if similar_answers else {}
+                    feedback_context = {
+                        "focus_area": top_metadata.get("focus_area", ""),
+                        "source": top_metadata.get("source", ""),
+                        "response_type": response_type
+                    }
                     col1, col2 = st.columns(2)
                     with col1:
                         if st.button("👍 Bonne réponse"):
@@ -139,7 +191,8 @@ elif st.session_state.page == 'chat':
                                 "session_id": "test-session",
                                 "question": question,
                                 "rating": 1,
-                                "comments": ""
+                                "comments": "",
+                                **feedback_context
                             }
                             fb_response = requests.post(f"{HOST}/feedback", json=feedback_data)
                             if fb_response.status_code == 200:
@@ -153,11 +206,12 @@ elif st.session_state.page == 'chat':
                                     "session_id": "test-session",
                                     "question": question,
                                     "rating": 0,
-                                    "comments": comments
+                                    "comments": comments,
+                                    **feedback_context
                                 }
                                 fb_response = requests.post(f"{HOST}/feedback", json=feedback_data)
                                 if fb_response.status_code == 200:
                                     st.success("✅ Feedback enregistré, merci !")
 
             else:
-                st.error(f"❌ Erreur : {response.status_code} - {response.text}")
+                st.error(f"❌ Erreur : {error_message}")
@@ -0,0 +1,6 @@
+"""
+Benchmarks de charge de l'API avec des remplaçants locaux (embeddings, vector store et LLM simulés).
+
+    python -m benchmarks.loadtest --rps 20 --duration 30                # rejoue benchmarks/requests.jsonl
+    python -m benchmarks.loadtest --check-baseline benchmarks/baseline.json
+"""
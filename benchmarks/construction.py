@@ -0,0 +1,103 @@
+import argparse
+import json
+import os
+import sys
+import time
+from datetime import datetime
+from typing import Callable, List
+
+import numpy as np
+
+from benchmarks.loadtest import PERCENTILES
+
+
+# 🔹 Construction par requête, comme avant le pool : client Gemini, outils, prompt, LLMChain et agent à chaque /answer
+def build_per_request(api, temperature: float):
+    from langchain.agents import Tool, ZeroShotAgent, AgentExecutor
+    from langchain.chains import LLMChain
+    from langchain.prompts import PromptTemplate
+    from langchain_google_genai import ChatGoogleGenerativeAI
+
+    tools = [
+        Tool(name="search_medical_docs", func=api.search_medical_docs_tool, description=api.TOOLS[0].description),
+        Tool(name="general_response", func=api.general_response, description=api.TOOLS[1].description),
+    ]
+    llm = ChatGoogleGenerativeAI(model=api.LLM_MODEL, google_api_key=api.API_KEY, temperature=temperature)
+    prompt = PromptTemplate(input_variables=["input", "agent_scratchpad"], template=api.AGENT_PROMPT)
+    agent = ZeroShotAgent(llm_chain=LLMChain(llm=llm, prompt=prompt), tools=tools)
+    return AgentExecutor.from_agent_and_tools(agent=agent, tools=tools, max_iterations=1, handle_parsing_errors=True)
+
+
+def time_calls(build: Callable[[float], object], temperatures: List[float]) -> List[float]:
+    latencies = []
+    for temperature in temperatures:
+        started = time.perf_counter()
+        build(temperature)
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+def latency_row(mode: str, latencies: List[float]) -> dict:
+    return {
+        "mode": mode,
+        "calls": len(latencies),
+        "mean_ms": round(float(np.mean(latencies)), 4),
+        **{f"p{p}_ms": round(float(np.percentile(latencies, p)), 4) for p in PERCENTILES},
+    }
+
+
+def run(iterations: int, temperatures: List[float]) -> List[dict]:
+    """
+    Temps de construction de l'agent de /answer : par requête (code d'origine), puis via le pool par
+    température d'api.py, à froid (premier appel de chaque température) et à chaud (appels suivants).
+    Aucun appel réseau : seuls les objets sont construits.
+    """
+    import api
+
+    # Clé factice : les clients Gemini sont construits mais jamais appelés
+    api.API_KEY = api.API_KEY or "bench-key"
+    sequence = [temperatures[i % len(temperatures)] for i in range(iterations)]
+    # Un premier appel hors mesure : imports paresseux de langchain_google_genai
+    build_per_request(api, sequence[0])
+
+    rows = [latency_row("par requête", time_calls(lambda t: build_per_request(api, t), sequence))]
+    api._pooled_llm.cache_clear()
+    api._build_agent_executor.cache_clear()
+    rows.append(latency_row("pool, à froid", time_calls(api.get_agent_executor, temperatures)))
+    rows.append(latency_row("pool, à chaud", time_calls(api.get_agent_executor, sequence)))
+    return rows
+
+
+def print_report(rows: List[dict]) -> None:
+    baseline = rows[0]["mean_ms"]
+    print(f"\n{'mode':<15} {'appels':>6} {'moy. ms':>9} " + " ".join(f"{f'p{p} ms':>9}" for p in PERCENTILES) + f" {'gain':>9}")
+    for row in rows:
+        speedup = baseline / row["mean_ms"] if row["mean_ms"] else float("inf")
+        print(f"{row['mode']:<15} {row['calls']:>6} {row['mean_ms']:>9} "
+              + " ".join(f"{row[f'p{p}_ms']:>9}" for p in PERCENTILES) + f" {speedup:>8.0f}x")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Construction de l'agent de /answer : par requête vs pool par température.")
+    parser.add_argument("--iterations", type=int, default=200, help="Constructions mesurées par mode")
+    parser.add_argument("--temperatures", type=float, nargs="+", default=[0.0, 0.3, 0.7],
+                        help="Températures demandées à tour de rôle, comme des requêtes de réglages différents")
+    parser.add_argument("--output", default="", help="Fichier JSON du rapport")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    rows = run(args.iterations, args.temperatures)
+    print_report(rows)
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"run_at": datetime.now().isoformat(timespec="seconds"), "settings": vars(args), "runs": rows},
+                      f, ensure_ascii=False, indent=2)
+        print(f"💾 Rapport écrit dans {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,240 @@
+import asyncio
+import csv
+import os
+import random
+import tempfile
+import time
+import zlib
+from typing import Any, AsyncIterator, Callable, Iterator, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from cache import CachedEmbeddings, lazy_singleton, normalize_text
+from lexical import BM25Index, bm25_tokens, build_index_from_csv
+from router import general_intent
+
+# 🔹 Corpus au format MedQuAD (question, answer, source, focus_area)
+FOCUS_AREAS = [
+    "Glaucoma", "Diabetes", "Asthma", "High Blood Pressure", "Migraine", "Osteoporosis", "Alzheimer's Disease",
+    "Parkinson's Disease", "Breast Cancer", "Prostate Cancer", "Stroke", "Heart Failure", "Arthritis", "Psoriasis",
+    "Anemia", "Hepatitis B", "Tuberculosis", "Influenza", "Kidney Disease", "Cataract", "Epilepsy", "Obesity",
+    "Celiac Disease", "Lupus", "Gout", "Shingles", "Sickle Cell Disease", "Cystic Fibrosis", "Hypothyroidism", "Malaria",
+]
+QUESTION_TEMPLATES = [
+    "What is (are) {area} ?", "What are the symptoms of {area} ?", "What are the treatments for {area} ?",
+    "How to prevent {area} ?", "What causes {area} ?", "Is {area} inherited ?", "How to diagnose {area} ?",
+    "What is the outlook for {area} ?",
+]
+SOURCES = ["NIHSeniorHealth", "GARD", "MPlusHealthTopics", "NHLBI", "CDC", "NIDDK"]
+FILLER_WORDS = (
+    "patients doctors treatment symptoms risk blood cells body disease condition medicine therapy common "
+    "chronic people years health care early signs tests may can often some most affect cause help"
+).split()
+
+
+def write_synthetic_corpus(path: str, rows_per_template: int = 1, seed: int = 0) -> str:
+    """
+    CSV déterministe au format MedQuAD : chaque domaine × chaque type de question, réponses de 40 à 300 mots.
+    """
+    rng = random.Random(seed)
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.writer(f)
+        writer.writerow(["question", "answer", "source", "focus_area"])
+        for area in FOCUS_AREAS:
+            for template in QUESTION_TEMPLATES:
+                for _ in range(rows_per_template):
+                    words = [rng.choice(FILLER_WORDS) for _ in range(rng.randint(40, 300))]
+                    answer = f"{area} : " + " ".join(words) + "."
+                    writer.writerow([template.format(area=area), answer, rng.choice(SOURCES), area])
+    return path
+
+
+# 🔹 Embeddings déterministes : hachage des mots, donc des questions proches ont des vecteurs proches
+class HashingEmbeddings(Embeddings):
+    def __init__(self, size: int = 768, latency_ms: float = 0.0):
+        self.size = size
+        self.latency_ms = latency_ms
+
+    def _vector(self, text: str) -> List[float]:
+        vector = np.zeros(self.size, dtype=np.float32)
+        for token in bm25_tokens(text) or [normalize_text(text)]:
+            digest = zlib.crc32(token.encode("utf-8"))
+            vector[digest % self.size] += 1.0 if digest & 1 else -1.0
+        vector /= np.linalg.norm(vector) or 1.0
+        return vector.tolist()
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        time.sleep(self.latency_ms / 1000)
+        return self._vector(text)
+
+    async def aembed_query(self, text: str) -> List[float]:
+        await asyncio.sleep(self.latency_ms / 1000)
+        return self._vector(text)
+
+
+# 🔹 LLM simulé : latence avant le premier token puis débit fixe, en appel simple comme en streaming
+class FakeChatModel(BaseChatModel):
+    first_token_ms: float = 300.0
+    tokens_per_second: float = 50.0
+    reply_tokens: int = 60
+    # Outil choisi par question enregistrée (texte normalisé -> "general_response" ou "search_medical_docs")
+    tool_choices: dict = {}
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-astramed"
+
+    def _choose_tool(self, question: str) -> str:
+        recorded = self.tool_choices.get(normalize_text(question))
+        if recorded is not None:
+            return recorded
+        return "general_response" if general_intent(question) is not None else "search_medical_docs"
+
+    def _reply(self, messages: List[BaseMessage]) -> str:
+        prompt = str(messages[-1].content)
+        if "Entrée complète :" in prompt:
+            # Prompt de l'agent ZeroShotAgent : une action ReAct sur la question
+            question = prompt.split("Entrée complète :")[-1].strip().split("\n")[0].strip()
+            tool = self._choose_tool(question)
+            return f"Thought: question à traiter par {tool}.\nAction: {tool}\nAction Input: {question}"
+        return " ".join(["Réponse"] + [FILLER_WORDS[i % len(FILLER_WORDS)] for i in range(self.reply_tokens - 1)])
+
+    def _tokens(self, text: str) -> List[str]:
+        words = text.split(" ")
+        return [word + " " for word in words[:-1]] + words[-1:]
+
+    def _duration(self, tokens: int) -> float:
+        return self.first_token_ms / 1000 + tokens / self.tokens_per_second
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        text = self._reply(messages)
+        time.sleep(self._duration(len(self._tokens(text))))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        text = self._reply(messages)
+        await asyncio.sleep(self._duration(len(self._tokens(text))))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.first_token_ms / 1000)
+        for token in self._tokens(self._reply(messages)):
+            time.sleep(1 / self.tokens_per_second)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.first_token_ms / 1000)
+        for token in self._tokens(self._reply(messages)):
+            await asyncio.sleep(1 / self.tokens_per_second)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+
+# 🔹 Branchement sur api.py (avant le lifespan : warm_up construit alors les remplaçants)
+def install_fakes(
+    api,
+    csv_path: str = "",
+    workdir: Optional[str] = None,
+    embedding_latency_ms: float = 20.0,
+    first_token_ms: float = 300.0,
+    tokens_per_second: float = 50.0,
+    tool_choices: Optional[dict] = None,
+    hybrid: bool = True,
+    response_cache: bool = False,
+    corpus_rows_per_template: int = 1,
+    patch: Callable = setattr,
+) -> dict:
+    """
+    Remplace Cloud SQL, Vertex AI et Gemini dans `api` : vector store local construit depuis `csv_path`
+    (ou un corpus synthétique), embeddings par hachage derrière le même CachedEmbeddings qu'en production,
+    et FakeChatModel pour l'agent comme pour les réponses générales. Sans `response_cache`, chaque requête
+    rejouée traverse tout le pipeline au lieu de servir la réponse déjà en cache. Retourne les réglages appliqués.
+
+    Les index sont écrits sur disque puis relus en mémoire mappée, comme en production ; le cache
+    d'embeddings (et son tier SQLite éventuel, EMBEDDING_CACHE_PATH) n'est créé qu'au premier usage,
+    donc dans chaque worker après le fork quand gunicorn précharge l'application.
+
+    Chaque attribut de `api` est remplacé par `patch` : monkeypatch.setattr dans les tests, qui restaure tout à la fin.
+    """
+    from config import EMBEDDING_CACHE_PATH, EMBEDDING_CACHE_SIZE
+    from ingest import iter_csv_chunks
+    from local_store import LocalVectorStore
+    from observability import LLMTimingCallback
+    from translation import GlossaryTranslator, QueryNormalizer
+
+    workdir = workdir or tempfile.mkdtemp(prefix="astramed_bench_")
+    if not csv_path:
+        csv_path = write_synthetic_corpus(os.path.join(workdir, "corpus.csv"), corpus_rows_per_template)
+    rows = [row for chunk, _ in iter_csv_chunks(csv_path, 2000) for row in chunk]
+
+    hashing = HashingEmbeddings(latency_ms=embedding_latency_ms)
+    store = LocalVectorStore(hashing, os.path.join(workdir, "vectors"))
+    store.add_texts([text for text, _, _ in rows], [meta for _, meta, _ in rows], [doc_id for _, _, doc_id in rows])
+    store.save()
+    lexical_index = None
+    if hybrid:
+        build_index_from_csv(csv_path).save(os.path.join(workdir, "lexical"))
+        lexical_index = BM25Index.load(os.path.join(workdir, "lexical"))
+
+
+    def fake_llm(temperature: float = 0.0) -> FakeChatModel:
+        return FakeChatModel(
+            first_token_ms=first_token_ms, tokens_per_second=tokens_per_second,
+            tool_choices=tool_choices or {}, callbacks=[LLMTimingCallback()]
+        )
+
+    patch(api, "get_engine", lazy_singleton(lambda: None))
+    patch(api, "get_embedding", lazy_singleton(
+        lambda: CachedEmbeddings(hashing, "bench-hashing", EMBEDDING_CACHE_SIZE, EMBEDDING_CACHE_PATH or None)
+    ))
+    patch(api, "get_store", lazy_singleton(lambda: store))
+    patch(api, "get_lexical_index", lazy_singleton(lambda: lexical_index))
+    # Traduction des questions FR/AR par le glossaire local plutôt que par le LLM simulé
+    patch(api, "get_query_normalizer", lazy_singleton(lambda: QueryNormalizer(GlossaryTranslator())))
+    if not response_cache:
+        patch(api, "get_response_cache", lazy_singleton(lambda: None))
+    patch(api, "_pooled_llm", fake_llm)
+    api._build_agent_executor.cache_clear()
+    patch(api, "get_general_llm", lambda: fake_llm())
+    patch(api, "CORPUS_CSV_PATH", csv_path)
+    patch(api, "FEEDBACK_DB_PATH", os.path.join(workdir, "feedback.sqlite3"))
+    return {
+        "corpus_rows": len(rows),
+        "csv": "synthetic" if csv_path.startswith(workdir) else csv_path,
+        "embedding_latency_ms": embedding_latency_ms,
+        "first_token_ms": first_token_ms,
+        "tokens_per_second": tokens_per_second,
+        "hybrid": hybrid,
+        "response_cache": response_cache,
+        "corpus_rows_per_template": corpus_rows_per_template,
+        "translator": "glossary",
+    }
+
+
+def create_app():
+    """
+    Application avec remplaçants pour un vrai serveur, réglée par variables d'environnement :
+        BENCH_CSV=... BENCH_LLM_FIRST_TOKEN_MS=300 uvicorn benchmarks.fakes:create_app --factory --port 8181
+    """
+    import api
+    from benchmarks.loadtest import load_request_mix, recorded_tool_choices
+
+    mix_path = os.getenv("BENCH_REQUESTS", os.path.join(os.path.dirname(__file__), "requests.jsonl"))
+    install_fakes(
+        api,
+        csv_path=os.getenv("BENCH_CSV", ""),
+        embedding_latency_ms=float(os.getenv("BENCH_EMBEDDING_LATENCY_MS", 20)),
+        first_token_ms=float(os.getenv("BENCH_LLM_FIRST_TOKEN_MS", 300)),
+        tokens_per_second=float(os.getenv("BENCH_LLM_TOKENS_PER_SECOND", 50)),
+        tool_choices=recorded_tool_choices(load_request_mix(mix_path)) if os.path.exists(mix_path) else None,
+        hybrid=os.getenv("BENCH_HYBRID", "1") == "1",
+        response_cache=os.getenv("BENCH_RESPONSE_CACHE", "0") == "1",
+        corpus_rows_per_template=int(os.getenv("BENCH_CORPUS_ROWS_PER_TEMPLATE", 1)),
+    )
+    return api.app
@@ -0,0 +1,304 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime
+from typing import List
+
+import httpx
+import numpy as np
+
+from cache import normalize_text
+
+DEFAULT_REQUESTS_PATH = os.path.join(os.path.dirname(__file__), "requests.jsonl")
+DEFAULT_BASELINE_PATH = os.path.join(os.path.dirname(__file__), "baseline.json")
+PERCENTILES = (50, 90, 95, 99)
+# Métriques comparées à la baseline : latences (plus haut = pire) et débit (plus bas = pire)
+LATENCY_CHECKS = ["p50_ms", "p95_ms", "p99_ms"]
+
+
+# 🔹 Mix de requêtes enregistré : une requête /answer ou /answer/stream par ligne, avec son type et sa langue
+def load_request_mix(path: str = DEFAULT_REQUESTS_PATH) -> List[dict]:
+    with open(path, encoding="utf-8") as f:
+        mix = [json.loads(line) for line in f if line.strip()]
+    if not mix:
+        raise ValueError(f"Aucune requête dans {path}")
+    return mix
+
+
+def recorded_tool_choices(mix: List[dict]) -> dict:
+    """
+    Outil que l'agent a choisi pour chaque question enregistrée, rejoué tel quel par le LLM simulé.
+    """
+    return {
+        normalize_text(request["question"]): "search_medical_docs" if request["kind"] == "medical" else "general_response"
+        for request in mix
+    }
+
+
+def mix_fingerprint(mix: List[dict]) -> str:
+    return hashlib.sha1(json.dumps(mix, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()[:12]
+
+
+# 🔹 Envoi d'une requête : latence mesurée depuis l'instant prévu par le planning (retards du client compris)
+async def send_request(client: httpx.AsyncClient, request: dict, scheduled: float, timeout: float) -> dict:
+    body = {
+        "question": request["question"],
+        "temperature": request.get("temperature", 0.3),
+        "language": request["language"],
+        "similarity_threshold": request.get("similarity_threshold", 0.5),
+        "session_id": request.get("session_id", ""),
+    }
+    endpoint = request.get("endpoint", "/answer")
+    result = {"endpoint": endpoint, "kind": request["kind"], "language": request["language"], "status": None,
+              "error": None, "ttft_ms": None}
+    try:
+        if endpoint == "/answer/stream":
+            async with client.stream("POST", endpoint, json=body, timeout=timeout) as response:
+                result["status"] = response.status_code
+                async for line in response.aiter_lines():
+                    if line.startswith("event: token") and result["ttft_ms"] is None:
+                        result["ttft_ms"] = (time.perf_counter() - scheduled) * 1000
+                    elif line.startswith("event: error"):
+                        result["error"] = "stream error event"
+        else:
+            response = await client.post(endpoint, json=body, timeout=timeout)
+            result["status"] = response.status_code
+        if result["status"] >= 400 and result["error"] is None:
+            result["error"] = f"HTTP {result['status']}"
+    except Exception as e:
+        result["error"] = type(e).__name__
+    result["latency_ms"] = (time.perf_counter() - scheduled) * 1000
+    return result
+
+
+async def replay(client: httpx.AsyncClient, mix: List[dict], rps: float, total: int, arrival: str = "constant",
+                 seed: int = 0, timeout: float = 60.0) -> tuple[List[dict], float]:
+    """
+    Rejoue le mix en boucle, en boucle ouverte : la requête i part à l'instant prévu même si les précédentes
+    n'ont pas répondu (intervalle fixe 1/rps, ou exponentiel avec arrival="poisson").
+    """
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    offset, tasks = 0.0, []
+    for i in range(total):
+        scheduled = started + offset
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(send_request(client, mix[i % len(mix)], scheduled, timeout)))
+        offset += rng.expovariate(rps) if arrival == "poisson" else 1 / rps
+    results = await asyncio.gather(*tasks)
+    return results, time.perf_counter() - started
+
+
+# 🔹 Rapport
+def latency_stats(values: List[float]) -> dict:
+    if not values:
+        return {}
+    stats = {f"p{p}_ms": round(float(np.percentile(values, p)), 2) for p in PERCENTILES}
+    stats["max_ms"] = round(float(max(values)), 2)
+    stats["mean_ms"] = round(float(np.mean(values)), 2)
+    return stats
+
+
+def group_stats(results: List[dict], key: str) -> dict:
+    groups = {}
+    for result in results:
+        groups.setdefault(result[key], []).append(result)
+    return {
+        name: {"requests": len(group), "errors": sum(r["error"] is not None for r in group),
+               **latency_stats([r["latency_ms"] for r in group])}
+        for name, group in sorted(groups.items())
+    }
+
+
+def summarize(results: List[dict], wall_time: float) -> dict:
+    errors = [r for r in results if r["error"] is not None]
+    return {
+        "requests": len(results),
+        "errors": len(errors),
+        "error_rate": round(len(errors) / max(len(results), 1), 4),
+        "error_kinds": sorted({r["error"] for r in errors}),
+        "wall_time_s": round(wall_time, 3),
+        "throughput_rps": round(len(results) / wall_time, 3) if wall_time else None,
+        "latency": latency_stats([r["latency_ms"] for r in results]),
+        "ttft": latency_stats([r["ttft_ms"] for r in results if r["ttft_ms"] is not None]),
+        "by_kind": group_stats(results, "kind"),
+        "by_language": group_stats(results, "language"),
+        "by_endpoint": group_stats(results, "endpoint"),
+    }
+
+
+async def stage_means(client: httpx.AsyncClient) -> dict:
+    """
+    Durée moyenne de chaque étape du pipeline côté serveur (astramed_stage_seconds sur /metrics).
+    """
+    from prometheus_client.parser import text_string_to_metric_families
+
+    try:
+        text = (await client.get("/metrics")).text
+    except Exception:
+        return {}
+    sums, counts = {}, {}
+    for family in text_string_to_metric_families(text):
+        if family.name != "astramed_stage_seconds":
+            continue
+        for sample in family.samples:
+            if sample.name.endswith("_sum"):
+                sums[sample.labels["stage"]] = sample.value
+            elif sample.name.endswith("_count"):
+                counts[sample.labels["stage"]] = sample.value
+    return {stage: round(sums[stage] / counts[stage] * 1000, 2) for stage in sorted(sums) if counts.get(stage)}
+
+
+# 🔹 Baseline
+def compare_to_baseline(summary: dict, baseline: dict, tolerance: float, min_delta_ms: float = 10.0,
+                        error_rate_margin: float = 0.01) -> List[str]:
+    """
+    Régressions par rapport à la baseline : latences p50/p95/p99 plus de `tolerance` (et de `min_delta_ms`,
+    pour ignorer la gigue des réponses en cache de quelques millisecondes) au-dessus, débit plus de `tolerance`
+    en dessous, ou taux d'erreur plus de `error_rate_margin` au-dessus. Des réglages de run différents
+    (mix, RPS, latences simulées...) rendent la comparaison invalide.
+    """
+    if summary["settings"] != baseline["settings"]:
+        changed = sorted(key for key in set(summary["settings"]) | set(baseline["settings"])
+                         if summary["settings"].get(key) != baseline["settings"].get(key))
+        return [f"réglages différents de la baseline ({', '.join(changed)}) : relancez avec les mêmes ou régénérez-la"]
+    failures = []
+    for key in LATENCY_CHECKS:
+        current, reference = summary["latency"].get(key), baseline["latency"].get(key)
+        if current is not None and reference and current > reference * (1 + tolerance) and current - reference > min_delta_ms:
+            failures.append(f"latence {key} : {current} ms > {reference} ms (+{tolerance:.0%})")
+    current, reference = summary["throughput_rps"], baseline["throughput_rps"]
+    if current is not None and reference and current < reference * (1 - tolerance):
+        failures.append(f"débit : {current} req/s < {reference} req/s (-{tolerance:.0%})")
+    if summary["error_rate"] > baseline["error_rate"] + error_rate_margin:
+        failures.append(f"taux d'erreur : {summary['error_rate']} > {baseline['error_rate']} (+{error_rate_margin})")
+    return failures
+
+
+# 🔹 Exécution
+async def run(args) -> dict:
+    mix = load_request_mix(args.requests)
+    total = args.total or max(1, int(args.rps * args.duration))
+    settings = {
+        "requests_file": os.path.basename(args.requests),
+        "mix": mix_fingerprint(mix),
+        "rps": args.rps,
+        "total": total,
+        "arrival": args.arrival,
+        "seed": args.seed,
+        "target": "url" if args.url else "in-process",
+    }
+
+    if args.url:
+        client = httpx.AsyncClient(base_url=args.url)
+        lifespan = None
+    else:
+        # Une ligne de log par requête fausserait la mesure (LOG_LEVEL explicite pour les garder)
+        os.environ.setdefault("LOG_LEVEL", "WARNING")
+        import api
+        from benchmarks.fakes import install_fakes
+
+        settings.update(install_fakes(
+            api,
+            csv_path=args.csv,
+            embedding_latency_ms=args.embedding_latency_ms,
+            first_token_ms=args.llm_first_token_ms,
+            tokens_per_second=args.llm_tokens_per_second,
+            tool_choices=recorded_tool_choices(mix),
+            hybrid=not args.no_hybrid,
+            response_cache=args.response_cache,
+        ))
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=api.app), base_url="http://bench")
+        lifespan = api.app.router.lifespan_context(api.app)
+
+    async with client:
+        if lifespan is not None:
+            await lifespan.__aenter__()
+        try:
+            if args.warmup:
+                await replay(client, mix, args.rps, args.warmup, args.arrival, args.seed, args.timeout)
+            results, wall_time = await replay(client, mix, args.rps, total, args.arrival, args.seed, args.timeout)
+            stages = await stage_means(client)
+        finally:
+            if lifespan is not None:
+                await lifespan.__aexit__(None, None, None)
+
+    return {
+        "run_at": datetime.now().isoformat(timespec="seconds"),
+        "settings": settings,
+        **summarize(results, wall_time),
+        "stage_means_ms": stages,
+    }
+
+
+def print_summary(summary: dict) -> None:
+    print(f"\n📊 {summary['requests']} requêtes en {summary['wall_time_s']} s : {summary['throughput_rps']} req/s, "
+          f"{summary['errors']} erreurs ({summary['error_rate']:.2%}) {summary['error_kinds'] or ''}")
+    print(f"⏱️ Latence : {summary['latency']}")
+    if summary["ttft"]:
+        print(f"⏱️ Premier token (streaming) : {summary['ttft']}")
+    for group in ("by_kind", "by_language", "by_endpoint"):
+        for name, stats in summary[group].items():
+            print(f"   {group[3:]}={name}: {stats['requests']} req, {stats['errors']} err, "
+                  f"p50 {stats.get('p50_ms')} ms, p95 {stats.get('p95_ms')} ms")
+    if summary["stage_means_ms"]:
+        print(f"🔧 Étapes (moyenne côté serveur, ms) : {summary['stage_means_ms']}")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Rejoue un mix de requêtes enregistré contre l'API à un débit cible.")
+    parser.add_argument("--requests", default=DEFAULT_REQUESTS_PATH, help="Mix de requêtes (JSONL)")
+    parser.add_argument("--rps", type=float, default=10.0, help="Débit cible (requêtes par seconde)")
+    parser.add_argument("--duration", type=float, default=20.0, help="Durée du run (secondes), si --total n'est pas donné")
+    parser.add_argument("--total", type=int, default=0, help="Nombre de requêtes envoyées")
+    parser.add_argument("--arrival", choices=["constant", "poisson"], default="constant", help="Intervalles entre requêtes")
+    parser.add_argument("--warmup", type=int, default=0, help="Requêtes envoyées avant la mesure, non comptées")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=60.0, help="Délai maximal d'une requête (secondes)")
+    parser.add_argument("--url", default="", help="Serveur déjà lancé (sinon api.app en local avec les remplaçants)")
+    parser.add_argument("--csv", default="", help="Corpus MedQuAD du vector store simulé (défaut : corpus synthétique)")
+    parser.add_argument("--embedding-latency-ms", type=float, default=20.0, help="Latence des embeddings simulés")
+    parser.add_argument("--llm-first-token-ms", type=float, default=300.0, help="Latence du LLM simulé avant le premier token")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=50.0, help="Débit de tokens du LLM simulé")
+    parser.add_argument("--no-hybrid", action="store_true", help="Sans index BM25 (recherche vectorielle seule)")
+    parser.add_argument("--response-cache", action="store_true", help="Garde le cache sémantique des réponses")
+    parser.add_argument("--output", default="", help="Fichier JSON du rapport")
+    parser.add_argument("--save-baseline", nargs="?", const=DEFAULT_BASELINE_PATH, default="",
+                        help="Enregistre le rapport comme baseline")
+    parser.add_argument("--check-baseline", nargs="?", const=DEFAULT_BASELINE_PATH, default="",
+                        help="Compare à la baseline ; code de sortie 1 en cas de régression")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Écart relatif toléré sur latences et débit")
+    parser.add_argument("--min-delta-ms", type=float, default=10.0, help="Écart absolu de latence en dessous duquel il n'y a pas de régression")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    summary = asyncio.run(run(args))
+    print_summary(summary)
+    for path in filter(None, [args.output, args.save_baseline]):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        print(f"💾 Rapport écrit dans {path}")
+    if args.check_baseline:
+        with open(args.check_baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        failures = compare_to_baseline(summary, baseline, args.tolerance, args.min_delta_ms)
+        for failure in failures:
+            print(f"❌ {failure}")
+        if failures:
+            return 1
+        print(f"✅ Pas de régression par rapport à {args.check_baseline} (tolérance {args.tolerance:.0%})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import List
+
+from benchmarks import loadtest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# 🔹 Mémoire des processus (Linux, /proc/<pid>/smaps_rollup)
+def process_memory(pid: int) -> dict:
+    """
+    RSS, PSS (chaque page partagée divisée entre les processus qui la mappent), pages partagées et privées, en Mo.
+    La somme des PSS est la mémoire réellement occupée par le serveur.
+    """
+    values = {}
+    with open(f"/proc/{pid}/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) == 3 and parts[2] == "kB":
+                values[parts[0].rstrip(":")] = int(parts[1])
+    return {
+        "rss_mb": round(values.get("Rss", 0) / 1024, 1),
+        "pss_mb": round(values.get("Pss", 0) / 1024, 1),
+        "shared_mb": round((values.get("Shared_Clean", 0) + values.get("Shared_Dirty", 0)) / 1024, 1),
+        "private_mb": round((values.get("Private_Clean", 0) + values.get("Private_Dirty", 0)) / 1024, 1),
+    }
+
+
+def worker_pids(master_pid: int) -> List[int]:
+    with open(f"/proc/{master_pid}/task/{master_pid}/children") as f:
+        return [int(pid) for pid in f.read().split()]
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+# 🔹 Serveur gunicorn (gunicorn.conf.py) avec les remplaçants de benchmarks/fakes.py
+def start_server(workers: int, port: int, state_dir: str, args) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "WEB_CONCURRENCY": str(workers),
+        "BIND": f"127.0.0.1:{port}",
+        "SHARED_STATE_DIR": state_dir,
+        "LOG_LEVEL": os.getenv("LOG_LEVEL", "WARNING"),
+        "BENCH_REQUESTS": args.requests,
+        "BENCH_CSV": args.csv,
+        "BENCH_CORPUS_ROWS_PER_TEMPLATE": str(args.corpus_rows_per_template),
+        "BENCH_EMBEDDING_LATENCY_MS": str(args.embedding_latency_ms),
+        "BENCH_LLM_FIRST_TOKEN_MS": str(args.llm_first_token_ms),
+        "BENCH_LLM_TOKENS_PER_SECOND": str(args.llm_tokens_per_second),
+        "BENCH_RESPONSE_CACHE": "1" if args.response_cache else "0",
+    }
+    log = open(os.path.join(state_dir, "gunicorn.log"), "w")
+    return subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "benchmarks.fakes:create_app()"],
+        cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+
+
+def wait_ready(process: subprocess.Popen, workers: int, state_dir: str, timeout: float) -> None:
+    """
+    Attend que chaque worker ait terminé son lifespan (warm_up compris) : une ligne "Application startup complete" par worker.
+    """
+    log_path = os.path.join(state_dir, "gunicorn.log")
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            with open(log_path) as f:
+                raise RuntimeError(f"gunicorn s'est arrêté au démarrage :\n{f.read()[-2000:]}")
+        with open(log_path) as f:
+            if f.read().count("Application startup complete") >= workers:
+                return
+        time.sleep(0.5)
+    raise TimeoutError(f"{workers} workers non prêts après {timeout} s (voir {log_path})")
+
+
+def measure(workers: int, args) -> dict:
+    """
+    Démarre le serveur avec `workers` workers, rejoue le mix à --rps, puis relève la mémoire de chaque processus.
+    """
+    state_dir = tempfile.mkdtemp(prefix="astramed_workers_")
+    port = free_port()
+    process = start_server(workers, port, state_dir, args)
+    try:
+        started = time.time()
+        wait_ready(process, workers, state_dir, args.startup_timeout)
+        startup_s = time.time() - started
+        summary = asyncio.run(loadtest.run(loadtest.parse_args([
+            "--url", f"http://127.0.0.1:{port}", "--requests", args.requests, "--rps", str(args.rps),
+            "--duration", str(args.duration), "--warmup", str(args.warmup), "--timeout", str(args.timeout),
+        ])))
+        memory = {pid: process_memory(pid) for pid in worker_pids(process.pid)}
+        master = process_memory(process.pid)
+    finally:
+        process.terminate()
+        try:
+            process.wait(30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        shutil.rmtree(state_dir, ignore_errors=True)
+
+    count = max(len(memory), 1)
+    return {
+        "workers": workers,
+        "startup_s": round(startup_s, 1),
+        "throughput_rps": summary["throughput_rps"],
+        "p50_ms": summary["latency"].get("p50_ms"),
+        "p95_ms": summary["latency"].get("p95_ms"),
+        "error_rate": summary["error_rate"],
+        "worker_rss_mb": round(sum(m["rss_mb"] for m in memory.values()) / count, 1),
+        "worker_pss_mb": round(sum(m["pss_mb"] for m in memory.values()) / count, 1),
+        "worker_shared_mb": round(sum(m["shared_mb"] for m in memory.values()) / count, 1),
+        "worker_private_mb": round(sum(m["private_mb"] for m in memory.values()) / count, 1),
+        "master_pss_mb": master["pss_mb"],
+        "total_pss_mb": round(master["pss_mb"] + sum(m["pss_mb"] for m in memory.values()), 1),
+        "stage_means_ms": summary["stage_means_ms"],
+    }
+
+
+def print_report(rows: List[dict]) -> None:
+    base = rows[0]
+    print(f"\n{'workers':>7} {'req/s':>7} {'x':>5} {'p50 ms':>8} {'p95 ms':>8} {'err':>5} "
+          f"{'RSS/w':>7} {'PSS/w':>7} {'privé/w':>8} {'PSS total':>10} {'Δ/worker':>9}")
+    for row in rows:
+        scaling = row["throughput_rps"] / base["throughput_rps"] if base["throughput_rps"] else 0
+        extra = (row["total_pss_mb"] - base["total_pss_mb"]) / (row["workers"] - base["workers"]) if row is not base else 0
+        print(f"{row['workers']:>7} {row['throughput_rps']:>7} {scaling:>5.2f} {row['p50_ms']:>8} {row['p95_ms']:>8} "
+              f"{row['error_rate']:>5.1%} {row['worker_rss_mb']:>7} {row['worker_pss_mb']:>7} {row['worker_private_mb']:>8} "
+              f"{row['total_pss_mb']:>10} {extra:>9.1f}")
+    print("(Mo ; RSS compte les pages partagées dans chaque worker, PSS les divise entre eux ; "
+          "Δ/worker = PSS total ajouté par worker supplémentaire)")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Débit et mémoire par worker du mode gunicorn, selon le nombre de workers.")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4], help="Nombres de workers comparés")
+    parser.add_argument("--requests", default=loadtest.DEFAULT_REQUESTS_PATH, help="Mix de requêtes (JSONL)")
+    parser.add_argument("--rps", type=float, default=40.0, help="Débit offert, au-delà de la capacité d'un worker")
+    parser.add_argument("--duration", type=float, default=15.0, help="Durée de chaque run (secondes)")
+    parser.add_argument("--warmup", type=int, default=20, help="Requêtes envoyées avant la mesure, non comptées")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Délai maximal d'une requête (secondes)")
+    parser.add_argument("--startup-timeout", type=float, default=180.0, help="Attente max du démarrage des workers (secondes)")
+    parser.add_argument("--csv", default="", help="Corpus MedQuAD du vector store simulé (défaut : corpus synthétique)")
+    parser.add_argument("--corpus-rows-per-template", type=int, default=40,
+                        help="Taille du corpus synthétique (× 240 lignes) : de quoi voir l'index partagé dans la mémoire")
+    parser.add_argument("--embedding-latency-ms", type=float, default=20.0)
+    parser.add_argument("--llm-first-token-ms", type=float, default=300.0)
+    parser.add_argument("--llm-tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--response-cache", action="store_true", help="Garde le cache sémantique des réponses (tier SQLite partagé)")
+    parser.add_argument("--output", default="", help="Fichier JSON du rapport")
+    return parser.parse_args(argv)
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    rows = []
+    for workers in args.workers:
+        print(f"🚀 {workers} worker(s)...")
+        rows.append(measure(workers, args))
+    print_report(rows)
+    if args.output:
+        os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"run_at": datetime.now().isoformat(timespec="seconds"), "cpu_count": os.cpu_count(),
+                       "settings": {k: v for k, v in vars(args).items() if k != "output"}, "runs": rows},
+                      f, ensure_ascii=False, indent=2)
+        print(f"💾 Rapport écrit dans {args.output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
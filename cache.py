@@ -0,0 +1,460 @@
+import asyncio
+import functools
+import json
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Callable, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalise une question pour les clés de cache : "what is Glaucoma  ?" et "What is glaucoma?" donnent la même clé.
+    """
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = re.sub(r"\s+", " ", text)
+    text = re.sub(r"\s+([?!.,;:])", r"\1", text)
+    return text.strip()
+
+
+def embed_queries_batch(embeddings: Embeddings, texts: List[str]) -> List[List[float]]:
+    """
+    Embeddings de plusieurs requêtes en un seul appel quand le service le permet
+    (VertexAIEmbeddings.embed avec la tâche RETRIEVAL_QUERY), sinon requête par requête.
+    """
+    if not texts:
+        return []
+    if hasattr(embeddings, "embed"):
+        return embeddings.embed(texts, 0, "RETRIEVAL_QUERY")
+    return [embeddings.embed_query(text) for text in texts]
+
+
+def lazy_singleton(factory: Callable) -> Callable:
+    """
+    Décorateur pour les objets lourds (modèles, connexions) : construits au premier appel seulement,
+    et une seule fois même si plusieurs threads l'appellent en même temps.
+    """
+    lock = threading.Lock()
+    instance = []
+
+    @functools.wraps(factory)
+    def get():
+        if not instance:
+            with lock:
+                if not instance:
+                    instance.append(factory())
+        return instance[0]
+
+    get.is_loaded = lambda: bool(instance)
+    return get
+
+
+class LRUCache:
+    """
+    Cache LRU borné et thread-safe, avec compteurs de hits/misses/évictions.
+    """
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._data: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, value) -> None:
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+class GeneralReplyCache(LRUCache):
+    """
+    LRU des réponses générales déjà générées, qui compte aussi les réponses prêtes servies (sous le même verrou).
+    """
+
+    def __init__(self, max_size: int):
+        super().__init__(max_size)
+        self.canned_hits = 0
+
+    def record_canned(self) -> None:
+        with self._lock:
+            self.canned_hits += 1
+
+    def stats(self) -> dict:
+        return {"canned_hits": self.canned_hits, **super().stats()}
+
+
+class SQLiteVectorStore:
+    """
+    Tier persistant du cache d'embeddings : vecteurs float32 stockés en BLOB dans un fichier SQLite.
+    """
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)")
+            self._conn.commit()
+
+    def get_many(self, keys: List[str]) -> dict:
+        if not keys:
+            return {}
+        placeholders = ",".join("?" for _ in keys)
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})", keys
+            ).fetchall()
+        return {key: np.frombuffer(blob, dtype=np.float32) for key, blob in rows}
+
+    def put_many(self, items: dict) -> None:
+        if not items:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                [(key, np.asarray(vector, dtype=np.float32).tobytes()) for key, vector in items.items()],
+            )
+            self._conn.commit()
+
+
+def _as_list(vector) -> List[float]:
+    return vector.tolist() if isinstance(vector, np.ndarray) else vector
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Enveloppe un service d'embeddings (VertexAIEmbeddings en production, DeterministicFakeEmbedding en local)
+    avec un LRU en mémoire et, optionnellement, un tier SQLite qui survit aux redémarrages et que
+    plusieurs workers peuvent partager.
+
+    Les clés combinent le nom du modèle, le type d'appel (requête ou document, qui n'utilisent pas
+    la même tâche côté Vertex AI) et le texte normalisé. Le LRU garde des tableaux float32 (3 Ko pour
+    768 dimensions, contre environ 25 Ko pour une liste de floats Python) : c'est la mémoire de chaque worker.
+    """
+
+    def __init__(self, embeddings: Embeddings, model_name: str, max_size: int = 10000, persist_path: Optional[str] = None):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.memory = LRUCache(max_size)
+        self.disk = SQLiteVectorStore(persist_path) if persist_path else None
+        self.disk_hits = 0
+
+    def _key(self, kind: str, text: str) -> str:
+        return f"{self.model_name}|{kind}|{normalize_text(text)}"
+
+    def _lookup_memory(self, keys: List[str]) -> dict:
+        found = {}
+        for key in keys:
+            vector = self.memory.get(key)
+            if vector is not None:
+                found[key] = vector
+        return found
+
+    def _add_from_disk(self, found: dict, from_disk: dict) -> dict:
+        # Les vecteurs trouvés sur disque remontent dans le LRU
+        for key, vector in from_disk.items():
+            self.memory.put(key, vector)
+        self.disk_hits += len(from_disk)
+        found.update(from_disk)
+        return found
+
+    def _lookup(self, keys: List[str]) -> dict:
+        """
+        Cherche les clés en mémoire puis sur disque ; les vecteurs trouvés sur disque remontent dans le LRU.
+        """
+        found = self._lookup_memory(keys)
+        if self.disk is not None:
+            self._add_from_disk(found, self.disk.get_many([key for key in keys if key not in found]))
+        return found
+
+    async def _alookup(self, keys: List[str]) -> dict:
+        """
+        _lookup pour les méthodes async : le LRU est lu sur place, le tier SQLite dans un thread.
+        """
+        found = self._lookup_memory(keys)
+        absent = [key for key in keys if key not in found]
+        if self.disk is not None and absent:
+            self._add_from_disk(found, await asyncio.to_thread(self.disk.get_many, absent))
+        return found
+
+    def _store_memory(self, computed: dict) -> None:
+        for key, vector in computed.items():
+            self.memory.put(key, np.asarray(vector, dtype=np.float32))
+
+    def _store(self, computed: dict) -> None:
+        self._store_memory(computed)
+        if self.disk is not None:
+            self.disk.put_many(computed)
+
+    async def _astore(self, computed: dict) -> None:
+        self._store_memory(computed)
+        if self.disk is not None:
+            await asyncio.to_thread(self.disk.put_many, computed)
+
+    def _missing(self, texts: List[str], keys: List[str], found: dict) -> dict:
+        # Une seule entrée par clé manquante, même si le texte apparaît plusieurs fois dans le lot
+        missing = {}
+        for text, key in zip(texts, keys):
+            if key not in found and key not in missing:
+                missing[key] = text
+        return missing
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key("doc", text) for text in texts]
+        found = self._lookup(keys)
+        missing = self._missing(texts, keys, found)
+        if missing:
+            vectors = self.embeddings.embed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            self._store(computed)
+            found.update(computed)
+        return [_as_list(found[key]) for key in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self._key("query", text)
+        found = self._lookup([key])
+        if key not in found:
+            found[key] = self.embeddings.embed_query(text)
+            self._store({key: found[key]})
+        return _as_list(found[key])
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """
+        embed_query pour un lot de questions : les absentes du cache partent en un seul appel au service.
+        """
+        keys = [self._key("query", text) for text in texts]
+        found = self._lookup(keys)
+        missing = self._missing(texts, keys, found)
+        if missing:
+            computed = dict(zip(missing.keys(), embed_queries_batch(self.embeddings, list(missing.values()))))
+            self._store(computed)
+            found.update(computed)
+        return [_as_list(found[key]) for key in keys]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self._key("doc", text) for text in texts]
+        found = await self._alookup(keys)
+        missing = self._missing(texts, keys, found)
+        if missing:
+            vectors = await self.embeddings.aembed_documents(list(missing.values()))
+            computed = dict(zip(missing.keys(), vectors))
+            await self._astore(computed)
+            found.update(computed)
+        return [_as_list(found[key]) for key in keys]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = self._key("query", text)
+        found = await self._alookup([key])
+        if key not in found:
+            found[key] = await self.embeddings.aembed_query(text)
+            await self._astore({key: found[key]})
+        return _as_list(found[key])
+
+    def stats(self) -> dict:
+        return {
+            "model": self.model_name,
+            **self.memory.stats(),
+            "disk_enabled": self.disk is not None,
+            "disk_hits": self.disk_hits,
+        }
+
+
+class SemanticResponseCache:
+    """
+    Cache des réponses complètes de /answer, retrouvées par similarité cosinus de l'embedding de la question.
+
+    Une entrée n'est comparée qu'aux entrées de la même partition (langue, tranche de température,
+    seuil de similarité RAG). Les entrées expirent après `ttl_seconds` et les moins récemment
+    utilisées sont évincées au-delà de `max_size`.
+
+    Avec `persist_path`, les réponses sont aussi écrites dans un fichier SQLite partagé par les workers :
+    avant chaque recherche, un worker charge les entrées ajoutées par les autres depuis sa dernière lecture,
+    et une invalidation (compteur de génération) vide le cache de tous les workers.
+    """
+
+    def __init__(self, max_size: int = 1000, ttl_seconds: float = 3600, min_similarity: float = 0.95,
+                 persist_path: Optional[str] = None):
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self.min_similarity = min_similarity
+        self._entries: OrderedDict = OrderedDict()  # id -> (partition, vecteur normalisé, payload, date)
+        self._partitions: dict = {}  # partition -> ids des entrées
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._conn = None
+        self._generation = 0
+        self._last_row = 0  # Dernière ligne SQLite lue
+        if persist_path:
+            self._conn = sqlite3.connect(persist_path, check_same_thread=False, timeout=10)
+            with self._lock:
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS responses (id INTEGER PRIMARY KEY AUTOINCREMENT, partition TEXT NOT NULL, "
+                    "vector BLOB NOT NULL, payload TEXT NOT NULL, created_at REAL NOT NULL)"
+                )
+                self._conn.execute("CREATE TABLE IF NOT EXISTS generation (id INTEGER PRIMARY KEY CHECK (id = 0), value INTEGER NOT NULL)")
+                self._conn.execute("INSERT OR IGNORE INTO generation (id, value) VALUES (0, 0)")
+                self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.synced = 0
+
+    @staticmethod
+    def partition(language: str, temperature: float, similarity_threshold: float) -> tuple:
+        # Tranches de 0.1 pour la température : 0.3 et 0.32 partagent les mêmes réponses
+        return (language, round(temperature, 1), round(similarity_threshold, 2))
+
+    def _remove(self, entry_id: int) -> None:
+        partition = self._entries.pop(entry_id)[0]
+        ids = self._partitions[partition]
+        ids.discard(entry_id)
+        if not ids:
+            del self._partitions[partition]
+
+    def _insert(self, entry_id: int, partition: tuple, normalized: np.ndarray, payload: dict, created: float) -> None:
+        self._entries[entry_id] = (partition, normalized, payload, created)
+        self._partitions.setdefault(partition, set()).add(entry_id)
+        while len(self._entries) > self.max_size:
+            self._remove(next(iter(self._entries)))
+            self.evictions += 1
+
+    # 🔹 Tier SQLite partagé entre workers (optionnel)
+    def _sync(self, now: float) -> None:
+        """
+        Charge les réponses écrites par les autres workers ; repart de zéro si le cache a été invalidé entre-temps.
+        """
+        generation = self._conn.execute("SELECT value FROM generation WHERE id = 0").fetchone()[0]
+        if generation != self._generation:
+            self._entries.clear()
+            self._partitions.clear()
+            self._generation, self._last_row = generation, 0
+        rows = self._conn.execute(
+            "SELECT id, partition, vector, payload, created_at FROM responses WHERE id > ? AND created_at >= ? ORDER BY id",
+            (self._last_row, now - self.ttl_seconds)
+        ).fetchall()
+        for entry_id, partition, blob, payload, created in rows:
+            self._last_row = entry_id
+            if entry_id not in self._entries:
+                self._insert(entry_id, tuple(json.loads(partition)), np.frombuffer(blob, dtype=np.float32), json.loads(payload), created)
+                self.synced += 1
+
+    def _persist(self, partition: tuple, normalized: np.ndarray, payload: dict, now: float) -> int:
+        cursor = self._conn.execute(
+            "INSERT INTO responses (partition, vector, payload, created_at) VALUES (?, ?, ?, ?)",
+            (json.dumps(partition), normalized.tobytes(), json.dumps(payload, ensure_ascii=False), now)
+        )
+        # Le fichier reste borné comme la mémoire : max_size dernières réponses non expirées
+        self._conn.execute(
+            "DELETE FROM responses WHERE id <= ? OR created_at < ?", (cursor.lastrowid - self.max_size, now - self.ttl_seconds)
+        )
+        self._conn.commit()
+        return cursor.lastrowid
+
+    def lookup(self, vector: List[float], partition: tuple, now: float) -> Optional[tuple]:
+        """
+        Retourne (payload, similarité, âge en secondes) de la meilleure entrée au-dessus du seuil, ou None.
+        """
+        query = np.asarray(vector, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        with self._lock:
+            if self._conn is not None:
+                self._sync(now)
+            ids = list(self._partitions.get(partition, ()))
+            for entry_id in ids:
+                if now - self._entries[entry_id][3] > self.ttl_seconds:
+                    self._remove(entry_id)
+                    self.expirations += 1
+            ids = list(self._partitions.get(partition, ()))
+            if not ids:
+                self.misses += 1
+                return None
+            matrix = np.stack([self._entries[entry_id][1] for entry_id in ids])
+            similarities = matrix @ query
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.min_similarity:
+                self.misses += 1
+                return None
+            entry_id = ids[best]
+            self._entries.move_to_end(entry_id)
+            self.hits += 1
+            _, _, payload, created = self._entries[entry_id]
+            return payload, float(similarities[best]), now - created
+
+    def store(self, vector: List[float], partition: tuple, payload: dict, now: float) -> None:
+        normalized = np.asarray(vector, dtype=np.float32)
+        normalized /= np.linalg.norm(normalized) or 1.0
+        with self._lock:
+            if self._conn is not None:
+                # L'id de la ligne SQLite sert d'id en mémoire : la ligne n'est pas rechargée au prochain _sync
+                entry_id = self._persist(partition, normalized, payload, now)
+            else:
+                entry_id = self._next_id
+                self._next_id += 1
+            self._insert(entry_id, partition, normalized, payload, now)
+
+    def invalidate(self) -> int:
+        """
+        Vide le cache (par exemple après une ré-ingestion de la table) et retourne le nombre d'entrées supprimées.
+        """
+        with self._lock:
+            removed = len(self._entries)
+            self._entries.clear()
+            self._partitions.clear()
+            if self._conn is not None:
+                removed = max(removed, self._conn.execute("DELETE FROM responses").rowcount)
+                self._conn.execute("UPDATE generation SET value = value + 1 WHERE id = 0")
+                self._conn.commit()
+                self._generation = self._conn.execute("SELECT value FROM generation WHERE id = 0").fetchone()[0]
+                self._last_row = 0
+            return removed
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl_seconds,
+            "min_similarity": self.min_similarity,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "shared": self._conn is not None,
+            "synced": self.synced,
+        }
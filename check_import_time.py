@@ -0,0 +1,72 @@
+import argparse
+import os
+import subprocess
+import sys
+
+# Budget de temps d'import par module (millisecondes, cumulatif, mesuré par python -X importtime)
+IMPORT_TIME_BUDGETS_MS = {
+    "api": 4000,
+    "eval": 2500,
+    "utils_eval": 1500,
+}
+# Bibliothèques lourdes qui ne doivent être chargées qu'au premier usage, jamais à l'import
+FORBIDDEN_AT_IMPORT = [
+    "sentence_transformers",
+    "torch",
+    "langchain_google_vertexai",
+    "langchain_google_genai",
+]
+
+
+def measure_import(module: str) -> tuple[float, set]:
+    """
+    Importe `module` dans un interpréteur neuf, sans identifiants, et retourne (temps cumulatif en ms, modules chargés).
+    """
+    env = {key: value for key, value in os.environ.items() if key not in ("API_KEY", "DB_PASSWORD")}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.dirname(os.path.abspath(__file__)), env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} a échoué :\n{result.stderr[-2000:]}")
+    cumulative_us, loaded = None, set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if not cumulative.strip().isdigit():
+            continue  # ligne d'en-tête
+        loaded.add(name.strip())
+        if name.rstrip() == f" {module}":
+            cumulative_us = int(cumulative)
+    return cumulative_us / 1000, loaded
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Échoue si l'import des modules dépasse son budget de démarrage.")
+    parser.add_argument("--runs", type=int, default=3, help="Mesures par module (la plus rapide est retenue)")
+    parser.add_argument("--scale", type=float, default=float(os.getenv("IMPORT_TIME_BUDGET_SCALE", 1.0)),
+                        help="Multiplicateur des budgets pour une machine plus lente")
+    args = parser.parse_args()
+
+    failures = []
+    for module, budget_ms in IMPORT_TIME_BUDGETS_MS.items():
+        timings, loaded = [], set()
+        for _ in range(args.runs):
+            elapsed_ms, loaded = measure_import(module)
+            timings.append(elapsed_ms)
+        elapsed_ms, budget_ms = min(timings), budget_ms * args.scale
+        heavy = sorted(name for name in loaded if name.split(".")[0] in FORBIDDEN_AT_IMPORT)
+        status = "✅" if elapsed_ms <= budget_ms and not heavy else "❌"
+        print(f"{status} import {module}: {elapsed_ms:.0f} ms (budget {budget_ms:.0f} ms)")
+        if elapsed_ms > budget_ms:
+            failures.append(f"import {module} : {elapsed_ms:.0f} ms > {budget_ms:.0f} ms")
+        if heavy:
+            failures.append(f"import {module} charge {', '.join(heavy[:5])}")
+    for failure in failures:
+        print(f"❌ {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
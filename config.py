@@ -5,4 +5,91 @@ INSTANCE = "elyessiki"
 REGION = "europe-west1"
 DATABASE = "health_database"
 DB_USER = "postgres"
-TABLE_NAME = "elyes_med"
+TABLE_NAME = "elyes_med"
+
+# 🔹 Logs (DEBUG affiche documents trouvés et sorties brutes de l'agent)
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+
+# 🔹 Pool de connexions à la base (PostgresEngine)
+DATABASE_URL = os.getenv("DATABASE_URL", "")  # postgresql+asyncpg://... pour un Postgres local à la place de Cloud SQL
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 10))  # Connexions gardées ouvertes au maximum
+DB_POOL_MAX_OVERFLOW = int(os.getenv("DB_POOL_MAX_OVERFLOW", 5))  # Connexions temporaires au-delà du pool
+DB_POOL_MIN_CONNECTIONS = int(os.getenv("DB_POOL_MIN_CONNECTIONS", 2))  # Connexions ouvertes dès le démarrage
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", 1800))  # Durée de vie max d'une connexion (secondes)
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"  # Vérifie la connexion avant chaque emprunt
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 30))  # Attente max d'une connexion libre (secondes)
+
+# 🔹 Pipeline de l'agent
+LLM_MODEL = "gemini-1.5-pro"
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", 4))  # Nombre max de clients LLM (un par température)
+DEFAULT_TEMPERATURE = 0.3
+MAX_CONCURRENT_REQUESTS = int(os.getenv("MAX_CONCURRENT_REQUESTS", 32))  # Exécutions simultanées de l'agent
+THREAD_POOL_SIZE = int(os.getenv("THREAD_POOL_SIZE", 16))  # Threads pour les appels bloquants restants
+BATCH_MAX_QUESTIONS = int(os.getenv("BATCH_MAX_QUESTIONS", 100))  # Taille max d'un lot sur /answer/batch
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", 8))  # Agents exécutés en parallèle pour un même lot
+
+# 🔹 Pré-routeur devant l'agent (voir router.py)
+ROUTER_ENABLED = os.getenv("ROUTER_ENABLED", "1") == "1"
+ROUTER_MIN_CONFIDENCE = float(os.getenv("ROUTER_MIN_CONFIDENCE", 0.8))  # En dessous, l'agent décide
+CORPUS_CSV_PATH = os.getenv("CORPUS_CSV_PATH", "./downloaded_files/medquadd.csv")  # Source des domaines focus_area
+
+# 🔹 Embeddings et cache d'embeddings
+EMBEDDING_MODEL = "textembedding-gecko@latest"
+EMBEDDING_CACHE_SIZE = int(os.getenv("EMBEDDING_CACHE_SIZE", 10000))  # 0 pour désactiver le cache
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "")  # Fichier SQLite persistant (vide = mémoire seule)
+
+# 🔹 Cache sémantique des réponses de /answer
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", 1000))  # 0 pour désactiver le cache
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", 3600))  # Durée de vie d'une réponse (secondes)
+RESPONSE_CACHE_MIN_SIMILARITY = float(os.getenv("RESPONSE_CACHE_MIN_SIMILARITY", 0.95))  # Cosinus minimal pour un hit
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH", "")  # Fichier SQLite partagé par les workers (vide = mémoire du worker seule)
+GENERAL_REPLY_CACHE_SIZE = int(os.getenv("GENERAL_REPLY_CACHE_SIZE", 1000))  # Réponses générales gardées par (question, langue)
+
+# 🔹 Mémoire de conversation par session_id (voir sessions.py)
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", 10000))  # Sessions gardées en mémoire (0 = désactivée)
+SESSION_TTL = float(os.getenv("SESSION_TTL", 1800))  # Inactivité avant expiration d'une session (secondes)
+SESSION_MAX_TURNS = int(os.getenv("SESSION_MAX_TURNS", 10))  # Tours gardés par session
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", "")  # Fichier SQLite pour retrouver les sessions après un redémarrage
+SESSION_SHARED = os.getenv("SESSION_SHARED", "0") == "1"  # Plusieurs workers sur SESSION_DB_PATH : session relue à chaque requête
+SESSION_FOLLOW_UP_MAX_WORDS = int(os.getenv("SESSION_FOLLOW_UP_MAX_WORDS", 6))  # Au-delà, une question n'est pas une relance
+SESSION_REUSE_MIN_SIMILARITY = float(os.getenv("SESSION_REUSE_MIN_SIMILARITY", 0.9))  # Cosinus pour réutiliser la recherche précédente
+
+# 🔹 Feedback des utilisateurs (écrit par lots en tâche de fond, voir feedback.py)
+FEEDBACK_DB_PATH = os.getenv("FEEDBACK_DB_PATH", "./feedback.sqlite3")
+FEEDBACK_QUEUE_SIZE = int(os.getenv("FEEDBACK_QUEUE_SIZE", 10000))  # Avis en attente max ; au-delà /feedback répond 503
+FEEDBACK_BATCH_SIZE = int(os.getenv("FEEDBACK_BATCH_SIZE", 100))  # Avis écrits par transaction
+FEEDBACK_FLUSH_INTERVAL = float(os.getenv("FEEDBACK_FLUSH_INTERVAL", 2.0))  # Attente max avant d'écrire un lot incomplet (secondes)
+
+# 🔹 Index ANN de la table (voir ingest.py --index)
+VECTOR_INDEX_NAME = f"{TABLE_NAME}_embedding_idx"
+VECTOR_INDEX_EF_SEARCH = int(os.getenv("VECTOR_INDEX_EF_SEARCH")) if os.getenv("VECTOR_INDEX_EF_SEARCH") else None  # HNSW
+VECTOR_INDEX_PROBES = int(os.getenv("VECTOR_INDEX_PROBES")) if os.getenv("VECTOR_INDEX_PROBES") else None  # IVFFlat
+
+# 🔹 Recherche hybride : BM25 (voir lexical.py) + vecteurs, fusionnés par reciprocal-rank fusion
+RETRIEVAL_TOP_K = int(os.getenv("RETRIEVAL_TOP_K", 3))  # Documents gardés par recherche
+LEXICAL_INDEX_PATH = os.getenv("LEXICAL_INDEX_PATH", "./lexical_index")  # Construit par ingest.py
+HYBRID_SEARCH_ENABLED = os.getenv("HYBRID_SEARCH_ENABLED", "1") == "1"  # Actif seulement si l'index BM25 existe
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", 20))  # Candidats de chaque recherche avant fusion
+HYBRID_VECTOR_WEIGHT = float(os.getenv("HYBRID_VECTOR_WEIGHT", 1.0))
+HYBRID_LEXICAL_WEIGHT = float(os.getenv("HYBRID_LEXICAL_WEIGHT", 1.0))
+HYBRID_RRF_K = int(os.getenv("HYBRID_RRF_K", 60))  # Décalage de rang de la fusion (plus grand = classements plus égaux)
+
+# 🔹 Reranking par cross-encoder local (voir rerank.py) : sur-échantillonnage puis top RETRIEVAL_TOP_K
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "0") == "1"
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", 30))  # Candidats reclassés (20 à 50)
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", 32))  # Paires par lot d'inférence CPU
+RERANK_MAX_LENGTH = int(os.getenv("RERANK_MAX_LENGTH", 256))  # Tokens lus par paire (question + document)
+RERANK_CACHE_SIZE = int(os.getenv("RERANK_CACHE_SIZE", 20000))  # Scores (question, document) gardés en mémoire
+RERANK_MAX_INFLIGHT = int(os.getenv("RERANK_MAX_INFLIGHT", 4))  # Au-delà, les requêtes ne sont pas reclassées (0 = sans limite)
+RERANK_BUDGET_MS = float(os.getenv("RERANK_BUDGET_MS", 150))  # Latence moyenne au-delà de laquelle le reranking est suspendu (0 = sans limite)
+
+# 🔹 Backend vectoriel : "cloudsql" (pgvector) ou "local" (index NumPy mappé en mémoire)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "cloudsql")
+LOCAL_INDEX_PATH = os.getenv("LOCAL_INDEX_PATH", "./local_index")
+
+# 🔹 Normalisation multilingue des requêtes (voir translation.py) : questions FR/AR traduites en anglais avant la recherche
+TRANSLATION_ENABLED = os.getenv("TRANSLATION_ENABLED", "1") == "1"
+TRANSLATOR = os.getenv("TRANSLATOR", "llm")  # "llm" (Gemini) ou "glossary" (glossaire médical local, sans appel réseau)
+TRANSLATION_CACHE_SIZE = int(os.getenv("TRANSLATION_CACHE_SIZE", 10000))  # Traductions gardées en mémoire (dans les deux sens)
+TRANSLATION_TIMEOUT = float(os.getenv("TRANSLATION_TIMEOUT", 5.0))  # Au-delà, la question d'origine est recherchée telle quelle (secondes)
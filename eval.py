@@ -1,37 +1,87 @@
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
 import pandas as pd
 import numpy as np
-from api import get_llm, vector_store
 import random
 from langchain_core.prompts import ChatPromptTemplate
-from utils_eval import calculate_relevance, was_answer_found_in_db, measure_response_time, display_evaluation_results
+from utils_eval import (
+    calculate_relevance, calculate_relevance_batch, was_answer_found_in_db, measure_response_time,
+    display_evaluation_results, REFERENCE_CACHE_PATH, BERT_MODEL_NAME
+)
+from rerank import Reranker, cross_encoder_scores
+from config import RERANK_CANDIDATES
 
-def load_random_samples(n=10):
+# Étapes chronométrées pour chaque exemple (millisecondes)
+STAGES = ["embedding", "vector_search", "rerank", "llm", "scoring"]
+
+def load_random_samples(n=10, csv_path="./downloaded_files/medquadd.csv"):
     """
     Charge n exemples aléatoires du dataset médical.
     """
-    df = pd.read_csv("./downloaded_files/medquadd.csv")
-    return df.sample(n=n, random_state=42)
+    df = pd.read_csv(csv_path)
+    return df.sample(n=min(n, len(df)), random_state=42)
 
-def evaluate_response(question, true_answer, chatbot_response):
+def evaluate_response(question, true_answer, chatbot_response, response_time, encode=None):
     """
-    Évalue la pertinence et l'efficacité de la réponse du chatbot.
+    Évalue la pertinence et l'efficacité de la réponse du chatbot (score paire par paire).
     """
     metrics = {
-        "relevance_score": calculate_relevance(chatbot_response, true_answer),
+        "relevance_score": calculate_relevance(chatbot_response, true_answer, encode),
         "retrieval_success": was_answer_found_in_db(chatbot_response),
-        "response_time": measure_response_time()
+        "response_time": response_time
     }
     return metrics
 
-def get_chatbot_response(question: str) -> dict:
+def score_results(results, encode_batch=None, namespace=BERT_MODEL_NAME, cache_path=REFERENCE_CACHE_PATH) -> float:
+    """
+    Pertinence de tous les exemples en un lot ; retourne la durée du scoring en millisecondes.
+    """
+    started = time.perf_counter()
+    scores = calculate_relevance_batch(
+        [r["chatbot_response"] for r in results], [r["true_answer"] for r in results],
+        encode_batch, cache_path, namespace
+    )
+    scoring_ms = (time.perf_counter() - started) * 1000
+    for result, score in zip(results, scores):
+        result["relevance_score"] = score
+        result["retrieval_success"] = was_answer_found_in_db(result["chatbot_response"])
+        # Part amortie du lot, pour garder une colonne par étape
+        result["scoring_ms"] = round(scoring_ms / len(results), 3)
+        result["total_ms"] = round(result["response_time"] * 1000 + result["scoring_ms"], 3)
+    return scoring_ms
+
+def get_chatbot_response(question: str, vector_store, get_llm, timings: dict | None = None,
+                         reranker: Reranker | None = None, candidates: int = RERANK_CANDIDATES) -> dict:
     """
-    Simule la réponse du chatbot pour l'évaluation.
+    Simule la réponse du chatbot pour l'évaluation, en chronométrant embedding, recherche et LLM dans `timings`.
+    Avec `reranker`, `candidates` documents sont cherchés et le meilleur selon le cross-encoder est retenu.
     """
+    timings = timings if timings is not None else {}
     try:
-        results = vector_store.similarity_search_with_score(question, k=1)
+        started = time.perf_counter()
+        query_vector = vector_store.embeddings.embed_query(question)
+        timings["embedding"] = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        results = vector_store.similarity_search_with_score_by_vector(query_vector, k=candidates if reranker else 1)
+        timings["vector_search"] = (time.perf_counter() - started) * 1000
+
+        if reranker is not None:
+            # Comme l'API : seuil appliqué aux candidats, puis reclassement de ceux qui le passent
+            started = time.perf_counter()
+            kept = [(doc, score) for doc, score in results if score < 0.2]
+            if kept:
+                best = reranker.rerank(question, [doc for doc, _ in kept], 1)[0]
+                results = [pair for pair in kept if pair[0] is best]
+            timings["rerank"] = (time.perf_counter() - started) * 1000
+
         if results:
             doc, score = results[0]
-            
+
             if score < 0.2:  # Bonne correspondance
                 llm = get_llm(temperature=0.5)
                 prompt = ChatPromptTemplate.from_messages([
@@ -39,20 +89,22 @@ def get_chatbot_response(question: str) -> dict:
                         "system",
                         """Tu es AstraMed, Votre assistant médical.
                         Voici une réponse de référence : {reference_answer}
-                        
+
                         Reformuler une réponse concise et précise.
-                        
+
                         Question: {question}"""
                     ),
                     ("human", "{question}")
                 ])
-                
+
                 chain = prompt | llm
+                started = time.perf_counter()
                 llm_response = chain.invoke({
                     "question": question,
                     "reference_answer": doc.metadata['answer']
                 })
-                
+                timings["llm"] = (time.perf_counter() - started) * 1000
+
                 return {
                     "response": llm_response.content,
                     "db_answer": doc.metadata['answer'],
@@ -73,43 +125,230 @@ def get_chatbot_response(question: str) -> dict:
                     ),
                     ("human", "{question}")
                 ])
-                
+
                 chain = prompt | llm
+                started = time.perf_counter()
                 response = chain.invoke({"question": question})
-                
+                timings["llm"] = (time.perf_counter() - started) * 1000
+
                 return {
                     "response": response.content,
                     "score": score,
                     "type": "llm_response"
                 }
-    
+
     except Exception as e:
         print(f"Error: {str(e)}")
         return None
 
-def main():
-    """
-    Exécute l'évaluation sur un échantillon aléatoire.
-    """
-    samples = load_random_samples(10)
-    
-    results = []
-    for _, row in samples.iterrows():
-        question = row['question']
-        true_answer = row['answer']
-        
-        chatbot_response = get_chatbot_response(question)
-        
-        metrics = evaluate_response(question, true_answer, chatbot_response)
-        
-        results.append({
-            "question": question,
-            "true_answer": true_answer,
-            "chatbot_response": chatbot_response,
-            **metrics
-        })
-    
-    display_evaluation_results(results)
+# 🔹 Remplaçants hors ligne (pas de Cloud SQL, de Vertex AI ni de Gemini)
+def build_offline_pipeline(corpus: pd.DataFrame, llm_latency_ms: float = 0.0, embedding_latency_ms: float = 0.0):
+    """
+    Vector store en mémoire sur le corpus avec des embeddings simulés, et un LLM simulé de latence fixe.
+    Retourne (vector_store, get_llm, encode, encode_batch) pour get_chatbot_response et le scoring.
+    """
+    from langchain_core.documents import Document
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    from langchain_core.vectorstores import InMemoryVectorStore
+
+    class FakeEmbeddings(DeterministicFakeEmbedding):
+        def embed_query(self, text):
+            time.sleep(embedding_latency_ms / 1000)
+            return super().embed_query(text)
+
+    class DistanceVectorStore(InMemoryVectorStore):
+        # Scores en distance cosinus, comme PostgresVectorStore (le seuil 0.2 de get_chatbot_response en dépend)
+        def similarity_search_with_score_by_vector(self, embedding, k=4, **kwargs):
+            return [(doc, 1.0 - score) for doc, score in super().similarity_search_with_score_by_vector(embedding, k, **kwargs)]
+
+    class FakeLLM(FakeListChatModel):
+        def _call(self, messages, stop=None, run_manager=None, **kwargs):
+            time.sleep(llm_latency_ms / 1000)
+            # Réponse déterministe : la référence quand le prompt en fournit une, sinon la question
+            return messages[0].content.split("Voici une réponse de référence :")[-1].split("\n")[0].strip()
+
+    vector_store = DistanceVectorStore(FakeEmbeddings(size=256))
+    rows = corpus.fillna("")
+    # Vecteurs calculés sans la latence simulée : seule la phase d'évaluation est mesurée
+    vectors = DeterministicFakeEmbedding(size=256).embed_documents(rows["question"].tolist())
+    vector_store.store = {
+        str(index): {
+            "id": str(index),
+            "vector": vector,
+            "text": row["question"],
+            "metadata": {"answer": row["answer"], "source": row["source"], "focus_area": row["focus_area"]},
+        }
+        for (index, row), vector in zip(rows.iterrows(), vectors)
+    }
+    fake_llm = FakeLLM(responses=[""])
+    scorer = DeterministicFakeEmbedding(size=384)
+    return vector_store, (lambda temperature=0.0: fake_llm), scorer.embed_query, scorer.embed_documents
+
+def build_offline_reranker(latency_ms: float = 0.0) -> Reranker:
+    """
+    Reranker sans modèle : recouvrement de mots entre question et passage, avec une latence fixe par lot.
+    """
+    def score_pairs(pairs):
+        time.sleep(latency_ms / 1000)
+        scores = []
+        for query, passage in pairs:
+            query_words, passage_words = set(query.lower().split()), set(passage.lower().split())
+            scores.append(len(query_words & passage_words) / (len(query_words) or 1))
+        return scores
+    return Reranker(score_pairs, max_inflight=0, budget_ms=0)
+
+def evaluate_sample(row, vector_store, get_llm, reranker: Reranker | None = None, candidates: int = RERANK_CANDIDATES) -> dict:
+    """
+    Réponse du chatbot pour un exemple et durées des étapes ; la pertinence est calculée ensuite, par lot.
+    """
+    question = row['question']
+    true_answer = row['answer']
+    timings = {}
+
+    chatbot_response, response_time = measure_response_time(
+        get_chatbot_response, question, vector_store, get_llm, timings, reranker, candidates
+    )
+
+    return {
+        "question": question,
+        "true_answer": true_answer,
+        "chatbot_response": chatbot_response,
+        "response_time": response_time,
+        **{f"{stage}_ms": round(timings.get(stage, 0.0), 3) for stage in STAGES if stage != "scoring"}
+    }
+
+def check_batch_scoring(results, encode=None) -> float:
+    """
+    Écart maximal entre le score par lot et calculate_relevance paire par paire (doit rester à l'arrondi flottant).
+    """
+    per_pair = [
+        evaluate_response(r["question"], r["true_answer"], r["chatbot_response"], r["response_time"], encode)["relevance_score"]
+        for r in results
+    ]
+    return float(max((abs(r["relevance_score"] - score) for r, score in zip(results, per_pair)), default=0.0))
+
+def summarize_latencies(results, wall_time: float) -> dict:
+    """
+    Percentiles p50/p95/p99 par étape et de bout en bout, et débit en exemples par seconde.
+    """
+    summary = {"samples": len(results), "wall_time_s": round(wall_time, 3),
+               "throughput_per_s": round(len(results) / wall_time, 3) if wall_time else None}
+    for column in [f"{stage}_ms" for stage in STAGES] + ["total_ms"]:
+        values = [r[column] for r in results]
+        for p in (50, 95, 99):
+            summary[f"{column[:-3]}_p{p}_ms"] = round(float(np.percentile(values, p)), 3) if values else None
+    summary["relevance_mean"] = round(float(np.mean([r["relevance_score"] for r in results])), 4) if results else None
+    return summary
+
+def write_results(results, summary: dict, output: str) -> None:
+    """
+    Écrit <output>.jsonl et <output>.csv (un exemple par ligne) et <output>_summary.json, pour comparer les runs.
+    """
+    os.makedirs(os.path.dirname(output) or ".", exist_ok=True)
+    with open(f"{output}.jsonl", "w", encoding="utf-8") as f:
+        for result in results:
+            f.write(json.dumps(result, ensure_ascii=False, default=str) + "\n")
+    rows = [{**r, "chatbot_response": json.dumps(r["chatbot_response"], ensure_ascii=False, default=str)} for r in results]
+    pd.DataFrame(rows).to_csv(f"{output}.csv", index=False)
+    with open(f"{output}_summary.json", "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+
+def run_evaluation(samples, vector_store, get_llm, reranker, args, encode_batch, namespace):
+    """
+    Évalue les exemples, `workers` à la fois, puis calcule la pertinence par lot ; retourne (résultats, durée totale).
+    """
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        # map conserve l'ordre des exemples
+        results = list(executor.map(
+            lambda row: evaluate_sample(row, vector_store, get_llm, reranker, args.rerank_candidates),
+            [row for _, row in samples.iterrows()]
+        ))
+    score_results(results, encode_batch, namespace, args.reference_cache or None)
+    return results, time.perf_counter() - started
+
+def compare_summaries(summaries: dict) -> None:
+    """
+    Latence de bout en bout et pertinence avec et sans reranking, côte à côte.
+    """
+    print("\n⚖️ Reranking : off / on (écart)")
+    for key in ["total_p50_ms", "total_p95_ms", "total_p99_ms", "rerank_p50_ms", "llm_p50_ms", "relevance_mean", "throughput_per_s"]:
+        off, on = summaries["off"].get(key), summaries["on"].get(key)
+        delta = round(on - off, 4) if off is not None and on is not None else None
+        print(f"{key}: {off} / {on} ({delta:+})" if delta is not None else f"{key}: {off} / {on}")
+
+def main(args=None):
+    """
+    Exécute l'évaluation sur un échantillon aléatoire, sans reranking, avec, ou les deux pour les comparer.
+    """
+    args = args or parse_args([])
+    samples = load_random_samples(args.samples, args.csv)
+
+    if args.fake:
+        corpus = pd.read_csv(args.csv, usecols=["question", "answer", "source", "focus_area"])
+        vector_store, get_llm, encode, encode_batch = build_offline_pipeline(
+            corpus, args.fake_llm_latency_ms, args.fake_embedding_latency_ms
+        )
+        namespace = "fake-384"
+    else:
+        from api import get_llm, get_store
+        vector_store = get_store()
+        encode, encode_batch, namespace = None, None, BERT_MODEL_NAME
+
+    summaries = {}
+    for mode in (["off", "on"] if args.rerank == "both" else [args.rerank]):
+        reranker = None
+        if mode == "on":
+            # Toujours reclasser pendant le benchmark : pas de garde-fou de charge ni de budget de latence
+            reranker = build_offline_reranker(args.fake_rerank_latency_ms) if args.fake \
+                else Reranker(cross_encoder_scores, max_inflight=0, budget_ms=0)
+        results, wall_time = run_evaluation(samples, vector_store, get_llm, reranker, args, encode_batch, namespace)
+
+        display_evaluation_results(results)
+        summary = {
+            "run_at": datetime.now().isoformat(timespec="seconds"),
+            "fake": args.fake,
+            "workers": args.workers,
+            "rerank": mode,
+            "rerank_candidates": args.rerank_candidates if reranker else None,
+            **summarize_latencies(results, wall_time)
+        }
+        if args.check_scoring:
+            summary["scoring_max_abs_diff"] = check_batch_scoring(results, encode)
+        print(f"\n⏱️ Latences (ms) et débit (reranking {mode}) :")
+        for key, value in summary.items():
+            print(f"{key}: {value}")
+        if args.output:
+            output = f"{args.output}_rerank_{mode}" if args.rerank == "both" else args.output
+            write_results(results, summary, output)
+            print(f"\n💾 Résultats écrits dans {output}.jsonl / .csv / _summary.json")
+        summaries[mode] = summary
+
+    if args.rerank == "both":
+        compare_summaries(summaries)
+        return summaries
+    return summaries[args.rerank]
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Évaluation instrumentée d'AstraMed (latence par étape, débit, pertinence).")
+    parser.add_argument("--csv", default="./downloaded_files/medquadd.csv", help="Dataset MedQuAD")
+    parser.add_argument("--samples", type=int, default=10, help="Nombre d'exemples évalués")
+    parser.add_argument("--workers", type=int, default=4, help="Exemples évalués en parallèle")
+    parser.add_argument("--output", default=f"./eval_results/run_{datetime.now():%Y%m%d_%H%M%S}",
+                        help="Préfixe des fichiers de résultats (vide pour ne rien écrire)")
+    parser.add_argument("--reference-cache", default=REFERENCE_CACHE_PATH,
+                        help="Cache SQLite des embeddings de référence (vide pour le désactiver)")
+    parser.add_argument("--check-scoring", action="store_true",
+                        help="Compare le score par lot au calcul paire par paire et rapporte l'écart maximal")
+    parser.add_argument("--fake", action="store_true", help="Hors ligne : vector store, embeddings et LLM simulés")
+    parser.add_argument("--fake-llm-latency-ms", type=float, default=200.0, help="Latence du LLM simulé")
+    parser.add_argument("--fake-embedding-latency-ms", type=float, default=20.0, help="Latence des embeddings simulés")
+    parser.add_argument("--rerank", choices=["off", "on", "both"], default="off",
+                        help="Reranking par cross-encoder : sans, avec, ou les deux runs sur les mêmes exemples")
+    parser.add_argument("--rerank-candidates", type=int, default=RERANK_CANDIDATES, help="Candidats reclassés par question")
+    parser.add_argument("--fake-rerank-latency-ms", type=float, default=30.0, help="Latence du reranker simulé, par lot")
+    return parser.parse_args(argv)
 
 if __name__ == "__main__":
-    main()
+    main(parse_args())
@@ -0,0 +1,176 @@
+import asyncio
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+
+from observability import get_logger
+
+logger = get_logger()
+
+FEEDBACK_COLUMNS = ["created_at", "session_id", "question", "rating", "comments", "focus_area", "source", "response_type"]
+
+
+class FeedbackStore:
+    """
+    Stockage durable des avis (👍/👎) : une table SQLite, écrite par lots.
+    """
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS feedback ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, created_at REAL NOT NULL, session_id TEXT, question TEXT, "
+                "rating INTEGER NOT NULL, comments TEXT, focus_area TEXT, source TEXT, response_type TEXT)"
+            )
+            self._conn.commit()
+
+    def write_many(self, records: List[dict]) -> None:
+        if not records:
+            return
+        placeholders = ",".join("?" for _ in FEEDBACK_COLUMNS)
+        with self._lock:
+            self._conn.executemany(
+                f"INSERT INTO feedback ({','.join(FEEDBACK_COLUMNS)}) VALUES ({placeholders})",
+                [tuple(record.get(column) for column in FEEDBACK_COLUMNS) for record in records],
+            )
+            self._conn.commit()
+
+    def aggregate(self) -> dict:
+        """
+        Taux d'approbation global, par focus_area et par source.
+        """
+        report = {}
+        with self._lock:
+            total, approvals = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(rating), 0) FROM feedback").fetchone()
+            report["total"] = {"count": total, "approvals": approvals, "approval_rate": round(approvals / total, 4) if total else None}
+            for column in ("focus_area", "source"):
+                rows = self._conn.execute(
+                    f"SELECT COALESCE(NULLIF({column}, ''), 'Inconnu'), COUNT(*), SUM(rating) FROM feedback "
+                    f"GROUP BY 1 ORDER BY COUNT(*) DESC"
+                ).fetchall()
+                report[f"by_{column}"] = [
+                    {column: value, "count": count, "approvals": ok, "approval_rate": round(ok / count, 4)}
+                    for value, count, ok in rows
+                ]
+        return report
+
+
+class FeedbackSink:
+    """
+    File d'attente bornée entre /feedback et le FeedbackStore.
+
+    submit() ne fait qu'un put_nowait : la latence de la requête ne dépend pas du stockage. Une tâche de fond
+    écrit les avis par lots (batch_size avis ou flush_interval secondes). Si le stockage est lent ou en panne,
+    le lot est réessayé et la file se remplit ; une fois pleine, submit() refuse (l'appelant répond 503).
+    close() vide la file avant l'arrêt du serveur.
+    """
+
+    def __init__(self, store: FeedbackStore, max_queue: int = 10000, batch_size: int = 100, flush_interval: float = 2.0):
+        self.store = store
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._inflight: List[dict] = []  # Lot retiré de la file mais pas encore écrit
+        self._closing = False
+        self.accepted = 0
+        self.rejected = 0
+        self.written = 0
+        self.flushes = 0
+        self.failures = 0
+        self.last_flush_seconds = 0.0
+
+    def start(self) -> None:
+        # Démarrée par le lifespan, ou au premier avis reçu (la file est liée à la boucle en cours)
+        if self._task is None or self._task.done():
+            self._queue = self._queue or asyncio.Queue(maxsize=self.max_queue)
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def submit(self, record: dict) -> bool:
+        if self._closing:
+            self.rejected += 1
+            return False
+        self.start()
+        try:
+            self._queue.put_nowait({"created_at": time.time(), **record})
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return False
+        self.accepted += 1
+        return True
+
+    async def _next_batch(self) -> List[dict]:
+        # Attend le premier avis, puis complète le lot jusqu'à batch_size ou flush_interval
+        self._inflight = [await self._queue.get()]
+        deadline = time.monotonic() + self.flush_interval
+        while len(self._inflight) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._closing:
+                # À l'arrêt, on prend ce qui reste sans attendre
+                while len(self._inflight) < self.batch_size and not self._queue.empty():
+                    self._inflight.append(self._queue.get_nowait())
+                break
+            try:
+                self._inflight.append(await asyncio.wait_for(self._queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        return self._inflight
+
+    async def _write(self, batch: List[dict]) -> None:
+        # Réessaie le même lot tant que le stockage échoue : les nouveaux avis restent dans la file bornée
+        while True:
+            started = time.perf_counter()
+            try:
+                await asyncio.to_thread(self.store.write_many, batch)
+            except Exception:
+                self.failures += 1
+                logger.exception("écriture des feedbacks impossible, nouvel essai", extra={"batch": len(batch)})
+                await asyncio.sleep(self.flush_interval)
+                continue
+            self.last_flush_seconds = time.perf_counter() - started
+            self.written += len(batch)
+            self.flushes += 1
+            self._inflight = []
+            return
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._next_batch()
+            await self._write(batch)
+
+    async def close(self, timeout: float = 30.0) -> None:
+        """
+        Refuse les nouveaux avis, laisse la tâche de fond vider la file (au plus `timeout` secondes) puis l'arrête.
+        """
+        self._closing = True
+        if self._task is None:
+            return
+        deadline = time.monotonic() + timeout
+        while (self._inflight or not self._queue.empty()) and time.monotonic() < deadline and not self._task.done():
+            await asyncio.sleep(0.05)
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        lost = len(self._inflight) + self._queue.qsize()
+        if lost:
+            logger.error("feedbacks non écrits à l'arrêt", extra={"lost": lost})
+
+    def stats(self) -> dict:
+        return {
+            "queued": self._queue.qsize() if self._queue is not None else 0,
+            "max_queue": self.max_queue,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "written": self.written,
+            "flushes": self.flushes,
+            "failures": self.failures,
+            "last_flush_ms": round(self.last_flush_seconds * 1000, 3),
+        }
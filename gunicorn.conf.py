@@ -0,0 +1,44 @@
+"""
+Mode production de l'API : plusieurs workers uvicorn derrière gunicorn, qui partagent l'état lourd.
+
+    gunicorn -c gunicorn.conf.py api:app
+
+- index vectoriel local et index BM25 : fichiers mappés en mémoire, une seule copie dans le cache de pages ;
+- caches d'embeddings et de réponses, sessions : fichiers SQLite communs dans SHARED_STATE_DIR ;
+- métriques Prometheus agrégées sur tous les workers (PROMETHEUS_MULTIPROC_DIR).
+
+Les variables d'environnement déjà définies gardent la priorité sur les valeurs par défaut ci-dessous.
+"""
+import os
+import shutil
+
+# 🔹 Workers : WEB_CONCURRENCY, sinon un par cœur (au moins 2 pour qu'un worker bloqué ne bloque pas tout)
+workers = int(os.getenv("WEB_CONCURRENCY", 0)) or max(2, os.cpu_count() or 1)
+worker_class = "uvicorn.workers.UvicornWorker"
+bind = os.getenv("BIND", "0.0.0.0:8181")
+timeout = int(os.getenv("WORKER_TIMEOUT", 120))  # Une réponse de l'agent peut prendre plusieurs dizaines de secondes
+graceful_timeout = 30
+keepalive = 5
+# api est importé une fois dans le master puis hérité par fork ; modèles, connexions Cloud SQL et
+# threads sont créés par le lifespan de chaque worker, jamais avant le fork
+preload_app = True
+
+# 🔹 État partagé entre workers (défini avant l'import de config.py par preload_app)
+SHARED_STATE_DIR = os.getenv("SHARED_STATE_DIR", "/tmp/astramed")
+os.makedirs(SHARED_STATE_DIR, exist_ok=True)
+os.environ.setdefault("EMBEDDING_CACHE_PATH", os.path.join(SHARED_STATE_DIR, "embeddings.sqlite3"))
+# LRU réduit dans chaque worker : le tier SQLite commun garde les autres embeddings
+os.environ.setdefault("EMBEDDING_CACHE_SIZE", "2000")
+os.environ.setdefault("RESPONSE_CACHE_PATH", os.path.join(SHARED_STATE_DIR, "responses.sqlite3"))
+os.environ.setdefault("SESSION_DB_PATH", os.path.join(SHARED_STATE_DIR, "sessions.sqlite3"))
+os.environ.setdefault("SESSION_SHARED", "1")
+
+# 🔹 Métriques : un fichier par worker, vidé à chaque démarrage du serveur
+os.environ.setdefault("PROMETHEUS_MULTIPROC_DIR", os.path.join(SHARED_STATE_DIR, "metrics"))
+shutil.rmtree(os.environ["PROMETHEUS_MULTIPROC_DIR"], ignore_errors=True)
+os.makedirs(os.environ["PROMETHEUS_MULTIPROC_DIR"], exist_ok=True)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
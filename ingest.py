@@ -1,13 +1,37 @@
 import os
 from dotenv import load_dotenv
 from langchain_google_cloud_sql_pg import PostgresEngine, PostgresVectorStore
-from langchain_google_vertexai import VertexAIEmbeddings
+from langchain_google_cloud_sql_pg.indexes import HNSWIndex, IVFFlatIndex, HNSWQueryOptions, QueryOptions
+from langchain_core.embeddings import Embeddings
+from sqlalchemy import event, text
 from sqlalchemy.exc import ProgrammingError
+from sqlalchemy.ext.asyncio import AsyncEngine
 import asyncio
+import argparse
+import hashlib
+import json
+import threading
+import time
+import uuid
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+import numpy as np
+import pandas as pd
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.vectorstores import InMemoryVectorStore, VectorStore
+from cache import CachedEmbeddings
+from config import (
+    EMBEDDING_MODEL, EMBEDDING_CACHE_SIZE, EMBEDDING_CACHE_PATH, VECTOR_INDEX_NAME, VECTOR_BACKEND, LOCAL_INDEX_PATH,
+    LEXICAL_INDEX_PATH,
+    DATABASE_URL, DB_POOL_SIZE, DB_POOL_MAX_OVERFLOW, DB_POOL_MIN_CONNECTIONS, DB_POOL_RECYCLE, DB_POOL_PRE_PING,
+    DB_POOL_TIMEOUT
+)
+from local_store import LocalVectorStore
 
 # 🔹 Charger les variables d'environnement
 load_dotenv()
-DB_PASSWORD = os.environ["DB_PASSWORD"]
+DB_PASSWORD = os.getenv("DB_PASSWORD")
 
 # 🔹 Informations Cloud SQL
 PROJECT_ID = "my-dproject-452220"
@@ -16,24 +40,145 @@ REGION = "europe-west1"
 DATABASE = "health_database"
 DB_USER = "postgres"
 TABLE_NAME = "elyes_med"
+ID_COLUMN = "langchain_id"  # Clé primaire (UUID) créée par init_vectorstore_table, lue par PostgresVectorStore
 
-# 🔹 Initialiser l'embedding model
-def get_embeddings() -> VertexAIEmbeddings:
-    return VertexAIEmbeddings(
-        model_name="textembedding-gecko@latest",
+# 🔹 Initialiser l'embedding model (derrière le cache LRU + SQLite)
+def get_embeddings() -> Embeddings:
+    # Import local : le SDK Vertex AI coûte plusieurs secondes au démarrage
+    from langchain_google_vertexai import VertexAIEmbeddings
+    embeddings = VertexAIEmbeddings(
+        model_name=EMBEDDING_MODEL,
         project=PROJECT_ID
     )
+    if EMBEDDING_CACHE_SIZE <= 0:
+        return embeddings
+    return CachedEmbeddings(
+        embeddings,
+        model_name=EMBEDDING_MODEL,
+        max_size=EMBEDDING_CACHE_SIZE,
+        persist_path=EMBEDDING_CACHE_PATH or None
+    )
 
 # 🔹 Connexion à la base de données
+def get_engine_args() -> dict:
+    """
+    Réglages du pool SQLAlchemy de l'engine (create_async_engine).
+    """
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_POOL_MAX_OVERFLOW,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+        "pool_timeout": DB_POOL_TIMEOUT,
+    }
+
 def create_cloud_sql_database_connection() -> PostgresEngine:
-    return PostgresEngine.from_instance(
-        project_id=PROJECT_ID,
-        instance=INSTANCE,
-        region=REGION,
-        database=DATABASE,
-         user=DB_USER,
-        password=DB_PASSWORD,
-    )
+    # DATABASE_URL : Postgres local (pgvector en Docker) à la place de l'instance Cloud SQL
+    if DATABASE_URL:
+        engine = PostgresEngine.from_engine_args(DATABASE_URL, **get_engine_args())
+    else:
+        if not DB_PASSWORD:
+            raise ValueError("DB_PASSWORD is missing. Please set it in the environment variables.")
+        engine = PostgresEngine.from_instance(
+            project_id=PROJECT_ID,
+            instance=INSTANCE,
+            region=REGION,
+            database=DATABASE,
+             user=DB_USER,
+            password=DB_PASSWORD,
+            engine_args=get_engine_args(),
+        )
+    pool_metrics[engine] = PoolMetrics(get_async_engine(engine))
+    return engine
+
+def get_async_engine(engine: PostgresEngine) -> AsyncEngine:
+    """
+    Engine SQLAlchemy (et son pool) de PostgresEngine, pour les métriques, le préchauffage et les requêtes SQL directes.
+
+    langchain-google-cloud-sql-pg ne l'expose pas publiquement : l'attribut privé `_pool` et la boucle de
+    `_run_as_sync` sont ceux de la version épinglée dans requirements.txt (0.13.x), vérifiés ici.
+    """
+    async_engine = getattr(engine, "_pool", None)
+    if not isinstance(async_engine, AsyncEngine) or not callable(getattr(engine, "_run_as_sync", None)):
+        raise RuntimeError(
+            "PostgresEngine sans engine SQLAlchemy accessible : version de langchain-google-cloud-sql-pg "
+            "non prise en charge (épinglée à 0.13.x dans requirements.txt)."
+        )
+    return async_engine
+
+def run_on_engine(engine: PostgresEngine, coro):
+    # Les connexions asyncpg appartiennent à la boucle de fond de PostgresEngine : les coroutines SQL y sont exécutées
+    get_async_engine(engine)
+    return engine._run_as_sync(coro)
+
+class PoolMetrics:
+    """
+    Compteurs des événements du pool de connexions d'un engine : ouvertures, emprunts, retours, invalidations.
+    """
+
+    def __init__(self, async_engine):
+        self._lock = threading.Lock()
+        self.counters = {"connects": 0, "checkouts": 0, "checkins": 0, "invalidations": 0}
+        self.warm_up: dict = {}
+        for event_name, counter in [("connect", "connects"), ("checkout", "checkouts"),
+                                    ("checkin", "checkins"), ("invalidate", "invalidations")]:
+            event.listen(async_engine.sync_engine, event_name, self._counter(counter))
+
+    def _counter(self, name: str):
+        def increment(*args):
+            with self._lock:
+                self.counters[name] += 1
+        return increment
+
+# Métriques par engine, sans empêcher sa libération
+pool_metrics: "weakref.WeakKeyDictionary[PostgresEngine, PoolMetrics]" = weakref.WeakKeyDictionary()
+
+def get_pool_stats(engine: PostgresEngine) -> dict:
+    """
+    Occupation du pool (connexions ouvertes, empruntées, débordement) et compteurs d'événements.
+    """
+    pool = get_async_engine(engine).sync_engine.pool
+    checked_out = pool.checkedout()
+    max_connections = DB_POOL_SIZE + DB_POOL_MAX_OVERFLOW
+    metrics = pool_metrics.get(engine)
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_POOL_MAX_OVERFLOW,
+        "open_connections": pool.checkedin() + checked_out,
+        "idle_connections": pool.checkedin(),
+        "checked_out": checked_out,
+        "overflow": max(pool.overflow(), 0),
+        "utilization": round(checked_out / max_connections, 4) if max_connections else None,
+        **(metrics.counters if metrics else {}),
+        "warm_up": metrics.warm_up if metrics else {},
+    }
+
+async def aopen_connections(engine: PostgresEngine, count: int) -> None:
+    # Ouvre `count` connexions en même temps (handshake du connecteur en parallèle) puis les rend au pool
+    async_engine = get_async_engine(engine)
+    connections = await asyncio.gather(*(async_engine.connect().start() for _ in range(count)))
+    try:
+        for connection in connections:
+            await connection.execute(text("SELECT 1"))
+    finally:
+        for connection in connections:
+            await connection.close()
+
+def warm_up_engine(engine: PostgresEngine, vector_store: VectorStore | None = None,
+                   min_connections: int = DB_POOL_MIN_CONNECTIONS) -> dict:
+    """
+    Préchauffe le pool au démarrage : ouvre `min_connections` connexions puis fait une recherche vectorielle triviale.
+    """
+    started = time.perf_counter()
+    run_on_engine(engine, aopen_connections(engine, min(min_connections, DB_POOL_SIZE)))
+    stats = {"connections": min(min_connections, DB_POOL_SIZE), "connect_ms": round((time.perf_counter() - started) * 1000, 1)}
+    if vector_store is not None:
+        started = time.perf_counter()
+        vector_store.similarity_search("warm-up", k=1)
+        stats["vector_query_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    if engine in pool_metrics:
+        pool_metrics[engine].warm_up = stats
+    return stats
 
 # 🔹 Création de la table si elle n'existe pas
 async def create_table_if_not_exists(table_name: str, engine: PostgresEngine) -> None:
@@ -41,35 +186,425 @@ async def create_table_if_not_exists(table_name: str, engine: PostgresEngine) ->
         await engine.init_vectorstore_table(
             table_name=table_name,  
             vector_size=768,
+            id_column=ID_COLUMN,
         )
         print(f"✅ Table '{table_name}' créée avec succès (ou déjà existante).")
     except ProgrammingError:
         print(f"⚠ La table '{table_name}' existe déjà.")
 
-# 🔹 Récupérer le vector store
-def get_vector_store(engine: PostgresEngine, table_name: str, embedding: VertexAIEmbeddings) -> PostgresVectorStore:
+# 🔹 Récupérer le vector store (pgvector sur Cloud SQL ou index local, selon VECTOR_BACKEND)
+def get_vector_store(
+    engine: PostgresEngine | None, table_name: str, embedding: Embeddings, index_query_options: QueryOptions | None = None
+) -> VectorStore:
+    if VECTOR_BACKEND == "local":
+        return LocalVectorStore(embedding, LOCAL_INDEX_PATH)
+    return get_postgres_vector_store(engine, table_name, embedding, index_query_options)
+
+def get_postgres_vector_store(
+    engine: PostgresEngine, table_name: str, embedding: Embeddings, index_query_options: QueryOptions | None = None
+) -> PostgresVectorStore:
     return PostgresVectorStore.create_sync(
         engine=engine,
         table_name=table_name,
         embedding_service=embedding,
+        id_column=ID_COLUMN,
+        index_query_options=index_query_options,
     )
 
+# 🔹 Index ANN (HNSW / IVFFlat) sur la colonne d'embeddings
+@dataclass
+class IVFFlatProbesOptions(QueryOptions):
+    # IVFFlatQueryOptions de langchain_google_cloud_sql_pg génère "ivflfat.probes" : on écrit le bon paramètre
+    probes: int = 1
+
+    def to_string(self) -> str:
+        return f"ivfflat.probes = {self.probes}"
+
+@dataclass
+class ExactSearchOptions(QueryOptions):
+    # Désactive les index : parcours séquentiel exact, référence du benchmark de rappel
+    def to_string(self) -> str:
+        return "enable_indexscan = off"
+
+def get_index_query_options(ef_search: int | None = None, probes: int | None = None) -> QueryOptions | None:
+    if ef_search is not None:
+        return HNSWQueryOptions(ef_search=ef_search)
+    if probes is not None:
+        return IVFFlatProbesOptions(probes=probes)
+    return None
+
+_tuned_vector_stores: dict = {}
+
+def get_tuned_vector_store(
+    vector_store: PostgresVectorStore, ef_search: int | None = None, probes: int | None = None, table_name: str = TABLE_NAME
+) -> PostgresVectorStore:
+    """
+    Retourne une variante du vector store qui applique ef_search (HNSW) ou probes (IVFFlat) à chaque requête.
+
+    Les options sont portées par l'instance du vector store : une variante est créée par combinaison
+    de paramètres puis réutilisée, pour ne jamais modifier le vector store partagé entre requêtes.
+    """
+    options = get_index_query_options(ef_search, probes)
+    if options is None or not isinstance(vector_store, PostgresVectorStore):
+        return vector_store
+    key = (id(vector_store), table_name, options.to_string())
+    if key not in _tuned_vector_stores:
+        _tuned_vector_stores[key] = get_postgres_vector_store(
+            vector_store._engine, table_name, vector_store.embeddings, index_query_options=options
+        )
+    return _tuned_vector_stores[key]
+
+def build_vector_index(
+    vector_store: PostgresVectorStore,
+    index_type: str = "hnsw",
+    m: int = 16,
+    ef_construction: int = 64,
+    lists: int = 100,
+    rebuild: bool = False
+) -> None:
+    """
+    Crée l'index ANN de la table, ou le reconstruit avec de nouveaux paramètres si `rebuild` est vrai.
+
+    Args:
+        index_type (str): "hnsw" ou "ivfflat".
+        m (int), ef_construction (int): Paramètres de construction HNSW.
+        lists (int): Nombre de listes IVFFlat (de l'ordre de lignes / 1000).
+        rebuild (bool): Supprimer l'index existant avant de le recréer.
+    """
+    if index_type == "hnsw":
+        index = HNSWIndex(name=VECTOR_INDEX_NAME, m=m, ef_construction=ef_construction)
+    elif index_type == "ivfflat":
+        index = IVFFlatIndex(name=VECTOR_INDEX_NAME, lists=lists)
+    else:
+        raise ValueError(f"Type d'index inconnu : {index_type}")
+
+    if vector_store.is_valid_index(VECTOR_INDEX_NAME):
+        if not rebuild:
+            print(f"⚠ L'index '{VECTOR_INDEX_NAME}' existe déjà (utilisez --rebuild-index pour le recréer).")
+            return
+        vector_store.drop_vector_index(VECTOR_INDEX_NAME)
+    vector_store.apply_vector_index(index)
+    print(f"✅ Index {index_type} '{VECTOR_INDEX_NAME}' créé : {index.index_options()}")
+
+def benchmark_vector_index(
+    vector_store: PostgresVectorStore,
+    queries: list[str],
+    k: int = 3,
+    ef_search_values: list[int] | None = None,
+    probes_values: list[int] | None = None,
+    table_name: str = TABLE_NAME
+) -> list[dict]:
+    """
+    Compare la recherche indexée à la recherche exacte : rappel@k et latence moyenne/p95 par réglage.
+
+    Les embeddings des requêtes sont calculés une seule fois pour ne mesurer que la recherche dans Postgres.
+    """
+    vectors = [vector_store.embeddings.embed_query(query) for query in queries]
+    exact_store = get_postgres_vector_store(vector_store._engine, table_name, vector_store.embeddings, ExactSearchOptions())
+
+    def run(store: PostgresVectorStore) -> tuple[list[set], list[float]]:
+        results, latencies = [], []
+        for vector in vectors:
+            started = time.perf_counter()
+            docs = store.similarity_search_by_vector(vector, k=k)
+            latencies.append((time.perf_counter() - started) * 1000)
+            results.append({doc.page_content for doc in docs})
+        return results, latencies
+
+    exact_results, exact_latencies = run(exact_store)
+    report = []
+
+    def add_row(label: str, results: list[set], latencies: list[float]) -> None:
+        recall = np.mean([len(found & truth) / max(len(truth), 1) for found, truth in zip(results, exact_results)])
+        report.append({
+            "setting": label,
+            f"recall@{k}": round(float(recall), 4),
+            "mean_ms": round(float(np.mean(latencies)), 2),
+            "p95_ms": round(float(np.percentile(latencies, 95)), 2),
+        })
+
+    add_row("exact", exact_results, exact_latencies)
+    for ef_search in ef_search_values or []:
+        add_row(f"ef_search={ef_search}", *run(get_tuned_vector_store(vector_store, ef_search=ef_search, table_name=table_name)))
+    for probes in probes_values or []:
+        add_row(f"probes={probes}", *run(get_tuned_vector_store(vector_store, probes=probes, table_name=table_name)))
+    return report
+
+# 🔹 Ingestion par lots du CSV MedQuAD
+class PrefetchedEmbeddings(Embeddings):
+    """
+    Service d'embeddings du vector store d'ingestion : sert les vecteurs déjà calculés en parallèle
+    par les workers, et ne délègue au vrai service que les textes absents.
+    """
+
+    def __init__(self, embeddings: Embeddings):
+        self.embeddings = embeddings
+        self._vectors: dict = {}
+        self._lock = threading.Lock()
+
+    def prefetch(self, texts: list[str]) -> None:
+        vectors = self.embeddings.embed_documents(texts)
+        with self._lock:
+            self._vectors.update(zip(texts, vectors))
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        with self._lock:
+            found = {text: self._vectors.pop(text) for text in texts if text in self._vectors}
+        missing = [text for text in texts if text not in found]
+        if missing:
+            found.update(zip(missing, self.embeddings.embed_documents(missing)))
+        return [found[text] for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embeddings.embed_query(text)
+
+
+def content_id(question: str, answer: str, source: str, focus_area: str) -> str:
+    """
+    Identifiant déterministe (UUID) dérivé du contenu : une ligne inchangée garde le même ID d'une exécution à l'autre.
+    """
+    digest = hashlib.sha256("\x1f".join([question, answer, source, focus_area]).encode("utf-8")).hexdigest()
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, digest))
+
+
+def iter_csv_chunks(csv_path: str, chunk_size: int, start_row: int = 0):
+    """
+    Lit le CSV par blocs de `chunk_size` lignes à partir de `start_row`, sans le charger entièrement en mémoire.
+    Chaque bloc est une liste de (texte, métadonnées, id).
+    """
+    reader = pd.read_csv(
+        csv_path,
+        usecols=["question", "answer", "source", "focus_area"],
+        skiprows=range(1, start_row + 1),
+        chunksize=chunk_size
+    )
+    for df in reader:
+        # L'index de pandas repart de 0 après les lignes sautées : on le recale sur le CSV
+        df.index += start_row
+        rows_done = int(df.index[-1]) + 1
+        df = df.dropna(subset=["question"]).fillna({
+            "answer": "Pas de réponse disponible",
+            "source": "Inconnue",
+            "focus_area": "Non catégorisé"
+        })
+        ids = [
+            content_id(question, answer, source, focus_area)
+            for question, answer, source, focus_area in zip(df["question"], df["answer"], df["source"], df["focus_area"])
+        ]
+        rows = [
+            (
+                question,
+                {"answer": answer, "source": source, "focus_area": focus_area, "row_index": int(index), "content_id": doc_id},
+                doc_id
+            )
+            for index, question, answer, source, focus_area, doc_id in zip(
+                df.index, df["question"], df["answer"], df["source"], df["focus_area"], ids
+            )
+        ]
+        yield rows, rows_done
+
+
+def load_checkpoint(checkpoint_path: str, csv_path: str) -> int:
+    if not checkpoint_path or not os.path.exists(checkpoint_path):
+        return 0
+    with open(checkpoint_path, "r") as f:
+        checkpoint = json.load(f)
+    # Un checkpoint d'un autre fichier CSV ne doit pas faire sauter de lignes
+    if checkpoint.get("csv") != os.path.abspath(csv_path):
+        return 0
+    return int(checkpoint.get("rows_done", 0))
+
+
+def save_checkpoint(checkpoint_path: str, csv_path: str, rows_done: int) -> None:
+    if not checkpoint_path:
+        return
+    tmp_path = checkpoint_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump({"csv": os.path.abspath(csv_path), "rows_done": rows_done}, f)
+    os.replace(tmp_path, checkpoint_path)  # Écriture atomique : pas de checkpoint corrompu après un crash
+
+
+async def aselect_existing_ids(engine: PostgresEngine, table_name: str, ids: list[str]) -> set:
+    async with get_async_engine(engine).connect() as conn:
+        result = await conn.execute(
+            text(f'SELECT "{ID_COLUMN}" FROM "{table_name}" WHERE "{ID_COLUMN}" = ANY(:ids)'),
+            {"ids": [uuid.UUID(doc_id) for doc_id in ids]}
+        )
+        return {str(row[0]) for row in result}
+
+
+def existing_ids(vector_store: VectorStore, ids: list[str], table_name: str = TABLE_NAME) -> set:
+    """
+    IDs de `ids` déjà présents dans le vector store.
+
+    PostgresVectorStore n'a pas de get_by_ids et son add_texts est un INSERT simple (sans ON CONFLICT) :
+    une ligne déjà en table ferait échouer le lot sur la clé primaire, d'où la lecture directe de la table.
+    """
+    if isinstance(vector_store, PostgresVectorStore):
+        return run_on_engine(vector_store._engine, aselect_existing_ids(vector_store._engine, table_name, ids))
+    return {doc.id for doc in vector_store.get_by_ids(ids)}
+
+
+def ingest_csv(
+    vector_store: VectorStore,
+    embeddings: PrefetchedEmbeddings,
+    csv_path: str,
+    batch_size: int = 64,
+    workers: int = 4,
+    chunk_size: int = 2000,
+    checkpoint_path: str = ""
+) -> dict:
+    """
+    Ingère le CSV dans le vector store par lots, avec au plus `workers` lots en cours d'embedding à la fois.
+
+    Les lignes déjà présentes (même ID de contenu) sont ignorées, et la progression est enregistrée
+    dans `checkpoint_path` après chaque bloc pour reprendre là où un crash s'est arrêté.
+
+    Returns:
+        dict: Lignes lues, insérées, ignorées, durée et débit en lignes/seconde.
+    """
+    start_row = load_checkpoint(checkpoint_path, csv_path)
+    if start_row:
+        print(f"🔹 Reprise de l'ingestion à la ligne {start_row}.")
+
+    def embed_and_add(batch: list) -> int:
+        texts = [text for text, _, _ in batch]
+        embeddings.prefetch(texts)
+        vector_store.add_texts(texts, metadatas=[meta for _, meta, _ in batch], ids=[doc_id for _, _, doc_id in batch])
+        return len(batch)
+
+    stats = {"rows_read": 0, "rows_inserted": 0, "rows_skipped": 0}
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for rows, rows_done in iter_csv_chunks(csv_path, chunk_size, start_row):
+            known = existing_ids(vector_store, [doc_id for _, _, doc_id in rows])
+            # Une ligne répétée dans le CSV a le même ID : insérée une seule fois
+            todo = list({row[2]: row for row in rows if row[2] not in known}.values())
+            batches = [todo[i:i + batch_size] for i in range(0, len(todo), batch_size)]
+            stats["rows_inserted"] += sum(executor.map(embed_and_add, batches))
+            stats["rows_read"] += len(rows)
+            stats["rows_skipped"] += len(rows) - len(todo)
+
+            save_checkpoint(checkpoint_path, csv_path, rows_done)
+            elapsed = time.perf_counter() - started
+            print(f"   {rows_done} lignes traitées — {stats['rows_read'] / elapsed:.1f} lignes/s")
+
+    stats["seconds"] = round(time.perf_counter() - started, 2)
+    stats["rows_per_second"] = round(stats["rows_read"] / stats["seconds"], 1) if stats["seconds"] else 0.0
+    return stats
+
+
+class SlowFakeEmbeddings(DeterministicFakeEmbedding):
+    """
+    Embeddings déterministes locaux avec une latence simulée par appel, pour le benchmark hors ligne.
+    """
+
+    latency_ms: float = 0.0
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        time.sleep(self.latency_ms / 1000)
+        return super().embed_documents(texts)
+
+
 # 🔹 Fonction principale
-async def main():
-    print("🔹 Connexion à la base de données...")
-    engine = create_cloud_sql_database_connection()
-    print("✅ Connexion réussie.")
-
-    print(f"\n🔹 Vérification de la table '{TABLE_NAME}'...")
-    await create_table_if_not_exists(TABLE_NAME, engine)
-    print("✅ Vérification/Création table terminée.")
-    
-if _name_ == '_main_':
+async def main(args: argparse.Namespace):
+    if args.fake:
+        # Benchmark hors ligne : vector store en mémoire et embeddings déterministes
+        print("🔹 Mode fake : InMemoryVectorStore + embeddings déterministes.")
+        embeddings = PrefetchedEmbeddings(SlowFakeEmbeddings(size=768, latency_ms=args.fake_latency_ms))
+        vector_store = InMemoryVectorStore(embeddings)
+    elif args.backend == "local":
+        # Index local : les vecteurs sont calculés puis écrits d'un bloc par save() à la fin
+        print(f"🔹 Index local '{args.local_index_path}'.")
+        embeddings = PrefetchedEmbeddings(get_embeddings())
+        vector_store = LocalVectorStore(embeddings, args.local_index_path)
+    else:
+        print("🔹 Connexion à la base de données...")
+        engine = create_cloud_sql_database_connection()
+        print("✅ Connexion réussie.")
+
+        print(f"\n🔹 Vérification de la table '{TABLE_NAME}'...")
+        await create_table_if_not_exists(TABLE_NAME, engine)
+        print("✅ Vérification/Création table terminée.")
+        if args.create_only:
+            return
+
+        embeddings = PrefetchedEmbeddings(get_embeddings())
+        vector_store = get_vector_store(engine, TABLE_NAME, embeddings)
+
+        if args.index_only or args.benchmark_index:
+            if args.index != "none":
+                build_vector_index(vector_store, args.index, args.hnsw_m, args.hnsw_ef_construction, args.ivfflat_lists, args.rebuild_index)
+            if args.benchmark_index:
+                queries = pd.read_csv(args.csv, usecols=["question"])["question"].dropna()
+                queries = queries.sample(n=min(args.benchmark_queries, len(queries)), random_state=42).tolist()
+                report = benchmark_vector_index(
+                    vector_store,
+                    queries,
+                    ef_search_values=[10, 40, 100] if args.index != "ivfflat" else None,
+                    probes_values=[1, 10] if args.index != "hnsw" else None
+                )
+                print(pd.DataFrame(report).to_string(index=False))
+            return
+
+    print(f"\n🔹 Ingestion de '{args.csv}' (lots de {args.batch_size}, {args.workers} workers)...")
+    stats = await asyncio.to_thread(
+        ingest_csv,
+        vector_store,
+        embeddings,
+        args.csv,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        checkpoint_path=args.checkpoint if args.backend == "cloudsql" and not args.fake else ""
+    )
+    if isinstance(vector_store, LocalVectorStore):
+        vector_store.save()
+    print(f"✅ {stats['rows_inserted']} lignes insérées, {stats['rows_skipped']} déjà présentes "
+          f"en {stats['seconds']} s ({stats['rows_per_second']} lignes/s).")
+
+    # L'index est construit après l'ingestion : bien plus rapide que de le maintenir ligne par ligne
+    if not args.fake and args.backend == "cloudsql" and args.index != "none":
+        build_vector_index(vector_store, args.index, args.hnsw_m, args.hnsw_ef_construction, args.ivfflat_lists, args.rebuild_index)
+
+    # Index BM25 de tout le CSV (mêmes IDs que la table) pour la recherche hybride de l'API
+    if not args.fake and args.lexical_index_path:
+        from lexical import build_index_from_csv
+        lexical_index = await asyncio.to_thread(build_index_from_csv, args.csv, args.chunk_size)
+        lexical_index.save(args.lexical_index_path)
+        print(f"✅ Index BM25 '{args.lexical_index_path}' : {len(lexical_index)} documents, {len(lexical_index.vocabulary)} termes.")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Création de la table et ingestion du CSV MedQuAD dans Cloud SQL.")
+    parser.add_argument("--csv", default="./downloaded_files/medquadd.csv", help="Chemin du fichier CSV à ingérer")
+    parser.add_argument("--batch-size", type=int, default=64, help="Nombre de lignes par appel d'embedding")
+    parser.add_argument("--workers", type=int, default=4, help="Nombre de lots embarqués en parallèle")
+    parser.add_argument("--chunk-size", type=int, default=2000, help="Nombre de lignes lues du CSV à la fois")
+    parser.add_argument("--checkpoint", default=".ingest_checkpoint.json", help="Fichier de reprise (vide pour désactiver)")
+    parser.add_argument("--create-only", action="store_true", help="Créer la table sans ingérer de données")
+    parser.add_argument("--backend", choices=["cloudsql", "local"], default=VECTOR_BACKEND, help="Destination : table pgvector ou index local")
+    parser.add_argument("--local-index-path", default=LOCAL_INDEX_PATH, help="Dossier de l'index local (--backend local)")
+    parser.add_argument("--lexical-index-path", default=LEXICAL_INDEX_PATH, help="Dossier de l'index BM25 construit après l'ingestion (vide pour ne pas le construire)")
+    parser.add_argument("--fake", action="store_true", help="Benchmark hors ligne sur un vector store en mémoire")
+    parser.add_argument("--fake-latency-ms", type=float, default=50.0, help="Latence simulée par lot en mode --fake")
+    parser.add_argument("--index", choices=["none", "hnsw", "ivfflat"], default="none", help="Index ANN à construire après l'ingestion")
+    parser.add_argument("--rebuild-index", action="store_true", help="Recréer l'index s'il existe déjà")
+    parser.add_argument("--index-only", action="store_true", help="Construire l'index sans ingérer de données")
+    parser.add_argument("--hnsw-m", type=int, default=16, help="HNSW : nombre de voisins par nœud")
+    parser.add_argument("--hnsw-ef-construction", type=int, default=64, help="HNSW : taille de la liste de candidats à la construction")
+    parser.add_argument("--ivfflat-lists", type=int, default=100, help="IVFFlat : nombre de listes")
+    parser.add_argument("--benchmark-index", action="store_true", help="Comparer rappel et latence de la recherche indexée et exacte")
+    parser.add_argument("--benchmark-queries", type=int, default=50, help="Nombre de questions du CSV utilisées pour le benchmark")
+    return parser.parse_args()
+
+if __name__ == '__main__':
+    args = parse_args()
     try:
-        asyncio.run(main())  # Lancer l'exécution asynchrone
+        asyncio.run(main(args))  # Lancer l'exécution asynchrone
     except RuntimeError:
-        # Alternative pour éviter l'erreur d'event loop
+        # Alternative pour éviter l'erreur d'event loop
         loop = asyncio.get_event_loop()
-        loop.run_until_complete(main())
+        loop.run_until_complete(main(args))
 
-    print("\n🎉 Ingestion terminée. La table est prête à être utilisée.")
+    print("\n🎉 Ingestion terminée. La table est prête à être utilisée.")
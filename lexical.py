@@ -0,0 +1,255 @@
+import argparse
+import json
+import math
+import os
+import time
+from collections import Counter
+from typing import Iterable, List, Optional
+
+import numpy as np
+
+from router import tokenize
+
+POSTINGS_DIR = "postings"  # Un fichier .npy par tableau, mappé en mémoire (partagé entre workers)
+POSTINGS_FILE = "postings.npz"  # Ancien format compressé, chargé entièrement en mémoire
+POSTINGS_ARRAYS = {"offsets": "offsets", "docs": "postings_docs", "freqs": "postings_freqs", "lengths": "doc_lengths"}
+MANIFEST_FILE = "manifest.json"
+
+# Mots trop fréquents pour départager deux documents (les questions MedQuAD commencent presque toutes par eux)
+STOP_WORDS = {
+    "a", "an", "the", "of", "to", "in", "on", "for", "and", "or", "is", "are", "be", "by", "with", "as", "at",
+    "it", "this", "that", "what", "which", "who", "how", "do", "does", "can", "i", "my", "me", "you", "your",
+    "le", "la", "les", "un", "une", "des", "de", "du", "d", "l", "et", "ou", "est", "sont", "en", "à", "au", "aux",
+    "que", "qui", "quoi", "quel", "quels", "quelle", "quelles", "ce", "ces", "je", "j", "mon", "ma", "mes",
+}
+
+
+def bm25_tokens(text: str) -> List[str]:
+    return [word for word in tokenize(text) if word not in STOP_WORDS]
+
+
+class BM25Index:
+    """
+    Index inversé BM25 sur la question et la réponse de chaque document MedQuAD.
+
+    Stockage compact : les listes de postings de tous les termes sont concaténées dans deux tableaux
+    (documents en int32, fréquences en uint16) avec un tableau d'offsets par terme, comme un CSR.
+    Seuls les IDs des documents sont gardés : les documents eux-mêmes sont relus dans le vector store.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.doc_ids: List[str] = []
+        self.vocabulary: dict = {}  # terme -> index dans offsets
+        self.offsets = np.zeros(1, dtype=np.int64)
+        self.postings_docs = np.zeros(0, dtype=np.int32)
+        self.postings_freqs = np.zeros(0, dtype=np.uint16)
+        self.doc_lengths = np.zeros(0, dtype=np.float32)
+        self.idf = np.zeros(0, dtype=np.float32)
+
+    def __len__(self) -> int:
+        return len(self.doc_ids)
+
+    # 🔹 Construction
+    @classmethod
+    def build(cls, documents: Iterable[tuple], k1: float = 1.2, b: float = 0.75) -> "BM25Index":
+        """
+        `documents` : paires (id, texte), typiquement la question et la réponse d'une ligne du CSV.
+        """
+        index = cls(k1, b)
+        postings: dict = {}
+        lengths = []
+        for doc_number, (doc_id, text) in enumerate(documents):
+            counts = Counter(bm25_tokens(text))
+            index.doc_ids.append(doc_id)
+            lengths.append(sum(counts.values()))
+            for term, count in counts.items():
+                postings.setdefault(term, []).append((doc_number, min(count, 65535)))
+        terms = sorted(postings)
+        index.vocabulary = {term: position for position, term in enumerate(terms)}
+        sizes = np.asarray([len(postings[term]) for term in terms], dtype=np.int64)
+        index.offsets = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+        flat = [pair for term in terms for pair in postings[term]]
+        index.postings_docs = np.asarray([doc for doc, _ in flat], dtype=np.int32)
+        index.postings_freqs = np.asarray([count for _, count in flat], dtype=np.uint16)
+        index.doc_lengths = np.asarray(lengths, dtype=np.float32)
+        index._compute_idf()
+        return index
+
+    def _compute_idf(self) -> None:
+        document_frequency = np.diff(self.offsets).astype(np.float32)
+        n = max(len(self.doc_ids), 1)
+        self.idf = np.log1p((n - document_frequency + 0.5) / (document_frequency + 0.5)).astype(np.float32)
+
+    # 🔹 Lecture et écriture
+    def save(self, path: str) -> None:
+        os.makedirs(path, exist_ok=True)
+        terms = sorted(self.vocabulary, key=self.vocabulary.get)
+        postings_dir = os.path.join(path, POSTINGS_DIR)
+        os.makedirs(postings_dir, exist_ok=True)
+        for name, attribute in POSTINGS_ARRAYS.items():
+            with open(os.path.join(postings_dir, name + ".npy.tmp"), "wb") as f:
+                np.save(f, getattr(self, attribute))
+        for name in POSTINGS_ARRAYS:
+            os.replace(os.path.join(postings_dir, name + ".npy.tmp"), os.path.join(postings_dir, name + ".npy"))
+        if os.path.exists(os.path.join(path, POSTINGS_FILE)):
+            os.remove(os.path.join(path, POSTINGS_FILE))
+        # Le manifeste est écrit en dernier : un index à moitié écrit n'est jamais chargé
+        with open(os.path.join(path, MANIFEST_FILE), "w", encoding="utf-8") as f:
+            json.dump({"k1": self.k1, "b": self.b, "doc_ids": self.doc_ids, "terms": terms}, f, ensure_ascii=False)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["BM25Index"]:
+        if not os.path.exists(os.path.join(path, MANIFEST_FILE)):
+            return None
+        with open(os.path.join(path, MANIFEST_FILE), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+        index = cls(manifest["k1"], manifest["b"])
+        index.doc_ids = manifest["doc_ids"]
+        index.vocabulary = {term: position for position, term in enumerate(manifest["terms"])}
+        postings_dir = os.path.join(path, POSTINGS_DIR)
+        if os.path.isdir(postings_dir):
+            for name, attribute in POSTINGS_ARRAYS.items():
+                setattr(index, attribute, np.load(os.path.join(postings_dir, name + ".npy"), mmap_mode="r"))
+        else:
+            with np.load(os.path.join(path, POSTINGS_FILE)) as arrays:
+                for name, attribute in POSTINGS_ARRAYS.items():
+                    setattr(index, attribute, arrays[name])
+        index._compute_idf()
+        return index
+
+    # 🔹 Recherche
+    def search(self, query: str, k: int = 10) -> List[tuple[str, float]]:
+        """
+        Les `k` meilleurs (id, score BM25) pour la requête ; seuls les documents contenant un terme sont classés.
+        """
+        term_ids = [self.vocabulary[term] for term in set(bm25_tokens(query)) if term in self.vocabulary]
+        if not term_ids or not len(self.doc_ids):
+            return []
+        average_length = float(self.doc_lengths.mean()) or 1.0
+        scores = np.zeros(len(self.doc_ids), dtype=np.float32)
+        for term_id in term_ids:
+            start, end = self.offsets[term_id], self.offsets[term_id + 1]
+            docs = self.postings_docs[start:end]
+            freqs = self.postings_freqs[start:end].astype(np.float32)
+            norm = self.k1 * (1 - self.b + self.b * self.doc_lengths[docs] / average_length)
+            scores[docs] += self.idf[term_id] * freqs * (self.k1 + 1) / (freqs + norm)
+        matched = np.flatnonzero(scores)
+        k = min(k, len(matched))
+        if k == 0:
+            return []
+        top = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        top = top[np.argsort(-scores[top])]
+        return [(self.doc_ids[row], float(scores[row])) for row in top]
+
+
+def reciprocal_rank_fusion(rankings: List[List[str]], weights: Optional[List[float]] = None, rrf_k: int = 60) -> List[tuple[str, float]]:
+    """
+    Fusionne plusieurs classements d'IDs : score = Σ poids / (rrf_k + rang), rang commençant à 1.
+    """
+    weights = weights or [1.0] * len(rankings)
+    scores: dict = {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, doc_id in enumerate(ranking, start=1):
+            scores[doc_id] = scores.get(doc_id, 0.0) + weight / (rrf_k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def build_index_from_csv(csv_path: str, chunk_size: int = 2000) -> BM25Index:
+    """
+    Index BM25 de tout le CSV, avec les mêmes IDs de contenu que les lignes de la table.
+    """
+    from ingest import iter_csv_chunks
+
+    def documents():
+        for rows, _ in iter_csv_chunks(csv_path, chunk_size):
+            for text, metadata, doc_id in rows:
+                yield doc_id, f"{text} {metadata['answer']}"
+
+    return BM25Index.build(documents())
+
+
+def benchmark_hybrid(vector_store, index: BM25Index, samples: List[dict], embedding, k: int = 3,
+                     candidates: int = 20, weights: tuple = (1.0, 1.0), rrf_k: int = 60) -> List[dict]:
+    """
+    Recall@k (la ligne dont vient la question est-elle dans le top k ?), part du top k dans le même
+    focus_area que la question, et latence, pour la recherche vectorielle seule puis hybride.
+    """
+    from retrieve import get_relevant_documents_by_vector, get_hybrid_documents_by_vector, document_id
+
+    vectors = [embedding.embed_query(sample["question"]) for sample in samples]
+    report = []
+    for name in ["vector", "hybrid"]:
+        latencies, recalls, focus = [], [], []
+        for sample, vector in zip(samples, vectors):
+            started = time.perf_counter()
+            if name == "vector":
+                docs = get_relevant_documents_by_vector(vector, vector_store, -math.inf, k=k)
+            else:
+                docs = get_hybrid_documents_by_vector(
+                    sample["question"], vector, vector_store, index, -math.inf,
+                    k=k, candidates=candidates, weights=weights, rrf_k=rrf_k
+                )
+            latencies.append((time.perf_counter() - started) * 1000)
+            recalls.append(float(any(document_id(doc) == sample["id"] for doc in docs)))
+            focus.append(np.mean([doc.metadata.get("focus_area") == sample["focus_area"] for doc in docs]) if docs else 0.0)
+        report.append({
+            "retrieval": name,
+            f"recall@{k}": round(float(np.mean(recalls)), 4),
+            f"focus_area@{k}": round(float(np.mean(focus)), 4),
+            "mean_ms": round(float(np.mean(latencies)), 3),
+            "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+        })
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Construit l'index BM25 du corpus et mesure l'apport de la recherche hybride.")
+    parser.add_argument("--csv", default="./downloaded_files/medquadd.csv", help="CSV MedQuAD indexé et dont les questions servent de requêtes")
+    parser.add_argument("--index-path", default="./lexical_index", help="Dossier de l'index BM25")
+    parser.add_argument("--build", action="store_true", help="(Re)construire l'index depuis le CSV avant le benchmark")
+    parser.add_argument("--samples", type=int, default=100, help="Nombre de questions du benchmark (0 = pas de benchmark)")
+    parser.add_argument("--backend", choices=["cloudsql", "local"], default="local", help="Vector store comparé")
+    parser.add_argument("--local-index-path", default="./local_index", help="Dossier de l'index vectoriel local (--backend local)")
+    parser.add_argument("--k", type=int, default=3, help="Documents gardés")
+    parser.add_argument("--candidates", type=int, default=20, help="Candidats par recherche avant fusion")
+    parser.add_argument("--vector-weight", type=float, default=1.0, help="Poids du classement vectoriel dans la fusion")
+    parser.add_argument("--lexical-weight", type=float, default=1.0, help="Poids du classement BM25 dans la fusion")
+    parser.add_argument("--fake", action="store_true", help="Hors ligne : index vectoriel local temporaire et embeddings simulés")
+    args = parser.parse_args()
+
+    index = None if args.build else BM25Index.load(args.index_path)
+    if index is None:
+        started = time.perf_counter()
+        index = build_index_from_csv(args.csv)
+        index.save(args.index_path)
+        print(f"✅ Index BM25 : {len(index)} documents, {len(index.vocabulary)} termes en {time.perf_counter() - started:.1f} s.")
+    if args.samples:
+        import pandas as pd
+        from ingest import iter_csv_chunks
+
+        rows = [row for chunk, _ in iter_csv_chunks(args.csv, 2000) for row in chunk]
+        picked = np.random.default_rng(42).choice(len(rows), size=min(args.samples, len(rows)), replace=False)
+        samples = [{"question": rows[i][0], "id": rows[i][2], "focus_area": rows[i][1]["focus_area"]} for i in picked]
+        if args.fake:
+            import tempfile
+            from langchain_core.embeddings import DeterministicFakeEmbedding
+            from local_store import LocalVectorStore
+
+            embedding = DeterministicFakeEmbedding(size=256)
+            vector_store = LocalVectorStore(embedding, tempfile.mkdtemp())
+            vector_store.add_texts([text for text, _, _ in rows], [meta for _, meta, _ in rows], [doc_id for _, _, doc_id in rows])
+            vector_store.save()
+        else:
+            from config import TABLE_NAME
+            from ingest import get_embeddings, create_cloud_sql_database_connection, get_vector_store
+            from local_store import LocalVectorStore
+
+            embedding = get_embeddings()
+            vector_store = LocalVectorStore(embedding, args.local_index_path) if args.backend == "local" else \
+                get_vector_store(create_cloud_sql_database_connection(), TABLE_NAME, embedding)
+        report = benchmark_hybrid(
+            vector_store, index, samples, embedding, args.k, args.candidates, (args.vector_weight, args.lexical_weight)
+        )
+        print(pd.DataFrame(report).to_string(index=False))
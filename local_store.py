@@ -0,0 +1,249 @@
+import argparse
+import asyncio
+import json
+import os
+import time
+from typing import Any, Iterable, List, Optional
+
+import numpy as np
+from langchain_core.documents.base import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+VECTORS_FILE = "vectors.f32"
+COLUMNS_DIR = "columns"  # Un fichier .npy par tableau, mappé en mémoire comme les vecteurs
+COLUMNS_FILE = "columns.npz"  # Ancien format, chargé entièrement en mémoire
+MANIFEST_FILE = "manifest.json"
+
+
+def _pack_strings(values: List[str]) -> tuple[np.ndarray, np.ndarray]:
+    # Colonne de chaînes compacte : un seul buffer UTF-8 et les offsets de début de chaque valeur
+    encoded = [value.encode("utf-8") for value in values]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(value) for value in encoded])
+    return np.frombuffer(b"".join(encoded), dtype=np.uint8), offsets
+
+
+class LocalVectorStore(VectorStore):
+    """
+    Index vectoriel en mémoire, alternative locale à PostgresVectorStore pour un corpus qui tient en RAM.
+
+    Les vecteurs normalisés sont une matrice float32 et les métadonnées des colonnes compactes, toutes
+    mappées en mémoire depuis le disque : les workers d'un même serveur partagent ces pages via le cache
+    de pages au lieu d'en garder chacun une copie. Le top-k est un
+    produit matrice-vecteur suivi d'un argpartition, et les scores sont des similarités cosinus, comme
+    les relevance scores de pgvector.
+    """
+
+    def __init__(self, embedding: Embeddings, path: Optional[str] = None):
+        self.embedding = embedding
+        self.path = path
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self._columns: dict = {}
+        self._column_names: List[str] = []
+        self._ids: List[str] = []
+        self._row_by_id: dict = {}
+        self._pending: List[tuple] = []  # (id, texte, vecteur, métadonnées) ajoutés depuis le dernier save()
+        if path and os.path.exists(os.path.join(path, MANIFEST_FILE)):
+            self._load(path)
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    # 🔹 Lecture de l'index
+    def _load(self, path: str) -> None:
+        with open(os.path.join(path, MANIFEST_FILE), "r") as f:
+            manifest = json.load(f)
+        count, dim = manifest["count"], manifest["dim"]
+        self._vectors = np.memmap(os.path.join(path, VECTORS_FILE), dtype=np.float32, mode="r", shape=(count, dim)) \
+            if count else np.zeros((0, dim), dtype=np.float32)
+        columns_dir = os.path.join(path, COLUMNS_DIR)
+        if os.path.isdir(columns_dir):
+            self._columns = {
+                name[:-len(".npy")]: np.load(os.path.join(columns_dir, name), mmap_mode="r")
+                for name in os.listdir(columns_dir) if name.endswith(".npy")
+            }
+        else:
+            self._columns = dict(np.load(os.path.join(path, COLUMNS_FILE)))
+        self._column_names = manifest["columns"]
+        self._ids = self._column("id")
+        self._row_by_id = {doc_id: row for row, doc_id in enumerate(self._ids)}
+
+    def _column(self, name: str) -> List[str]:
+        data, offsets = self._columns[f"{name}_data"], self._columns[f"{name}_offsets"]
+        return [bytes(data[offsets[i]:offsets[i + 1]]).decode("utf-8") for i in range(len(offsets) - 1)]
+
+    def _value(self, name: str, row: int) -> str:
+        # Décodage à la demande : seules les lignes du top-k sont désérialisées
+        data, offsets = self._columns[f"{name}_data"], self._columns[f"{name}_offsets"]
+        return bytes(data[offsets[row]:offsets[row + 1]]).decode("utf-8")
+
+    def _document(self, row: int) -> Document:
+        metadata = {name: json.loads(self._value(name, row)) for name in self._column_names}
+        return Document(id=self._ids[row], page_content=self._value("page_content", row), metadata=metadata)
+
+    # 🔹 Recherche
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4) -> List[tuple[Document, float]]:
+        if not len(self._ids):
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        scores = self._vectors @ query
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(self._document(int(row)), float(scores[row])) for row in top]
+
+    async def asimilarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4) -> List[tuple[Document, float]]:
+        # Produit matriciel sur tout le corpus : dans un thread, pour ne pas bloquer la boucle d'événements
+        return await asyncio.to_thread(self.similarity_search_with_score_by_vector, embedding, k)
+
+    def similarity_search_with_score_by_ids(self, embedding: List[float], ids: List[str]) -> List[tuple[Document, float]]:
+        # Documents connus par leur ID (trouvés par BM25) avec leur similarité cosinus à la requête
+        rows = [self._row_by_id[doc_id] for doc_id in ids if doc_id in self._row_by_id]
+        if not rows:
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        query /= np.linalg.norm(query) or 1.0
+        scores = self._vectors[rows] @ query
+        return [(self._document(row), float(score)) for row, score in zip(rows, scores)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[tuple[Document, float]]:
+        return self.similarity_search_with_score_by_vector(self.embedding.embed_query(query), k)
+
+    async def asimilarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> List[tuple[Document, float]]:
+        return await self.asimilarity_search_with_score_by_vector(await self.embedding.aembed_query(query), k)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k)]
+
+    def _select_relevance_score_fn(self):
+        # Les scores sont déjà des similarités cosinus
+        return lambda score: score
+
+    # 🔹 Construction de l'index
+    def get_by_ids(self, ids: List[str], /) -> List[Document]:
+        wanted = set(ids)
+        rows = [self._row_by_id[doc_id] for doc_id in wanted if doc_id in self._row_by_id]
+        pending = [Document(id=doc_id, page_content=text, metadata=meta) for doc_id, text, _, meta in self._pending if doc_id in wanted]
+        return [self._document(row) for row in rows] + pending
+
+    def add_texts(
+        self, texts: Iterable[str], metadatas: Optional[List[dict]] = None, ids: Optional[List[str]] = None, **kwargs: Any
+    ) -> List[str]:
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [str(len(self._ids) + len(self._pending) + i) for i in range(len(texts))]
+        vectors = self.embedding.embed_documents(texts)
+        self._pending.extend(zip(ids, texts, vectors, metadatas))
+        return ids
+
+    def save(self, path: Optional[str] = None) -> None:
+        """
+        Écrit l'index (lignes existantes + ajouts) sur disque puis le recharge en mémoire mappée.
+        """
+        path = path or self.path
+        os.makedirs(path, exist_ok=True)
+        docs = [self._document(row) for row in range(len(self._ids))]
+        docs += [Document(id=doc_id, page_content=text, metadata=meta) for doc_id, text, _, meta in self._pending]
+        parts = [np.asarray(self._vectors)] if len(self._vectors) else []
+        if self._pending:
+            new_vectors = np.asarray([vector for _, _, vector, _ in self._pending], dtype=np.float32)
+            new_vectors /= np.maximum(np.linalg.norm(new_vectors, axis=1, keepdims=True), 1e-12)
+            parts.append(new_vectors)
+        vectors = np.concatenate(parts) if parts else np.zeros((0, 0), dtype=np.float32)
+        dim = int(vectors.shape[1])
+
+        tmp_vectors = os.path.join(path, VECTORS_FILE + ".tmp")
+        vectors.astype(np.float32).tofile(tmp_vectors)
+        column_names = sorted({name for doc in docs for name in doc.metadata})
+        columns = {}
+        # Les métadonnées sont sérialisées en JSON pour conserver leur type (row_index reste un entier)
+        for name, values in [("id", [doc.id for doc in docs]), ("page_content", [doc.page_content for doc in docs])] + [
+            (name, [json.dumps(doc.metadata.get(name), ensure_ascii=False) for doc in docs]) for name in column_names
+        ]:
+            columns[f"{name}_data"], columns[f"{name}_offsets"] = _pack_strings(values)
+        columns_dir = os.path.join(path, COLUMNS_DIR)
+        os.makedirs(columns_dir, exist_ok=True)
+        for name, array in columns.items():
+            with open(os.path.join(columns_dir, name + ".npy.tmp"), "wb") as f:
+                np.save(f, array)
+
+        # Le manifeste est écrit en dernier : un index à moitié écrit n'est jamais chargé
+        self._vectors = np.zeros((0, 0), dtype=np.float32)
+        self._columns = {}
+        os.replace(tmp_vectors, os.path.join(path, VECTORS_FILE))
+        for name in os.listdir(columns_dir):
+            if name.endswith(".npy") and name[:-len(".npy")] not in columns:
+                os.remove(os.path.join(columns_dir, name))  # Colonne de métadonnées disparue
+        for name in columns:
+            os.replace(os.path.join(columns_dir, name + ".npy.tmp"), os.path.join(columns_dir, name + ".npy"))
+        if os.path.exists(os.path.join(path, COLUMNS_FILE)):
+            os.remove(os.path.join(path, COLUMNS_FILE))
+        with open(os.path.join(path, MANIFEST_FILE), "w") as f:
+            json.dump({"count": len(docs), "dim": dim, "columns": column_names}, f)
+        self._pending = []
+        self.path = path
+        self._load(path)
+
+    @classmethod
+    def from_texts(
+        cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[dict]] = None, path: str = "./local_index", **kwargs: Any
+    ) -> "LocalVectorStore":
+        store = cls(embedding, path)
+        store.add_texts(texts, metadatas, kwargs.get("ids"))
+        store.save()
+        return store
+
+
+def benchmark_backends(stores: dict, queries: List[str], embedding: Embeddings, k: int = 3) -> List[dict]:
+    """
+    Latence moyenne/p95 de la recherche par backend sur les mêmes vecteurs de requête,
+    et recouvrement du top-k avec le premier backend.
+    """
+    vectors = [embedding.embed_query(query) for query in queries]
+    report, reference = [], None
+    for name, store in stores.items():
+        latencies, results = [], []
+        for vector in vectors:
+            started = time.perf_counter()
+            docs = store.similarity_search_by_vector(vector, k=k)
+            latencies.append((time.perf_counter() - started) * 1000)
+            results.append({doc.page_content for doc in docs})
+        reference = reference or results
+        overlap = np.mean([len(found & truth) / max(len(truth), 1) for found, truth in zip(results, reference)])
+        report.append({
+            "backend": name,
+            "mean_ms": round(float(np.mean(latencies)), 3),
+            "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+            f"overlap@{k}": round(float(overlap), 4),
+        })
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de l'index vectoriel local face à pgvector.")
+    parser.add_argument("--index-path", default="./local_index", help="Dossier de l'index local (voir ingest.py --backend local)")
+    parser.add_argument("--csv", default="./downloaded_files/medquadd.csv", help="CSV dont les questions servent de requêtes")
+    parser.add_argument("--queries", type=int, default=50, help="Nombre de requêtes")
+    parser.add_argument("--with-cloudsql", action="store_true", help="Comparer aussi à la table pgvector sur Cloud SQL")
+    args = parser.parse_args()
+
+    import pandas as pd
+    from config import TABLE_NAME
+    from ingest import get_embeddings, create_cloud_sql_database_connection, get_postgres_vector_store
+
+    embedding = get_embeddings()
+    stores = {"local": LocalVectorStore(embedding, args.index_path)}
+    if args.with_cloudsql:
+        stores["pgvector"] = get_postgres_vector_store(create_cloud_sql_database_connection(), TABLE_NAME, embedding)
+    questions = pd.read_csv(args.csv, usecols=["question"])["question"].dropna()
+    questions = questions.sample(n=min(args.queries, len(questions)), random_state=42).tolist()
+    print(pd.DataFrame(benchmark_backends(stores, questions, embedding)).to_string(index=False))
@@ -0,0 +1,179 @@
+import json
+import logging
+import os
+import sys
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable
+
+from langchain_core.callbacks import BaseCallbackHandler
+from prometheus_client import CollectorRegistry, Counter, Histogram, REGISTRY, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+
+from config import LOG_LEVEL
+
+# 🔹 Trace : un identifiant par requête, lu par les logs de tout le pipeline (outils de l'agent compris)
+trace_id_var: ContextVar[str] = ContextVar("trace_id", default="-")
+
+
+def new_trace_id(incoming: str | None = None) -> str:
+    """
+    Démarre la trace de la requête en cours, en reprenant l'identifiant du client (X-Request-ID) s'il y en a un.
+    """
+    trace_id = incoming or uuid.uuid4().hex
+    trace_id_var.set(trace_id)
+    return trace_id
+
+
+def current_trace_id() -> str:
+    return trace_id_var.get()
+
+
+# 🔹 Logs structurés : une ligne JSON par événement, filtrés par niveau avant toute mise en forme
+_STANDARD_RECORD_FIELDS = set(vars(logging.makeLogRecord({}))) | {"message", "asctime"}
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "trace_id": current_trace_id(),
+            "message": record.getMessage(),
+        }
+        # Champs passés via extra={...}
+        entry.update({key: value for key, value in vars(record).items() if key not in _STANDARD_RECORD_FIELDS})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+def get_logger(name: str = "astramed") -> logging.Logger:
+    logger = logging.getLogger(name)
+    if not logger.handlers:
+        handler = logging.StreamHandler(sys.stdout)
+        handler.setFormatter(JsonFormatter())
+        logger.addHandler(handler)
+        logger.setLevel(LOG_LEVEL)
+        logger.propagate = False
+    return logger
+
+
+# 🔹 Métriques Prometheus (exposées sur /metrics)
+STAGE_SECONDS = Histogram(
+    "astramed_stage_seconds", "Durée des étapes du pipeline /answer", ["stage"],
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+REQUEST_SECONDS = Histogram(
+    "astramed_request_seconds", "Durée des requêtes HTTP", ["path", "status"],
+    buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+)
+TOOL_CHOICES = Counter("astramed_tool_choices_total", "Outil utilisé pour répondre", ["tool", "decided_by"])
+CACHE_EVENTS = Counter("astramed_cache_events_total", "Hits et misses des caches de réponses", ["cache", "result"])
+ERRORS = Counter("astramed_errors_total", "Erreurs du pipeline", ["endpoint"])
+AGENT_OUTPUT_PARSES = Counter(
+    "astramed_agent_output_parses_total", "Sorties de l'agent par méthode de lecture (steps, final_answer, fallback)", ["method"]
+)
+
+
+@contextmanager
+def stage(name: str):
+    """
+    Chronomètre une étape du pipeline dans astramed_stage_seconds.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.labels(name).observe(time.perf_counter() - started)
+
+
+class LLMTimingCallback(BaseCallbackHandler):
+    """
+    Temps de génération de chaque appel au LLM (agent ou réponse générale), dans l'étape "llm".
+    """
+
+    def __init__(self):
+        self._started: dict = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs) -> None:
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs) -> None:
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs) -> None:
+        started = self._started.pop(run_id, None)
+        if started is not None:
+            STAGE_SECONDS.labels("llm").observe(time.perf_counter() - started)
+
+    def on_llm_error(self, error, *, run_id, **kwargs) -> None:
+        self._started.pop(run_id, None)
+        ERRORS.labels("llm").inc()
+
+
+# Plusieurs workers (gunicorn.conf.py) : chacun écrit ses compteurs et histogrammes dans ce répertoire
+MULTIPROCESS_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR", "")
+
+
+class StatsCollector:
+    """
+    Exporte à chaque scrape les compteurs déjà tenus par les caches, le routeur et le pool (méthodes stats()).
+
+    Ces compteurs sont propres au worker qui répond : avec plusieurs workers, ils portent son pid en label `worker`.
+    """
+
+    def __init__(self, name: str, read_stats: Callable[[], dict | None], counters: list, gauges: list):
+        self.name = name
+        self.read_stats = read_stats
+        self.counters = counters
+        self.gauges = gauges
+
+    def describe(self):
+        # Rien à décrire à l'enregistrement : les stats ne sont lues qu'au scrape
+        return []
+
+    def collect(self):
+        try:
+            stats = self.read_stats() or {}
+        except Exception:
+            stats = {}
+        labels, values = (["worker"], [str(os.getpid())]) if MULTIPROCESS_DIR else ([], [])
+        for key in self.counters:
+            if isinstance(stats.get(key), (int, float)):
+                family = CounterMetricFamily(f"astramed_{self.name}_{key}", f"{self.name} : {key}", labels=labels)
+                family.add_metric(values, stats[key])
+                yield family
+        for key in self.gauges:
+            if isinstance(stats.get(key), (int, float)):
+                family = GaugeMetricFamily(f"astramed_{self.name}_{key}", f"{self.name} : {key}", labels=labels)
+                family.add_metric(values, stats[key])
+                yield family
+
+
+_stats_collectors: list = []
+
+
+def register_stats(name: str, read_stats: Callable[[], dict | None], counters: list, gauges: list = ()) -> None:
+    collector = StatsCollector(name, read_stats, list(counters), list(gauges))
+    _stats_collectors.append(collector)
+    REGISTRY.register(collector)
+
+
+def render_metrics() -> bytes:
+    """
+    Texte de /metrics. Avec plusieurs workers, les compteurs et histogrammes sont agrégés depuis les fichiers
+    de tous les workers (mode multiprocess de prometheus_client), et les stats du worker qui répond y sont ajoutées.
+    """
+    if not MULTIPROCESS_DIR:
+        return generate_latest()
+    from prometheus_client import multiprocess
+
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    for collector in _stats_collectors:
+        registry.register(collector)
+    return generate_latest(registry)
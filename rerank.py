@@ -0,0 +1,133 @@
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, List, Sequence
+
+from langchain_core.documents.base import Document
+
+from cache import LRUCache, lazy_singleton, normalize_text
+from config import RERANK_MODEL, RERANK_BATCH_SIZE, RERANK_MAX_LENGTH
+
+# Le cross-encoder lit au plus RERANK_MAX_LENGTH tokens : inutile de lui passer des réponses entières
+MAX_PASSAGE_CHARS = 1500
+
+
+# 🚀 Cross-encoder local, chargé au premier reranking (ou par warm_up), jamais à l'import
+@lazy_singleton
+def get_cross_encoder():
+    from sentence_transformers import CrossEncoder
+    return CrossEncoder(RERANK_MODEL, max_length=RERANK_MAX_LENGTH, device="cpu")
+
+
+def cross_encoder_scores(pairs: List[tuple]) -> List[float]:
+    """
+    Scores (question, passage) du cross-encoder, en une inférence CPU par lots de RERANK_BATCH_SIZE paires.
+    """
+    return get_cross_encoder().predict(pairs, batch_size=RERANK_BATCH_SIZE, show_progress_bar=False).tolist()
+
+
+def rerank_passage(doc: Document) -> str:
+    # Question indexée + réponse de référence : c'est la réponse qui dit si le document répond vraiment
+    return f"{doc.page_content}\n{doc.metadata.get('answer', '')}"[:MAX_PASSAGE_CHARS]
+
+
+def query_hash(query: str) -> str:
+    return hashlib.sha1(normalize_text(query).encode("utf-8")).hexdigest()
+
+
+class Reranker:
+    """
+    Reclasse les candidats de la recherche (vectorielle ou hybride) avec un cross-encoder et garde les top_n.
+
+    Les scores sont mis en cache par (hash de la question normalisée, id du document) : seules les paires
+    inconnues passent par le modèle, en un seul appel par lots. Deux garde-fous coupent le reranking sous
+    charge : au-delà de `max_inflight` rerankings simultanés, ou quand la latence moyenne (moyenne mobile
+    exponentielle) dépasse `budget_ms`. Dans ce dernier cas, une requête sur `probe_every` est quand même
+    reclassée pour mesurer si la latence est redescendue.
+    """
+
+    def __init__(self, score_pairs: Callable[[List[tuple]], Sequence[float]], cache_size: int = 20000,
+                 max_inflight: int = 4, budget_ms: float = 150.0, probe_every: int = 20):
+        self.score_pairs = score_pairs
+        self.max_inflight = max_inflight
+        self.budget_ms = budget_ms
+        self.probe_every = probe_every
+        self._scores = LRUCache(cache_size)
+        self._lock = threading.Lock()
+        self._inflight = 0
+        self._skipped_since_probe = 0
+        self.latency_ema_ms = 0.0
+        self.reranked = 0
+        self.skipped_load = 0
+        self.skipped_budget = 0
+        self.pairs_scored = 0
+
+    # 🔹 Admission : reranking ou non pour cette requête (décidé avant la recherche, qui en dépend)
+    def _admit(self) -> bool:
+        with self._lock:
+            if self.max_inflight > 0 and self._inflight >= self.max_inflight:
+                self.skipped_load += 1
+                return False
+            if self.budget_ms > 0 and self.latency_ema_ms > self.budget_ms:
+                self._skipped_since_probe += 1
+                if self._skipped_since_probe < self.probe_every:
+                    self.skipped_budget += 1
+                    return False
+                self._skipped_since_probe = 0
+            self._inflight += 1
+            return True
+
+    @contextmanager
+    def slot(self):
+        """
+        Donne True si la requête peut être reclassée (il faut alors sur-échantillonner les candidats), sinon False.
+        """
+        admitted = self._admit()
+        try:
+            yield admitted
+        finally:
+            if admitted:
+                with self._lock:
+                    self._inflight -= 1
+
+    # 🔹 Reranking
+    def rerank(self, query: str, docs: List[Document], top_n: int) -> List[Document]:
+        """
+        Les `top_n` meilleurs documents selon le cross-encoder, avec `rerank_score` dans leurs métadonnées.
+        """
+        if not docs:
+            return []
+        started = time.perf_counter()
+        key = query_hash(query)
+        passages = [rerank_passage(doc) for doc in docs]
+        keys = [(key, doc.id or hashlib.sha1(passage.encode("utf-8")).hexdigest()) for doc, passage in zip(docs, passages)]
+        scores = [self._scores.get(doc_key) for doc_key in keys]
+        missing = [i for i, score in enumerate(scores) if score is None]
+        if missing:
+            computed = self.score_pairs([(query, passages[i]) for i in missing])
+            for i, score in zip(missing, computed):
+                scores[i] = float(score)
+                self._scores.put(keys[i], scores[i])
+        for doc, score in zip(docs, scores):
+            doc.metadata["rerank_score"] = score
+        ranked = sorted(range(len(docs)), key=lambda i: scores[i], reverse=True)
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        with self._lock:
+            self.reranked += 1
+            self.pairs_scored += len(missing)
+            self.latency_ema_ms = elapsed_ms if self.reranked == 1 else 0.8 * self.latency_ema_ms + 0.2 * elapsed_ms
+        return [docs[i] for i in ranked[:top_n]]
+
+    def stats(self) -> dict:
+        return {
+            "reranked": self.reranked,
+            "skipped_load": self.skipped_load,
+            "skipped_budget": self.skipped_budget,
+            "pairs_scored": self.pairs_scored,
+            "inflight": self._inflight,
+            "max_inflight": self.max_inflight,
+            "budget_ms": self.budget_ms,
+            "latency_ema_ms": round(self.latency_ema_ms, 3),
+            "score_cache": self._scores.stats(),
+        }
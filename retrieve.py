@@ -1,11 +1,23 @@
 import os
-from ingest import create_cloud_sql_database_connection, get_embeddings, get_vector_store
+import asyncio
+import uuid
+from ingest import (
+    create_cloud_sql_database_connection, get_embeddings, get_vector_store, get_tuned_vector_store, content_id, ID_COLUMN
+)
 from langchain_google_cloud_sql_pg import PostgresVectorStore
 from langchain_core.documents.base import Document
+from lexical import BM25Index, reciprocal_rank_fusion
+from observability import get_logger
 from config import TABLE_NAME
 
+logger = get_logger()
+
 def get_relevant_documents(
-    query: str, vector_store: PostgresVectorStore, similarity_threshold: float = 0.5
+    query: str,
+    vector_store: PostgresVectorStore,
+    similarity_threshold: float = 0.5,
+    ef_search: int | None = None,
+    probes: int | None = None
 ) -> list[Document]:
     """
     Retrieve the 3 most relevant documents based on a query using a vector store.
@@ -14,14 +26,251 @@ def get_relevant_documents(
         query (str): The search query string.
         vector_store (PostgresVectorStore): An instance of PostgresVectorStore.
         similarity_threshold (float, optional): Minimum similarity score to consider. Default is 0.5.
+        ef_search (int, optional): HNSW candidate list size for this query (higher = better recall, slower).
+        probes (int, optional): Number of IVFFlat lists scanned for this query.
 
     Returns:
         list[Document]: A list of the top 3 relevant documents.
     """
+    vector_store = get_tuned_vector_store(vector_store, ef_search=ef_search, probes=probes)
     relevant_docs_scores = vector_store.similarity_search_with_relevance_scores(
         query=query, k=3  # On garde les 3 meilleurs documents
     )
 
+    return filter_relevant_documents(relevant_docs_scores, similarity_threshold)
+
+def get_relevant_documents_by_vector(
+    embedding: list[float],
+    vector_store: PostgresVectorStore,
+    similarity_threshold: float = 0.5,
+    ef_search: int | None = None,
+    probes: int | None = None,
+    k: int = 3
+) -> list[Document]:
+    """
+    Same as get_relevant_documents for a query already embedded.
+
+    Args:
+        embedding (list[float]): The query embedding.
+        vector_store (PostgresVectorStore): An instance of PostgresVectorStore.
+        similarity_threshold (float, optional): Minimum similarity score to consider. Default is 0.5.
+        ef_search (int, optional): HNSW candidate list size for this query.
+        probes (int, optional): Number of IVFFlat lists scanned for this query.
+        k (int, optional): Number of documents fetched. Default is 3.
+
+    Returns:
+        list[Document]: A list of the top k relevant documents.
+    """
+    vector_store = get_tuned_vector_store(vector_store, ef_search=ef_search, probes=probes)
+    docs_distances = vector_store.similarity_search_with_score_by_vector(embedding, k=k)
+    relevance_score_fn = vector_store._select_relevance_score_fn()
+    relevant_docs_scores = [(doc, relevance_score_fn(distance)) for doc, distance in docs_distances]
+    return filter_relevant_documents(relevant_docs_scores, similarity_threshold)
+
+async def aget_relevant_documents_by_vector(
+    embedding: list[float],
+    vector_store: PostgresVectorStore,
+    similarity_threshold: float = 0.5,
+    ef_search: int | None = None,
+    probes: int | None = None,
+    k: int = 3
+) -> list[Document]:
+    """
+    Asynchronous version of get_relevant_documents_by_vector, for use inside the API event loop.
+
+    Args:
+        embedding (list[float]): The query embedding.
+        vector_store (PostgresVectorStore): An instance of PostgresVectorStore.
+        similarity_threshold (float, optional): Minimum similarity score to consider. Default is 0.5.
+        ef_search (int, optional): HNSW candidate list size for this query.
+        probes (int, optional): Number of IVFFlat lists scanned for this query.
+        k (int, optional): Number of documents fetched. Default is 3.
+
+    Returns:
+        list[Document]: A list of the top k relevant documents.
+    """
+    vector_store = await aget_tuned_vector_store(vector_store, ef_search, probes)
+    docs_distances = await vector_store.asimilarity_search_with_score_by_vector(embedding, k=k)
+    # Même conversion distance -> score de pertinence que similarity_search_with_relevance_scores
+    relevance_score_fn = vector_store._select_relevance_score_fn()
+    relevant_docs_scores = [(doc, relevance_score_fn(distance)) for doc, distance in docs_distances]
+    return filter_relevant_documents(relevant_docs_scores, similarity_threshold)
+
+def document_id(doc: Document) -> str:
+    """
+    Stable content ID of a document, the one ingest.py writes (table key, local index and BM25 index).
+
+    PostgresVectorStore returns documents without `id`: the ID is read from the metadata, or recomputed
+    from the content for rows ingested before it was stored there.
+    """
+    if doc.metadata.get("content_id"):
+        return doc.metadata["content_id"]
+    if doc.id:
+        return doc.id
+    return content_id(
+        doc.page_content, doc.metadata.get("answer", ""), doc.metadata.get("source", ""), doc.metadata.get("focus_area", "")
+    )
+
+def postgres_id_filter(ids: list[str]) -> str:
+    # Les IDs de contenu sont des UUID : validés avant d'être écrits dans la clause WHERE
+    values = ", ".join(f"'{uuid.UUID(doc_id)}'" for doc_id in ids)
+    return f'"{ID_COLUMN}" IN ({values})'
+
+def get_documents_by_ids_with_score(
+    embedding: list[float], vector_store: PostgresVectorStore, ids: list[str]
+) -> list[tuple[Document, float]]:
+    """
+    Documents `ids` with their relevance score for the query embedding (BM25 hits missed by the vector search).
+    """
+    if isinstance(vector_store, PostgresVectorStore):
+        docs_distances = vector_store.similarity_search_with_score_by_vector(embedding, k=len(ids), filter=postgres_id_filter(ids))
+        relevance_score_fn = vector_store._select_relevance_score_fn()
+        return [(doc, relevance_score_fn(distance)) for doc, distance in docs_distances]
+    return vector_store.similarity_search_with_score_by_ids(embedding, ids)
+
+async def aget_documents_by_ids_with_score(
+    embedding: list[float], vector_store: PostgresVectorStore, ids: list[str]
+) -> list[tuple[Document, float]]:
+    if isinstance(vector_store, PostgresVectorStore):
+        docs_distances = await vector_store.asimilarity_search_with_score_by_vector(
+            embedding, k=len(ids), filter=postgres_id_filter(ids)
+        )
+        relevance_score_fn = vector_store._select_relevance_score_fn()
+        return [(doc, relevance_score_fn(distance)) for doc, distance in docs_distances]
+    # Store local : calcul numpy synchrone, hors de la boucle d'événements
+    return await asyncio.to_thread(vector_store.similarity_search_with_score_by_ids, embedding, ids)
+
+def missing_lexical_ids(dense_docs: list[Document], lexical_hits: list[tuple[str, float]]) -> list[str]:
+    dense_ids = {document_id(doc) for doc in dense_docs}
+    return [doc_id for doc_id, _ in lexical_hits if doc_id not in dense_ids]
+
+def fuse_hybrid_documents(
+    dense_docs: list[Document],
+    lexical_hits: list[tuple[str, float]],
+    fetched: list[Document],
+    k: int = 3,
+    weights: tuple[float, float] = (1.0, 1.0),
+    rrf_k: int = 60
+) -> list[Document]:
+    """
+    Fuse the dense ranking and the BM25 ranking with reciprocal-rank fusion and return the top k documents.
+
+    `fetched` are the BM25 hits missing from `dense_docs`, already scored and filtered by the similarity
+    threshold: BM25 hits below the threshold drop out of the BM25 ranking, like dense candidates do.
+    """
+    documents = {document_id(doc): doc for doc in fetched}
+    documents.update({document_id(doc): doc for doc in dense_docs})
+    fused = reciprocal_rank_fusion(
+        [[document_id(doc) for doc in dense_docs], [doc_id for doc_id, _ in lexical_hits if doc_id in documents]],
+        list(weights), rrf_k
+    )[:k]
+    hybrid_docs = []
+    for doc_id, rrf_score in fused:
+        documents[doc_id].metadata["rrf_score"] = rrf_score
+        hybrid_docs.append(documents[doc_id])
+    return hybrid_docs
+
+def get_hybrid_documents_by_vector(
+    query: str,
+    embedding: list[float],
+    vector_store: PostgresVectorStore,
+    lexical_index: BM25Index,
+    similarity_threshold: float = 0.5,
+    k: int = 3,
+    candidates: int = 20,
+    weights: tuple[float, float] = (1.0, 1.0),
+    rrf_k: int = 60,
+    ef_search: int | None = None,
+    probes: int | None = None
+) -> list[Document]:
+    """
+    Vector search and BM25 search over `candidates` documents each, fused with reciprocal-rank fusion.
+
+    BM25 hits missing from the vector candidates are read back from the vector store with their similarity
+    score for the query, and the same `similarity_threshold` applies to both rankings. Every returned
+    document thus has its `score`; if the BM25 hits cannot be read back, the vector results are returned alone.
+
+    Args:
+        query (str): The question, for the BM25 search.
+        embedding (list[float]): The query embedding.
+        vector_store (PostgresVectorStore): An instance of PostgresVectorStore.
+        lexical_index (BM25Index): BM25 index over the same documents (same content IDs).
+        similarity_threshold (float, optional): Minimum similarity score to consider. Default is 0.5.
+        k (int, optional): Number of documents returned. Default is 3.
+        candidates (int, optional): Documents fetched by each search before fusion. Default is 20.
+        weights (tuple[float, float], optional): Weights of the dense and BM25 rankings in the fusion.
+        rrf_k (int, optional): RRF rank offset. Default is 60.
+        ef_search (int, optional): HNSW candidate list size for this query.
+        probes (int, optional): Number of IVFFlat lists scanned for this query.
+
+    Returns:
+        list[Document]: The top k documents, best first, with `score` and `rrf_score` in their metadata.
+    """
+    dense_docs = get_relevant_documents_by_vector(embedding, vector_store, similarity_threshold, ef_search, probes, k=candidates)
+    lexical_hits = lexical_index.search(query, candidates)
+    missing = missing_lexical_ids(dense_docs, lexical_hits)
+    fetched = []
+    if missing:
+        try:
+            fetched = filter_relevant_documents(get_documents_by_ids_with_score(embedding, vector_store, missing), similarity_threshold)
+        except Exception:
+            logger.exception("documents BM25 illisibles dans le vector store, recherche vectorielle seule")
+            return dense_docs[:k]
+    return fuse_hybrid_documents(dense_docs, lexical_hits, fetched, k, weights, rrf_k)
+
+async def aget_hybrid_documents_by_vector(
+    query: str,
+    embedding: list[float],
+    vector_store: PostgresVectorStore,
+    lexical_index: BM25Index,
+    similarity_threshold: float = 0.5,
+    k: int = 3,
+    candidates: int = 20,
+    weights: tuple[float, float] = (1.0, 1.0),
+    rrf_k: int = 60,
+    ef_search: int | None = None,
+    probes: int | None = None
+) -> list[Document]:
+    """
+    Async version of get_hybrid_documents_by_vector: both searches run concurrently.
+    """
+    dense_docs, lexical_hits = await asyncio.gather(
+        aget_relevant_documents_by_vector(embedding, vector_store, similarity_threshold, ef_search, probes, k=candidates),
+        asyncio.to_thread(lexical_index.search, query, candidates)
+    )
+    missing = missing_lexical_ids(dense_docs, lexical_hits)
+    fetched = []
+    if missing:
+        try:
+            fetched = filter_relevant_documents(
+                await aget_documents_by_ids_with_score(embedding, vector_store, missing), similarity_threshold
+            )
+        except Exception:
+            logger.exception("documents BM25 illisibles dans le vector store, recherche vectorielle seule")
+            return dense_docs[:k]
+    return fuse_hybrid_documents(dense_docs, lexical_hits, fetched, k, weights, rrf_k)
+
+async def aget_tuned_vector_store(
+    vector_store: PostgresVectorStore, ef_search: int | None = None, probes: int | None = None
+) -> PostgresVectorStore:
+    if ef_search is None and probes is None:
+        return vector_store
+    # La première utilisation d'un réglage crée une variante du vector store (aller-retour à la base)
+    return await asyncio.to_thread(get_tuned_vector_store, vector_store, ef_search, probes)
+
+def filter_relevant_documents(
+    relevant_docs_scores: list[tuple[Document, float]], similarity_threshold: float
+) -> list[Document]:
+    """
+    Sort (document, score) pairs, store the score in the metadata and drop those below the threshold.
+
+    Args:
+        relevant_docs_scores (list[tuple[Document, float]]): Pairs returned by the vector store.
+        similarity_threshold (float): Minimum similarity score to consider.
+
+    Returns:
+        list[Document]: The documents above the threshold, best first.
+    """
     # Trier par score de similarité décroissant
     relevant_docs_scores.sort(key=lambda x: x[1], reverse=True)
 
@@ -57,7 +306,7 @@ def format_relevant_documents(documents: list[Document]) -> str:
         formatted_docs.append(formatted_doc)
     return "\n".join(formatted_docs)
 
-if _name_ == '_main_':
+if __name__ == '__main__':
     engine = create_cloud_sql_database_connection()
     embedding = get_embeddings()
     vector_store = get_vector_store(engine, TABLE_NAME, embedding)
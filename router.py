@@ -0,0 +1,281 @@
+import argparse
+import math
+import os
+import re
+import threading
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from cache import embed_queries_batch, normalize_text
+
+# 🔹 Règles : mots qui suffisent à eux seuls à classer une entrée
+GENERAL_WORDS = {
+    "bonjour", "bonsoir", "salut", "coucou", "hello", "hi", "hey", "hola",
+    "merci", "beaucoup", "thanks", "thank", "you", "gracias",
+    "au", "revoir", "bye", "goodbye", "bonne", "journée", "soirée", "good", "morning", "evening", "night",
+    "ok", "okay", "d", "accord", "super", "parfait", "great", "cool", "bien", "très", "top",
+    "comment", "ça", "va", "vas", "allez", "vous", "how", "are", "is", "it", "going",
+    "qui", "es", "tu", "êtes", "who", "what", "your", "name", "t", "appelles",
+    "astramed", "oui", "non", "yes", "no", "et", "toi", "and", "je", "vais", "moi", "aussi",
+}
+# Au moins un de ces mots (salutation, remerciement, au revoir, nom de l'assistant) : "what is it?" ou
+# "is it going?", faits de mots outils seulement, ne sont pas des entrées générales
+GENERAL_ANCHOR_WORDS = {
+    "bonjour", "bonsoir", "salut", "coucou", "hello", "hi", "hey", "hola",
+    "merci", "thanks", "thank", "gracias", "revoir", "bye", "goodbye",
+    "journée", "soirée", "morning", "evening", "night", "astramed", "name", "appelles",
+}
+MEDICAL_TERMS = {
+    "symptôme", "symptômes", "symptom", "symptoms", "maladie", "maladies", "disease", "diseases",
+    "traitement", "traitements", "treatment", "treatments", "traiter", "soigner", "guérir", "cure",
+    "diagnostic", "diagnosis", "douleur", "douleurs", "pain", "mal de", "mal à", "mal au", "mal aux",
+    "fièvre", "fever", "toux", "cough", "nausée", "nausées", "vomissements", "fatigue", "vertiges",
+    "médicament", "médicaments", "medication", "medicine", "drug", "drugs", "effets secondaires", "side effects",
+    "infection", "virus", "bactérie", "syndrome", "cancer", "tumeur", "tumor", "allergie", "allergy",
+    "vaccin", "vaccine", "tension", "diabète", "hypertension", "asthme", "asthma", "migraine",
+    "causes", "risk factors", "facteurs de risque", "prévention", "prevention", "genetic", "génétique",
+}
+# Intentions générales reconnues mot à mot (réponses prêtes dans api.py) ; les autres mots tolérés sont neutres
+GENERAL_INTENTS = {
+    "greeting": {"bonjour", "bonsoir", "salut", "coucou", "hello", "hi", "hey", "hola", "morning", "evening",
+                 "مرحبا", "أهلا", "السلام", "عليكم"},
+    "thanks": {"merci", "beaucoup", "thanks", "thank", "gracias", "شكرا", "جزيلا"},
+    "goodbye": {"au", "revoir", "bye", "goodbye", "bonne", "journée", "soirée", "night", "bientôt", "وداعا", "السلامة"},
+    "identity": {"qui", "es", "êtes", "who", "your", "name", "appelles", "appelez", "appelle", "من", "أنت"},
+    "wellbeing": {"ça", "va", "vas", "allez", "how", "going", "doing", "كيف", "حالك"},
+}
+INTENT_FILLER_WORDS = {
+    "astramed", "tu", "vous", "t", "toi", "you", "are", "is", "what", "comment", "et", "and", "good", "ok",
+    "okay", "très", "so", "much", "a", "à", "plus", "mon", "ami", "docteur", "مع",
+}
+# Exemples du prompt de l'agent, complétés de formulations proches, pour les centroïdes
+GENERAL_EXAMPLES = [
+    "bonjour", "merci", "salut, comment ça va ?", "qui es-tu ?", "merci beaucoup pour ton aide",
+    "au revoir", "hello, how are you?", "thank you", "what is your name?", "bonne journée",
+]
+MEDICAL_EXAMPLES = [
+    "mal de tête", "diabète", "quels sont les symptômes du diabète",
+    "comment traiter une migraine ?", "what are the symptoms of glaucoma?", "what causes high blood pressure?",
+    "quels sont les effets secondaires de ce médicament ?", "j'ai de la fièvre et je tousse",
+]
+MAX_TERM_WORDS = 4
+CONFIDENCE_BUCKETS = [0.5, 0.6, 0.7, 0.8, 0.9, 0.95, 1.0]
+
+# Appels LLM d'une requête : l'agent, plus Gemini pour une réponse générale
+AGENT_LLM_CALLS = {"general": 2, "medical": 1}
+DIRECT_LLM_CALLS = {"general": 1, "medical": 0}
+
+
+@dataclass
+class RouteDecision:
+    route: str  # "general", "medical" ou "agent" (pas assez sûr : l'agent décide)
+    confidence: float
+    reason: str  # "keyword", "centroid" ou "empty"
+    label: str  # classe la plus probable, même quand la route est "agent"
+
+
+def tokenize(text: str) -> List[str]:
+    # "Parkinson's Disease" -> ["parkinson", "s", "disease"], pour les questions comme pour les termes
+    return re.findall(r"\w+", normalize_text(text))
+
+
+def general_intent(text: str) -> Optional[str]:
+    """
+    Intention d'une entrée purement conversationnelle ("Bonjour !", "merci beaucoup", "who are you?"),
+    ou None si elle contient autre chose ou mélange plusieurs intentions.
+    """
+    words = tokenize(text)
+    intents = {intent for word in words for intent, vocabulary in GENERAL_INTENTS.items() if word in vocabulary}
+    if len(intents) != 1 or not all(any(word in vocabulary for vocabulary in GENERAL_INTENTS.values())
+                                    or word in INTENT_FILLER_WORDS for word in words):
+        return None
+    return intents.pop()
+
+
+def load_focus_areas(csv_path: str) -> List[str]:
+    """
+    Domaines médicaux (colonne focus_area) du corpus MedQuAD, ou liste vide si le CSV est absent.
+    """
+    if not csv_path or not os.path.exists(csv_path):
+        return []
+    import pandas as pd
+    areas = pd.read_csv(csv_path, usecols=["focus_area"])["focus_area"].dropna().astype(str)
+    return sorted({area.strip() for area in areas if area.strip()})
+
+
+class RouterStats:
+    """
+    Compteurs des décisions du routeur : route et raison, histogramme des confiances, appels LLM économisés.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.decisions: dict = {}
+        self.confidence_buckets = {bucket: 0 for bucket in CONFIDENCE_BUCKETS}
+        self.llm_calls_saved = 0
+
+    def record(self, decision: RouteDecision) -> None:
+        with self._lock:
+            key = f"{decision.route}:{decision.reason}"
+            self.decisions[key] = self.decisions.get(key, 0) + 1
+            bucket = next(bucket for bucket in CONFIDENCE_BUCKETS if decision.confidence <= bucket)
+            self.confidence_buckets[bucket] += 1
+            if decision.route in DIRECT_LLM_CALLS:
+                self.llm_calls_saved += AGENT_LLM_CALLS[decision.route] - DIRECT_LLM_CALLS[decision.route]
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = sum(self.decisions.values())
+            routed = sum(count for key, count in self.decisions.items() if not key.startswith("agent:"))
+            return {
+                "total": total,
+                "routed": routed,
+                "agent": total - routed,
+                "decisions": dict(self.decisions),
+                # Histogramme cumulatif, comme les buckets "le" de Prometheus
+                "confidence_le": {
+                    str(bucket): sum(count for b, count in self.confidence_buckets.items() if b <= bucket)
+                    for bucket in CONFIDENCE_BUCKETS
+                },
+                "llm_calls_saved": self.llm_calls_saved,
+            }
+
+
+class QueryRouter:
+    """
+    Pré-routeur peu coûteux devant l'agent : des mots-clés (salutations, vocabulaire médical, domaines
+    focus_area du corpus) puis, à défaut, la similarité cosinus de la question aux centroïdes des
+    exemples généraux et médicaux. Sous `min_confidence`, la question est laissée à l'agent.
+    """
+
+    def __init__(self, embeddings: Embeddings, focus_areas: Optional[List[str]] = None,
+                 min_confidence: float = 0.8, temperature: float = 0.05):
+        self.embeddings = embeddings
+        self.min_confidence = min_confidence
+        self.temperature = temperature  # Échelle de l'écart de similarité avant la sigmoïde
+        self.focus_areas = focus_areas or []
+        self.medical_terms = {" ".join(tokenize(term)) for term in MEDICAL_TERMS | set(self.focus_areas)}
+        self._centroids: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+        self.stats = RouterStats()
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        # Même tâche (et mêmes clés de cache) que les questions : leur embedding resservira au cache de réponses
+        if hasattr(self.embeddings, "embed_queries"):
+            return self.embeddings.embed_queries(texts)
+        return embed_queries_batch(self.embeddings, texts)
+
+    def fit(self) -> None:
+        """
+        Calcule les centroïdes (un seul appel d'embeddings) ; appelé au démarrage ou au premier besoin.
+        """
+        general = GENERAL_EXAMPLES
+        medical = MEDICAL_EXAMPLES + self.focus_areas
+        vectors = np.asarray(self._embed(general + medical), dtype=np.float32)
+        vectors /= np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+        centroids = np.stack([vectors[:len(general)].mean(axis=0), vectors[len(general):].mean(axis=0)])
+        centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+        with self._lock:
+            self._centroids = centroids
+
+    def _keyword_route(self, words: List[str]) -> Optional[str]:
+        ngrams = {" ".join(words[i:i + n]) for n in range(1, MAX_TERM_WORDS + 1) for i in range(len(words) - n + 1)}
+        if ngrams & self.medical_terms:
+            return "medical"
+        if all(word in GENERAL_WORDS for word in words) and GENERAL_ANCHOR_WORDS.intersection(words):
+            return "general"
+        return None
+
+    def classify(self, text: str, embed_query: Optional[Callable[[str], List[float]]] = None) -> RouteDecision:
+        """
+        Décision pour une question. `embed_query` n'est appelé que si les mots-clés ne suffisent pas.
+        """
+        words = tokenize(text)
+        if not words:
+            return RouteDecision("agent", 0.5, "empty", "general")
+        label = self._keyword_route(words)
+        if label is not None:
+            return RouteDecision(label, 1.0, "keyword", label)
+
+        if self._centroids is None:
+            self.fit()
+        vector = np.asarray((embed_query or self.embeddings.embed_query)(text), dtype=np.float32)
+        vector /= np.linalg.norm(vector) or 1.0
+        general_similarity, medical_similarity = self._centroids @ vector
+        medical_probability = 1.0 / (1.0 + math.exp(-(medical_similarity - general_similarity) / self.temperature))
+        label = "medical" if medical_probability >= 0.5 else "general"
+        confidence = max(medical_probability, 1.0 - medical_probability)
+        route = label if confidence >= self.min_confidence else "agent"
+        return RouteDecision(route, float(confidence), "centroid", label)
+
+    def route(self, text: str, embed_query: Optional[Callable[[str], List[float]]] = None) -> RouteDecision:
+        decision = self.classify(text, embed_query)
+        self.stats.record(decision)
+        return decision
+
+
+def evaluate_router(router: QueryRouter, questions: List[str], labels: List[str]) -> dict:
+    """
+    Précision du routeur sur un jeu étiqueté et appels LLM économisés par rapport à l'agent seul.
+    Les questions laissées à l'agent sont comptées comme bien classées (l'agent reste la référence).
+    """
+    routed = correct_routed = label_correct = 0
+    baseline_calls = routed_calls = 0
+    errors = []
+    for question, label in zip(questions, labels):
+        decision = router.classify(question)
+        baseline_calls += AGENT_LLM_CALLS[label]
+        label_correct += decision.label == label
+        if decision.route == "agent":
+            routed_calls += AGENT_LLM_CALLS[label]
+            continue
+        routed += 1
+        routed_calls += DIRECT_LLM_CALLS[decision.route]
+        if decision.route == label:
+            correct_routed += 1
+        else:
+            errors.append((question, label, decision.route, round(decision.confidence, 3)))
+    return {
+        "questions": len(questions),
+        "routed": routed,
+        "coverage": round(routed / max(len(questions), 1), 4),
+        "routed_accuracy": round(correct_routed / max(routed, 1), 4),
+        "classifier_accuracy": round(label_correct / max(len(questions), 1), 4),
+        "llm_calls_agent_only": baseline_calls,
+        "llm_calls_with_router": routed_calls,
+        "llm_calls_saved": baseline_calls - routed_calls,
+        "errors": errors,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Précision du pré-routeur et appels LLM économisés sur un jeu étiqueté.")
+    parser.add_argument("--testset", default="./router_testset.csv", help="CSV question,route (general ou medical)")
+    parser.add_argument("--min-confidence", type=float, default=None, help="Seuil de confiance (défaut : ROUTER_MIN_CONFIDENCE)")
+    parser.add_argument("--fake", action="store_true", help="Embeddings simulés (seules les règles par mots-clés sont significatives)")
+    args = parser.parse_args()
+
+    import pandas as pd
+    from config import CORPUS_CSV_PATH, ROUTER_MIN_CONFIDENCE
+
+    if args.fake:
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+        embeddings = DeterministicFakeEmbedding(size=768)
+    else:
+        from ingest import get_embeddings
+        embeddings = get_embeddings()
+    router = QueryRouter(
+        embeddings,
+        load_focus_areas(CORPUS_CSV_PATH),
+        args.min_confidence if args.min_confidence is not None else ROUTER_MIN_CONFIDENCE
+    )
+    testset = pd.read_csv(args.testset)
+    report = evaluate_router(router, testset["question"].tolist(), testset["route"].tolist())
+    errors = report.pop("errors")
+    for key, value in report.items():
+        print(f"{key}: {value}")
+    for question, label, route, confidence in errors:
+        print(f"❌ {question!r} : attendu {label}, routé {route} (confiance {confidence})")
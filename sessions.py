@@ -0,0 +1,244 @@
+import json
+import sqlite3
+import threading
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field, asdict
+from typing import Iterable, List, Optional
+
+import numpy as np
+
+from router import tokenize, MAX_TERM_WORDS
+
+# 🔹 Relances : début de phrase ou mots qui renvoient au sujet du tour précédent
+FOLLOW_UP_PREFIXES = [
+    "and", "what about", "how about", "also", "then", "so",
+    "et", "et pour", "et si", "quid", "aussi", "alors", "du coup", "pareil",
+]
+FOLLOW_UP_WORDS = {
+    "it", "its", "this", "that", "these", "those", "they", "them", "their",
+    "ça", "cela", "ceci", "celle", "celui", "celles", "ceux", "cette", "elle", "il", "ils", "elles",
+}
+# Plafond mémoire d'une session : max_turns tours de questions tronquées, un vecteur et une recherche
+MAX_STORED_QUESTION_CHARS = 500
+MAX_STORED_RETRIEVAL_CHARS = 20000
+
+
+@dataclass
+class SessionTurn:
+    question: str  # Question telle que posée
+    query: str  # Question autonome réellement traitée (réécrite si c'était une relance)
+    response_type: str
+    topic: str = ""  # focus_area de la source principale, sinon vide
+    doc_ids: List[str] = field(default_factory=list)
+    created_at: float = 0.0
+
+
+@dataclass
+class Session:
+    turns: deque
+    updated_at: float
+    # Dernière recherche, réutilisable si la question suivante porte sur le même sujet
+    last_vector: Optional[List[float]] = None
+    last_retrieval: Optional[tuple] = None
+    last_threshold: Optional[float] = None
+
+
+def is_follow_up(question: str, known_topics: set = frozenset(), max_words: int = 6) -> bool:
+    """
+    Relance courte qui dépend du tour précédent ("and the treatment?", "et pour les enfants ?", "is it genetic?").
+    Une question qui nomme un domaine connu (focus_area tokenisé, voir topic_terms) n'en est pas une.
+    """
+    words = tokenize(question)
+    if not words or len(words) > max_words:
+        return False
+    ngrams = {" ".join(words[i:i + n]) for n in range(1, MAX_TERM_WORDS + 1) for i in range(len(words) - n + 1)}
+    if ngrams & known_topics:
+        return False
+    text = " ".join(words)
+    return any(text == prefix or text.startswith(prefix + " ") for prefix in FOLLOW_UP_PREFIXES) \
+        or bool(set(words) & FOLLOW_UP_WORDS)
+
+
+def topic_terms(focus_areas: Iterable[str]) -> set:
+    return {" ".join(tokenize(area)) for area in focus_areas}
+
+
+def rewrite_follow_up(question: str, previous: Optional[SessionTurn], known_topics: set = frozenset(), max_words: int = 6) -> str:
+    """
+    Question autonome pour l'embedding, la recherche et l'agent : la relance est complétée par le sujet
+    du dernier tour médical, sans appel au LLM. Les autres questions sont renvoyées telles quelles.
+    """
+    if previous is None or previous.response_type != "medical" or not is_follow_up(question, known_topics, max_words):
+        return question
+    # Sans source (donc sans focus_area), le sujet est la question précédente, si elle était autonome
+    if not previous.topic and is_follow_up(previous.query, known_topics, max_words):
+        return question
+    topic = previous.topic or previous.query
+    return f"{question.strip()} ({topic})"
+
+
+class SessionStore:
+    """
+    Mémoire de conversation par session_id : les `max_turns` derniers tours et la dernière recherche de documents.
+
+    Les sessions inactives depuis `ttl_seconds` expirent et les moins récemment utilisées sont évincées
+    au-delà de `max_sessions`, ce qui borne la mémoire totale. Avec `persist_path`, chaque session est aussi
+    écrite dans un fichier SQLite et rechargée après un redémarrage ou une éviction. Avec `shared` (plusieurs
+    workers sur le même fichier), le fichier fait foi : la session est relue à chaque accès, car le tour
+    précédent a pu être servi par un autre worker.
+    """
+
+    def __init__(self, max_sessions: int = 10000, ttl_seconds: float = 1800, max_turns: int = 10,
+                 persist_path: Optional[str] = None, shared: bool = False):
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.max_turns = max_turns
+        self.shared = bool(persist_path) and shared
+        self._sessions: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._conn = None
+        if persist_path:
+            self._conn = sqlite3.connect(persist_path, check_same_thread=False, timeout=10)
+            with self._lock:
+                self._conn.execute("PRAGMA journal_mode=WAL")
+                self._conn.execute(
+                    "CREATE TABLE IF NOT EXISTS sessions (session_id TEXT PRIMARY KEY, updated_at REAL NOT NULL, data TEXT NOT NULL)"
+                )
+                self._conn.commit()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.rewrites = 0
+        self.retrieval_reuses = 0
+
+    # 🔹 Persistance SQLite (optionnelle)
+    def _load(self, session_id: str, now: float) -> Optional[Session]:
+        row = self._conn.execute(
+            "SELECT updated_at, data FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        if row is None or now - row[0] > self.ttl_seconds:
+            return None
+        data = json.loads(row[1])
+        retrieval = data.get("last_retrieval")
+        return Session(
+            turns=deque((SessionTurn(**turn) for turn in data["turns"]), maxlen=self.max_turns),
+            updated_at=row[0],
+            last_vector=data.get("last_vector"),
+            last_retrieval=tuple(retrieval) if retrieval else None,
+            last_threshold=data.get("last_threshold"),
+        )
+
+    def _save(self, session_id: str, session: Session) -> None:
+        data = {
+            "turns": [asdict(turn) for turn in session.turns],
+            "last_vector": session.last_vector,
+            "last_retrieval": session.last_retrieval,
+            "last_threshold": session.last_threshold,
+        }
+        self._conn.execute(
+            "INSERT OR REPLACE INTO sessions (session_id, updated_at, data) VALUES (?, ?, ?)",
+            (session_id, session.updated_at, json.dumps(data, ensure_ascii=False)),
+        )
+        self._conn.commit()
+
+    # 🔹 Lecture et écriture des tours
+    def get(self, session_id: str, now: float) -> Optional[Session]:
+        with self._lock:
+            session = self._sessions.get(session_id) if not self.shared else None
+            if session is not None and now - session.updated_at > self.ttl_seconds:
+                del self._sessions[session_id]
+                self.expirations += 1
+                session = None
+            if session is None and self._conn is not None:
+                session = self._load(session_id, now)
+                if session is not None:
+                    self._insert(session_id, session)
+            if session is None:
+                self.misses += 1
+                return None
+            self._sessions.move_to_end(session_id)
+            self.hits += 1
+            return session
+
+    def _insert(self, session_id: str, session: Session) -> None:
+        self._sessions[session_id] = session
+        self._sessions.move_to_end(session_id)
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            self.evictions += 1
+
+    @staticmethod
+    def last_turn(session: Optional[Session]) -> Optional[SessionTurn]:
+        return session.turns[-1] if session is not None and session.turns else None
+
+    def reusable_retrieval(self, session: Optional[Session], vector: List[float], similarity_threshold: float,
+                           min_similarity: float) -> Optional[tuple]:
+        """
+        Dernière recherche de la session si la nouvelle question en est assez proche (cosinus) et
+        utilise le même seuil de similarité RAG, sinon None.
+
+        `session` est celle lue une seule fois par requête avec get (un seul hit compté, une seule lecture SQLite).
+        """
+        if session is None or session.last_retrieval is None or session.last_threshold != similarity_threshold:
+            return None
+        previous = np.asarray(session.last_vector, dtype=np.float32)
+        query = np.asarray(vector, dtype=np.float32)
+        similarity = float(previous @ query / ((np.linalg.norm(previous) * np.linalg.norm(query)) or 1.0))
+        if similarity < min_similarity:
+            return None
+        with self._lock:
+            self.retrieval_reuses += 1
+        return session.last_retrieval
+
+    def append(self, session_id: str, turn: SessionTurn, vector: Optional[List[float]] = None,
+               retrieval: Optional[tuple] = None, similarity_threshold: Optional[float] = None) -> None:
+        turn.question = turn.question[:MAX_STORED_QUESTION_CHARS]
+        turn.query = turn.query[:MAX_STORED_QUESTION_CHARS]
+        with self._lock:
+            session = self._sessions.get(session_id) if not self.shared else None
+            if session is not None and turn.created_at - session.updated_at > self.ttl_seconds:
+                session = None  # Session expirée : la conversation repart de zéro
+            if session is None and self._conn is not None:
+                session = self._load(session_id, turn.created_at)
+            if session is None:
+                session = Session(turns=deque(maxlen=self.max_turns), updated_at=turn.created_at)
+            self._insert(session_id, session)
+            session.turns.append(turn)  # deque(maxlen) : le plus ancien tour sort
+            session.updated_at = turn.created_at
+            # Une seule recherche gardée par session (la plus récente)
+            if retrieval is not None and len(retrieval[0]) > MAX_STORED_RETRIEVAL_CHARS:
+                retrieval = None
+            session.last_vector = vector
+            session.last_retrieval = retrieval
+            session.last_threshold = similarity_threshold if retrieval is not None else None
+            if self._conn is not None:
+                self._save(session_id, session)
+
+    def record_rewrite(self) -> None:
+        with self._lock:
+            self.rewrites += 1
+
+    def clear(self, session_id: str) -> bool:
+        with self._lock:
+            removed = self._sessions.pop(session_id, None) is not None
+            if self._conn is not None:
+                removed = self._conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,)).rowcount > 0 or removed
+                self._conn.commit()
+            return removed
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "ttl_seconds": self.ttl_seconds,
+            "max_turns": self.max_turns,
+            "persistent": self._conn is not None,
+            "shared": self.shared,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "rewrites": self.rewrites,
+            "retrieval_reuses": self.retrieval_reuses,
+        }
@@ -0,0 +1,25 @@
+import os
+import sys
+
+import pytest
+
+# Modules du projet importables depuis tests/ (ils sont à la racine du dépôt)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def fake_api(monkeypatch, tmp_path):
+    """
+    Installe les remplaçants de benchmarks/fakes.py dans api : fake_api(**réglages de install_fakes) retourne le module.
+    Tout passe par monkeypatch, donc les globales d'api sont restaurées à la fin du test.
+    """
+    import api
+    from benchmarks.fakes import install_fakes
+
+    def install(**settings):
+        install_fakes(api, workdir=str(tmp_path), patch=monkeypatch.setattr, **settings)
+        return api
+
+    yield install
+    # Agents construits avec le LLM simulé
+    api._build_agent_executor.cache_clear()
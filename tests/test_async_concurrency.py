@@ -0,0 +1,56 @@
+import asyncio
+import time
+
+import pytest
+
+from cache import lazy_singleton
+
+LLM_LATENCY_S = 0.2
+
+QUESTIONS = [
+    "What are the symptoms of Glaucoma ?", "How to prevent Diabetes ?", "What causes Asthma ?", "Is Epilepsy inherited ?",
+    "How to diagnose Lupus ?", "What is the outlook for Stroke ?", "What are the treatments for Migraine ?", "What causes Gout ?",
+]
+
+
+@pytest.fixture
+def slow_api(fake_api, monkeypatch):
+    """
+    API avec remplaçants : LLM à LLM_LATENCY_S avant le premier token, embeddings à 20 ms, recherche hybride
+    locale ; sans cache des réponses ni routeur, chaque requête passe par l'agent et la recherche asynchrone.
+    """
+    api = fake_api(embedding_latency_ms=20.0, first_token_ms=LLM_LATENCY_S * 1000, tokens_per_second=100000.0)
+    monkeypatch.setattr(api, "get_query_router", lazy_singleton(lambda: None))
+    monkeypatch.setattr(api, "get_session_store", lazy_singleton(lambda: None))
+    # answer_all remplace le sémaphore : celui d'origine est restauré à la fin du test
+    monkeypatch.setattr(api, "request_semaphore", api.request_semaphore)
+    api.get_store()
+    return api
+
+
+async def answer_all(api, questions, max_concurrent=None) -> float:
+    if max_concurrent is not None:
+        # Sémaphore créé dans la boucle du test (celui du module peut être lié à la boucle d'un autre test)
+        api.request_semaphore = asyncio.Semaphore(max_concurrent)
+    started = time.perf_counter()
+    results = await asyncio.gather(*(
+        api.run_answer(api.UserInput(question=question, temperature=0.0, language="English", similarity_threshold=0.0))
+        for question in questions
+    ))
+    assert all(result["type"] == "medical" for result in results)
+    return time.perf_counter() - started
+
+
+def test_concurrent_requests_do_not_block_each_other(slow_api):
+    single = asyncio.run(answer_all(slow_api, QUESTIONS[:1], max_concurrent=32))
+    concurrent = asyncio.run(answer_all(slow_api, QUESTIONS, max_concurrent=32))
+    # Boucle d'événements bloquée : 8 requêtes prendraient 8 fois le temps d'une seule
+    assert concurrent < 3 * single
+    assert len(QUESTIONS) / concurrent > 3 / single
+
+
+def test_concurrency_limit_queues_agent_runs(slow_api):
+    elapsed = asyncio.run(answer_all(slow_api, QUESTIONS[:6], max_concurrent=2))
+    # 6 requêtes, 2 agents à la fois : au moins 3 appels au LLM l'un après l'autre
+    assert elapsed >= 3 * LLM_LATENCY_S
+    assert elapsed < 6 * LLM_LATENCY_S
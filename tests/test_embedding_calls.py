@@ -0,0 +1,98 @@
+import asyncio
+
+import pytest
+
+from benchmarks.fakes import HashingEmbeddings
+from cache import SemanticResponseCache, lazy_singleton
+from sessions import SessionStore
+
+
+class CountingEmbeddings(HashingEmbeddings):
+    """
+    Embeddings par hachage qui notent chaque texte envoyé au service (sans cache devant : un doublon compte).
+    """
+
+    def __init__(self):
+        super().__init__(latency_ms=0.0)
+        self.texts = []
+
+    def embed_query(self, text):
+        self.texts.append(text)
+        return super().embed_query(text)
+
+    async def aembed_query(self, text):
+        self.texts.append(text)
+        return await super().aembed_query(text)
+
+    def embed_documents(self, texts):
+        self.texts.extend(texts)
+        return super().embed_documents(texts)
+
+
+@pytest.fixture
+def api_with_counter(fake_api, monkeypatch):
+    api = fake_api(embedding_latency_ms=0.0, first_token_ms=0.0, tokens_per_second=100000.0)
+    counter = CountingEmbeddings()
+    monkeypatch.setattr(api, "get_embedding", lazy_singleton(lambda: counter))
+    monkeypatch.setattr(api, "get_response_cache", lazy_singleton(
+        lambda: SemanticResponseCache(max_size=100, ttl_seconds=3600, min_similarity=0.95)
+    ))
+    monkeypatch.setattr(api, "get_session_store", lazy_singleton(
+        lambda: SessionStore(max_sessions=100, ttl_seconds=3600, max_turns=10)
+    ))
+    monkeypatch.setattr(api, "get_query_router", lazy_singleton(lambda: None))
+    api.general_reply_cache.clear()
+    return api, counter
+
+
+def ask(api, question: str, **fields) -> dict:
+    user_input = api.UserInput(
+        question=question, temperature=0.0, language="English", similarity_threshold=0.0, **fields
+    )
+    return asyncio.run(api.run_answer(user_input))
+
+
+def test_agent_answer_embeds_question_once(api_with_counter):
+    api, counter = api_with_counter
+    result = ask(api, "What are the symptoms of Glaucoma ?")
+    assert result["type"] == "medical" and result["answers"]
+    # Cache des réponses, recherche de l'outil et sources de la réponse : un seul embedding
+    assert counter.texts == ["What are the symptoms of Glaucoma ?"]
+
+
+def test_answer_without_caches_embeds_question_once(api_with_counter, monkeypatch):
+    api, counter = api_with_counter
+    monkeypatch.setattr(api, "get_response_cache", lazy_singleton(lambda: None))
+    ask(api, "How to prevent Diabetes ?")
+    assert counter.texts == ["How to prevent Diabetes ?"]
+
+
+def test_router_reuses_the_question_embedding(api_with_counter, monkeypatch):
+    api, counter = api_with_counter
+    from router import QueryRouter, load_focus_areas
+
+    query_router = QueryRouter(counter, load_focus_areas(api.CORPUS_CSV_PATH), 0.0)
+    query_router.fit()
+    monkeypatch.setattr(api, "get_query_router", lazy_singleton(lambda: query_router))
+    counter.texts.clear()
+    for response_cache in [None, SemanticResponseCache(max_size=100)]:
+        monkeypatch.setattr(api, "get_response_cache", lazy_singleton(lambda: response_cache))
+        ask(api, "Tell me more about Asthma please")
+    assert counter.texts == ["Tell me more about Asthma please"] * 2
+
+
+def test_session_follow_up_embeds_rewritten_question_once(api_with_counter):
+    api, counter = api_with_counter
+    ask(api, "What are the symptoms of Glaucoma ?", session_id="s1")
+    counter.texts.clear()
+    ask(api, "and the treatment?", session_id="s1")
+    assert len(counter.texts) == 1
+
+
+def test_batch_embeds_each_distinct_question_once(api_with_counter):
+    api, counter = api_with_counter
+    questions = ["What causes Asthma ?", "What is (are) Gout ?", "What causes Asthma ?"]
+    batch = api.BatchInput(questions=questions, temperature=0.0, language="English", similarity_threshold=0.0)
+    result = asyncio.run(api.answer_batch(batch))
+    assert [item["question"] for item in result["results"]] == questions
+    assert sorted(counter.texts) == ["What causes Asthma ?", "What is (are) Gout ?"]
@@ -0,0 +1,393 @@
+import argparse
+import asyncio
+import math
+import re
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, List, Optional
+
+import numpy as np
+
+from cache import LRUCache, normalize_text
+
+# Le corpus MedQuAD est en anglais : les recherches se font en anglais
+RETRIEVAL_LANGUAGE = "en"
+LANGUAGE_NAMES = {"en": "anglais", "fr": "français", "ar": "arabe"}
+
+# 🔹 Glossaire médical du traducteur local (français / arabe -> anglais), sur les questions de type MedQuAD
+FRENCH_GLOSSARY = {
+    # Tournures de question
+    "qu'est-ce que": "what is", "qu'est-ce que c'est": "what is", "c'est quoi": "what is", "qu'est-ce qui cause": "what causes",
+    "quels sont": "what are", "quelles sont": "what are", "quel est": "what is", "quelle est": "what is",
+    "comment traiter": "how to treat", "comment soigner": "how to treat", "comment prévenir": "how to prevent",
+    "comment éviter": "how to prevent", "comment diagnostiquer": "how to diagnose", "est-ce que": "is",
+    "est-il héréditaire": "is inherited", "est-elle héréditaire": "is inherited",
+    # Mots fréquents
+    "symptômes": "symptoms", "symptôme": "symptom", "signes": "signs", "traitements": "treatments", "traitement": "treatment",
+    "causes": "causes", "cause": "causes", "diagnostic": "diagnosis", "héréditaire": "inherited", "génétique": "genetic",
+    "pronostic": "outlook", "prévention": "prevention", "risques": "risks", "risque": "risk", "facteurs": "factors",
+    "médicaments": "medications", "médicament": "medication", "maladie": "disease", "maladies": "diseases",
+    "douleur": "pain", "fièvre": "fever", "enfants": "children", "personnes âgées": "older adults", "grossesse": "pregnancy",
+    "pour": "for", "et": "and", "de": "of", "du": "of", "des": "of", "d": "of", "contre": "against", "avec": "with",
+    "le": "", "la": "", "les": "", "l": "", "un": "", "une": "", "ce": "", "que": "", "qui": "", "est": "is", "sont": "are",
+    # Domaines (focus_area MedQuAD)
+    "glaucome": "glaucoma", "diabète": "diabetes", "asthme": "asthma", "hypertension artérielle": "high blood pressure",
+    "hypertension": "high blood pressure", "tension artérielle élevée": "high blood pressure", "migraine": "migraine",
+    "ostéoporose": "osteoporosis", "maladie d'alzheimer": "alzheimer's disease", "alzheimer": "alzheimer's disease",
+    "maladie de parkinson": "parkinson's disease", "parkinson": "parkinson's disease", "cancer du sein": "breast cancer",
+    "cancer de la prostate": "prostate cancer", "accident vasculaire cérébral": "stroke", "avc": "stroke",
+    "insuffisance cardiaque": "heart failure", "arthrite": "arthritis", "psoriasis": "psoriasis", "anémie": "anemia",
+    "hépatite b": "hepatitis b", "tuberculose": "tuberculosis", "grippe": "influenza", "maladie rénale": "kidney disease",
+    "maladie des reins": "kidney disease", "cataracte": "cataract", "épilepsie": "epilepsy", "obésité": "obesity",
+    "maladie cœliaque": "celiac disease", "lupus": "lupus", "goutte": "gout", "zona": "shingles",
+    "drépanocytose": "sickle cell disease", "mucoviscidose": "cystic fibrosis", "hypothyroïdie": "hypothyroidism",
+    "paludisme": "malaria", "cancer": "cancer", "cœur": "heart", "poumons": "lungs", "yeux": "eyes", "sang": "blood",
+}
+ARABIC_GLOSSARY = {
+    # Tournures de question
+    "ما هي أعراض": "what are the symptoms of", "ما أعراض": "what are the symptoms of", "ما هو علاج": "what are the treatments for",
+    "ما هي علاجات": "what are the treatments for", "ما علاج": "what are the treatments for", "كيف يعالج": "how to treat",
+    "كيف أعالج": "how to treat", "كيف يمكن الوقاية من": "how to prevent", "كيف أتجنب": "how to prevent",
+    "كيف أقي نفسي من": "how to prevent", "ما هي أسباب": "what causes", "ما أسباب": "what causes", "ما سبب": "what causes",
+    "كيف يتم تشخيص": "how to diagnose", "كيف يشخص": "how to diagnose", "ما هو": "what is", "ما هي": "what is", "ما": "what",
+    "هل": "is", "كيف": "how",
+    # Mots fréquents
+    "أعراض": "symptoms", "علاج": "treatment", "علاجات": "treatments", "أسباب": "causes", "تشخيص": "diagnosis",
+    "وراثي": "inherited", "وراثية": "inherited", "الوقاية": "prevention", "مرض": "disease", "أمراض": "diseases",
+    "دواء": "medication", "أدوية": "medications", "ألم": "pain", "حمى": "fever", "الأطفال": "children", "الحمل": "pregnancy",
+    "توقعات": "outlook", "مضاعفات": "complications", "عوامل الخطر": "risk factors", "من": "", "في": "", "عند": "", "عن": "",
+    # Domaines (focus_area MedQuAD)
+    "الجلوكوما": "glaucoma", "الزرق": "glaucoma", "الماء الأزرق": "glaucoma", "السكري": "diabetes", "مرض السكري": "diabetes",
+    "الربو": "asthma", "ارتفاع ضغط الدم": "high blood pressure", "ضغط الدم المرتفع": "high blood pressure",
+    "الصداع النصفي": "migraine", "الشقيقة": "migraine", "هشاشة العظام": "osteoporosis", "الزهايمر": "alzheimer's disease",
+    "مرض الزهايمر": "alzheimer's disease", "باركنسون": "parkinson's disease", "مرض باركنسون": "parkinson's disease",
+    "سرطان الثدي": "breast cancer", "سرطان البروستاتا": "prostate cancer", "السكتة الدماغية": "stroke",
+    "الجلطة الدماغية": "stroke", "قصور القلب": "heart failure", "فشل القلب": "heart failure", "التهاب المفاصل": "arthritis",
+    "الصدفية": "psoriasis", "فقر الدم": "anemia", "التهاب الكبد ب": "hepatitis b", "السل": "tuberculosis",
+    "الإنفلونزا": "influenza", "الانفلونزا": "influenza", "أمراض الكلى": "kidney disease", "مرض الكلى": "kidney disease",
+    "الساد": "cataract", "إعتام عدسة العين": "cataract", "الماء الأبيض": "cataract", "الصرع": "epilepsy", "السمنة": "obesity",
+    "الداء البطني": "celiac disease", "الذئبة": "lupus", "النقرس": "gout", "الهربس النطاقي": "shingles",
+    "فقر الدم المنجلي": "sickle cell disease", "التليف الكيسي": "cystic fibrosis", "قصور الغدة الدرقية": "hypothyroidism",
+    "الملاريا": "malaria", "سرطان": "cancer", "القلب": "heart", "الدم": "blood",
+}
+
+FRENCH_MARKERS = {
+    "le", "la", "les", "des", "du", "de", "un", "une", "est", "sont", "quels", "quelles", "quel", "quelle", "comment",
+    "pourquoi", "qu", "ce", "que", "qui", "quoi", "pour", "avec", "et", "je", "j", "mon", "ma", "mes", "suis", "ai",
+}
+ENGLISH_MARKERS = {
+    "the", "what", "are", "is", "how", "of", "which", "for", "to", "does", "do", "can", "who", "why", "and", "with",
+    "i", "my", "have", "symptoms", "treatment", "treatments", "disease", "causes", "prevent", "diagnose", "outlook",
+}
+FRENCH_ACCENTS = re.compile("[éèêàâçùûôîïœ]")
+ARABIC_DIACRITICS = re.compile("[\u064b-\u0652\u0640]")  # Voyelles courtes et tatwil
+ARABIC_ARTICLES = ("وال", "بال", "لل", "ال")
+
+
+def fold_arabic(word: str) -> str:
+    """
+    Forme de comparaison d'un mot arabe : sans voyelles ni article, hamza et tā' marbūṭa unifiées.
+    """
+    word = ARABIC_DIACRITICS.sub("", word)
+    word = word.translate(str.maketrans({"أ": "ا", "إ": "ا", "آ": "ا", "ى": "ي", "ة": "ه"}))
+    for article in ARABIC_ARTICLES:
+        if word.startswith(article) and len(word) - len(article) >= 2:
+            return word[len(article):]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    # Mêmes mots que router.tokenize ("qu'est-ce" -> ["qu", "est", "ce"]), mots arabes repliés
+    return [fold_arabic(word) for word in re.findall(r"\w+", normalize_text(text))]
+
+
+def detect_language(text: str) -> str:
+    """
+    "ar" si l'essentiel des lettres est arabe, "fr" si les mots outils ou accents français l'emportent, sinon "en".
+    """
+    letters = [char for char in text if char.isalpha()]
+    if not letters:
+        return RETRIEVAL_LANGUAGE
+    if sum("\u0600" <= char <= "\u06ff" for char in letters) / len(letters) > 0.3:
+        return "ar"
+    words = re.findall(r"\w+", normalize_text(text))
+    french = sum(word in FRENCH_MARKERS for word in words) + 2 * bool(FRENCH_ACCENTS.search(text.lower()))
+    english = sum(word in ENGLISH_MARKERS for word in words)
+    return "fr" if french > english else "en"
+
+
+# 🔹 Traducteurs : translate(texte, source, cible) et sa version asynchrone
+class GlossaryTranslator:
+    """
+    Traducteur local sans appel réseau : remplacement des expressions du glossaire médical, la plus longue d'abord.
+    Les mots inconnus (noms de médicaments, termes déjà anglais) sont gardés tels quels. Sert de remplaçant
+    hors ligne et de référence pour les benchmarks ; dans le sens anglais -> français/arabe, le glossaire est inversé.
+    """
+
+    name = "glossary"
+
+    def __init__(self, glossaries: Optional[dict] = None):
+        glossaries = glossaries or {"fr": FRENCH_GLOSSARY, "ar": ARABIC_GLOSSARY}
+        self._tables: dict = {}
+        self._max_words = 1
+        for language, glossary in glossaries.items():
+            forward, backward = {}, {}
+            for phrase, translation in glossary.items():
+                forward[tuple(tokenize(phrase))] = translation
+                self._max_words = max(self._max_words, len(tokenize(phrase)), len(tokenize(translation)))
+                if translation:
+                    backward.setdefault(tuple(tokenize(translation)), phrase)
+            self._tables[(language, RETRIEVAL_LANGUAGE)] = forward
+            self._tables[(RETRIEVAL_LANGUAGE, language)] = backward
+
+    def translate(self, text: str, source: str, target: str) -> str:
+        table = self._tables.get((source, target))
+        if table is None:
+            return text
+        words, output, i = tokenize(text), [], 0
+        while i < len(words):
+            for size in range(min(self._max_words, len(words) - i), 0, -1):
+                translation = table.get(tuple(words[i:i + size]))
+                if translation is not None:
+                    output.append(translation)
+                    i += size
+                    break
+            else:
+                output.append(words[i])
+                i += 1
+        translated = " ".join(part for part in output if part)
+        return translated + " ?" if text.rstrip().endswith(("?", "؟")) else translated
+
+    async def atranslate(self, text: str, source: str, target: str) -> str:
+        return self.translate(text, source, target)
+
+
+class LLMTranslator:
+    """
+    Traduction par le LLM de l'application (client partagé, température 0), en une phrase sans commentaire.
+    """
+
+    name = "llm"
+    PROMPT = (
+        "Traduis cette question médicale du {source} vers l'{target}. Garde les noms de maladies et de médicaments "
+        "sous leur forme usuelle en {target}. Réponds uniquement par la traduction, sans guillemets ni explication.\n\n{text}"
+    )
+
+    def __init__(self, get_llm: Callable[[], object]):
+        self.get_llm = get_llm
+
+    def _messages(self, text: str, source: str, target: str) -> List[dict]:
+        prompt = self.PROMPT.format(source=LANGUAGE_NAMES.get(source, source), target=LANGUAGE_NAMES.get(target, target), text=text)
+        return [{"role": "user", "content": prompt}]
+
+    @staticmethod
+    def _clean(text: str, translation: str) -> str:
+        translation = translation.strip().strip("\"'«»“”").strip()
+        # Réponse vide ou bavarde : la question d'origine vaut mieux qu'une mauvaise requête
+        return translation if translation and len(translation) <= 4 * len(text) + 40 else text
+
+    def translate(self, text: str, source: str, target: str) -> str:
+        return self._clean(text, self.get_llm().invoke(self._messages(text, source, target)).content)
+
+    async def atranslate(self, text: str, source: str, target: str) -> str:
+        return self._clean(text, (await self.get_llm().ainvoke(self._messages(text, source, target))).content)
+
+
+# 🔹 Cache borné des traductions, dans les deux sens
+class TranslationCache:
+    """
+    LRU des traductions par (langue source, langue cible, texte normalisé). Chaque traduction est aussi
+    gardée dans le sens inverse : la requête anglaise d'une question française redonne cette question.
+    """
+
+    def __init__(self, max_size: int = 10000):
+        self.entries = LRUCache(max_size)
+
+    def get(self, text: str, source: str, target: str) -> Optional[str]:
+        return self.entries.get((source, target, normalize_text(text)))
+
+    def put(self, text: str, source: str, target: str, translation: str) -> None:
+        self.entries.put((source, target, normalize_text(text)), translation)
+        if normalize_text(translation) != normalize_text(text):
+            self.entries.put((target, source, normalize_text(translation)), text)
+
+    def stats(self) -> dict:
+        return self.entries.stats()
+
+
+@dataclass
+class NormalizedQuery:
+    text: str  # Question d'origine
+    language: str  # Langue détectée
+    query: str  # Requête de recherche, en anglais
+    source: str  # "as_is" (déjà en anglais), "cache", "translator" ou "error" (traduction impossible : question d'origine)
+
+
+class QueryNormalizer:
+    """
+    Étape avant la recherche : détection de la langue de la question, puis traduction en anglais (langue du
+    corpus) via le cache ou le traducteur. Une traduction qui échoue ou dépasse `timeout_s` laisse la question
+    telle quelle : la recherche est moins bonne mais la réponse n'est pas bloquée.
+    """
+
+    def __init__(self, translator, cache_size: int = 10000, timeout_s: float = 5.0):
+        self.translator = translator
+        self.cache = TranslationCache(cache_size)
+        self.timeout_s = timeout_s
+        self._lock = threading.Lock()
+        self.languages: dict = {}
+        self.translated = 0
+        self.failures = 0
+        self.translation_seconds = 0.0
+
+    def _detect(self, text: str) -> tuple[str, Optional[NormalizedQuery]]:
+        language = detect_language(text)
+        with self._lock:
+            self.languages[language] = self.languages.get(language, 0) + 1
+        if language == RETRIEVAL_LANGUAGE:
+            return language, NormalizedQuery(text, language, text, "as_is")
+        cached = self.cache.get(text, language, RETRIEVAL_LANGUAGE)
+        if cached is not None:
+            return language, NormalizedQuery(text, language, cached, "cache")
+        return language, None
+
+    def _record(self, text: str, language: str, translation: Optional[str], started: float) -> NormalizedQuery:
+        with self._lock:
+            self.translation_seconds += time.perf_counter() - started
+            if translation is None:
+                self.failures += 1
+            else:
+                self.translated += 1
+        if translation is None:
+            return NormalizedQuery(text, language, text, "error")
+        self.cache.put(text, language, RETRIEVAL_LANGUAGE, translation)
+        return NormalizedQuery(text, language, translation, "translator")
+
+    def normalize(self, text: str) -> NormalizedQuery:
+        language, normalized = self._detect(text)
+        if normalized is not None:
+            return normalized
+        started = time.perf_counter()
+        try:
+            translation = self.translator.translate(text, language, RETRIEVAL_LANGUAGE)
+        except Exception:
+            translation = None
+        return self._record(text, language, translation, started)
+
+    async def anormalize(self, text: str) -> NormalizedQuery:
+        language, normalized = self._detect(text)
+        if normalized is not None:
+            return normalized
+        started = time.perf_counter()
+        try:
+            translation = await asyncio.wait_for(self.translator.atranslate(text, language, RETRIEVAL_LANGUAGE), self.timeout_s)
+        except Exception:
+            translation = None
+        return self._record(text, language, translation, started)
+
+    def stats(self) -> dict:
+        cache = self.cache.stats()
+        return {
+            "translator": getattr(self.translator, "name", type(self.translator).__name__),
+            "languages": dict(self.languages),
+            "translated": self.translated,
+            "failures": self.failures,
+            "translation_seconds": round(self.translation_seconds, 3),
+            "cache_hits": cache["hits"],
+            "cache_misses": cache["misses"],
+            "cache_size": cache["size"],
+        }
+
+
+# 🔹 Benchmark : recherche avec la question telle quelle vs normalisée en anglais
+def benchmark_normalization(vector_store, samples: List[dict], embedding, normalizer: QueryNormalizer,
+                            similarity_threshold: float = 0.5, k: int = 3) -> List[dict]:
+    """
+    Par langue et pour les deux requêtes : part du top k dans le focus_area attendu, meilleure similarité,
+    part de questions sans document au-dessus du seuil ("Aucune source pertinente"), et temps de normalisation
+    à froid puis avec le cache de traductions.
+    """
+    from retrieve import get_relevant_documents_by_vector
+
+    detected, cold_ms, warm_ms, queries = [], [], [], []
+    for sample in samples:
+        started = time.perf_counter()
+        normalized = normalizer.normalize(sample["question"])
+        cold_ms.append((time.perf_counter() - started) * 1000)
+        started = time.perf_counter()
+        normalizer.normalize(sample["question"])
+        warm_ms.append((time.perf_counter() - started) * 1000)
+        detected.append(normalized.language == sample["language"])
+        queries.append(normalized.query)
+
+    report = []
+    for language in sorted({sample["language"] for sample in samples}):
+        rows = [i for i, sample in enumerate(samples) if sample["language"] == language]
+        for name in ["as_is", "normalized"]:
+            focus, best, misses = [], [], []
+            for i in rows:
+                query = samples[i]["question"] if name == "as_is" else queries[i]
+                scored = get_relevant_documents_by_vector(embedding.embed_query(query), vector_store, -math.inf, k=k)
+                scores = [doc.metadata.get("score", 0.0) for doc in scored]
+                focus.append(np.mean([doc.metadata.get("focus_area") == samples[i]["focus_area"] for doc in scored]) if scored else 0.0)
+                best.append(max(scores) if scores else 0.0)
+                misses.append(float(not any(score >= similarity_threshold for score in scores)))
+            report.append({
+                "language": language,
+                "query": name,
+                "questions": len(rows),
+                f"focus_area@{k}": round(float(np.mean(focus)), 4),
+                "best_similarity": round(float(np.mean(best)), 4),
+                "no_source_rate": round(float(np.mean(misses)), 4),
+                "detection_accuracy": round(float(np.mean([detected[i] for i in rows])), 4),
+                "normalize_cold_ms": round(float(np.mean([cold_ms[i] for i in rows])), 3),
+                "normalize_cached_ms": round(float(np.mean([warm_ms[i] for i in rows])), 3),
+            })
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apport de la traduction des questions FR/AR en anglais avant la recherche.")
+    parser.add_argument("--testset", default="./translation_testset.csv", help="Questions étiquetées (question, language, focus_area)")
+    parser.add_argument("--translator", choices=["llm", "glossary"], default="glossary", help="Traducteur évalué")
+    parser.add_argument("--backend", choices=["cloudsql", "local"], default="local", help="Vector store interrogé")
+    parser.add_argument("--local-index-path", default="./local_index", help="Dossier de l'index vectoriel local (--backend local)")
+    parser.add_argument("--similarity-threshold", type=float, default=0.5, help="Seuil sous lequel un document ne compte pas comme source")
+    parser.add_argument("--k", type=int, default=3, help="Documents gardés")
+    parser.add_argument("--fake", action="store_true",
+                        help="Hors ligne : corpus synthétique, embeddings par hachage et index local temporaire")
+    args = parser.parse_args()
+
+    import pandas as pd
+
+    samples = pd.read_csv(args.testset).to_dict("records")
+    if args.fake:
+        import tempfile
+        from benchmarks.fakes import HashingEmbeddings, write_synthetic_corpus
+        from ingest import iter_csv_chunks
+        from local_store import LocalVectorStore
+
+        workdir = tempfile.mkdtemp()
+        rows = [row for chunk, _ in iter_csv_chunks(write_synthetic_corpus(f"{workdir}/corpus.csv"), 2000) for row in chunk]
+        embedding = HashingEmbeddings()
+        vector_store = LocalVectorStore(embedding, f"{workdir}/vectors")
+        vector_store.add_texts([text for text, _, _ in rows], [meta for _, meta, _ in rows], [doc_id for _, _, doc_id in rows])
+        vector_store.save()
+    else:
+        from config import TABLE_NAME
+        from ingest import get_embeddings, create_cloud_sql_database_connection, get_vector_store
+        from local_store import LocalVectorStore
+
+        embedding = get_embeddings()
+        vector_store = LocalVectorStore(embedding, args.local_index_path) if args.backend == "local" else \
+            get_vector_store(create_cloud_sql_database_connection(), TABLE_NAME, embedding)
+    if args.translator == "llm":
+        from api import get_llm
+        translator = LLMTranslator(lambda: get_llm(0.0))
+    else:
+        translator = GlossaryTranslator()
+    normalizer = QueryNormalizer(translator)
+    report = benchmark_normalization(vector_store, samples, embedding, normalizer, args.similarity_threshold, args.k)
+    print(pd.DataFrame(report).to_string(index=False))
+    print(f"\n📋 {normalizer.stats()}")
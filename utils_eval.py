@@ -1,17 +1,34 @@
+import os
 import numpy as np
 import time
-from sentence_transformers import SentenceTransformer
 from scipy.spatial.distance import euclidean
+from cache import SQLiteVectorStore, lazy_singleton
 
-# 🚀 Chargement du modèle BERT pour l'encodage des phrases
-bert_model = SentenceTransformer("all-MiniLM-L6-v2")
+BERT_MODEL_NAME = "all-MiniLM-L6-v2"
+ENCODE_BATCH_SIZE = 256
+# Embeddings des réponses de référence, conservés d'un run d'évaluation à l'autre
+REFERENCE_CACHE_PATH = os.getenv("EVAL_REFERENCE_CACHE_PATH", "./eval_results/reference_embeddings.sqlite")
 
-def compute_advanced_similarity(text1: str, text2: str) -> float:
+# 🚀 Chargement du modèle BERT pour l'encodage des phrases (au premier score, pas à l'import)
+@lazy_singleton
+def get_bert_model():
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(BERT_MODEL_NAME)
+
+def bert_encode(text: str) -> np.ndarray:
+    return get_bert_model().encode(text)
+
+def bert_encode_batch(texts: list) -> np.ndarray:
+    return get_bert_model().encode(texts, batch_size=ENCODE_BATCH_SIZE)
+
+def compute_advanced_similarity(text1: str, text2: str, encode=None) -> float:
     """
     Calcule la similarité entre deux textes en utilisant les embeddings BERT et la distance euclidienne normalisée.
+    `encode` remplace l'encodeur BERT (embeddings simulés pour une évaluation hors ligne).
     """
-    embedding1 = bert_model.encode(text1)
-    embedding2 = bert_model.encode(text2)
+    encode = encode or bert_encode
+    embedding1 = np.asarray(encode(text1))
+    embedding2 = np.asarray(encode(text2))
 
     # Distance euclidienne normalisée
     max_distance = np.linalg.norm(embedding1) + np.linalg.norm(embedding2)
@@ -19,7 +36,7 @@ def compute_advanced_similarity(text1: str, text2: str) -> float:
     
     return max(0.0, similarity)  # On s'assure que la similarité reste positive
 
-def calculate_relevance(chatbot_response, true_answer):
+def calculate_relevance(chatbot_response, true_answer, encode=None):
     """
     Évalue la pertinence de la réponse du chatbot en fonction de la réponse attendue.
     """
@@ -28,10 +45,77 @@ def calculate_relevance(chatbot_response, true_answer):
     
     if chatbot_response.get('type') == 'combined_response':
         # Évaluer la réponse générée par rapport à la base de données
-        llm_similarity = compute_advanced_similarity(chatbot_response['response'], chatbot_response['db_answer'])
+        llm_similarity = compute_advanced_similarity(chatbot_response['response'], chatbot_response['db_answer'], encode)
         return (llm_similarity + (1 - float(chatbot_response['score']))) / 2
     else:
-        return compute_advanced_similarity(chatbot_response.get('response', ''), true_answer)
+        return compute_advanced_similarity(chatbot_response.get('response', ''), true_answer, encode)
+
+# 🔹 Score par lots : quelques passes du modèle et un seul calcul NumPy au lieu de deux encodages par paire
+def compute_similarities_batch(embeddings1: np.ndarray, embeddings2: np.ndarray) -> np.ndarray:
+    """
+    compute_advanced_similarity ligne à ligne sur deux matrices d'embeddings (mêmes valeurs, à l'arrondi flottant près).
+    """
+    distances = np.linalg.norm(embeddings1 - embeddings2, axis=1)
+    max_distances = np.linalg.norm(embeddings1, axis=1) + np.linalg.norm(embeddings2, axis=1)
+    return np.maximum(0.0, 1 - distances / max_distances)
+
+def encode_references(texts: list, encode_batch=None, cache_path: str | None = REFERENCE_CACHE_PATH,
+                      namespace: str = BERT_MODEL_NAME) -> np.ndarray:
+    """
+    Encode les réponses de référence en passant par un cache SQLite ; seules les absentes sont encodées, par lots.
+    `namespace` distingue les encodeurs dans le cache (un autre modèle donne d'autres vecteurs).
+    """
+    encode_batch = encode_batch or bert_encode_batch
+    if not texts:
+        return np.zeros((0, 0), dtype=np.float32)
+    store = None
+    if cache_path:
+        os.makedirs(os.path.dirname(cache_path) or ".", exist_ok=True)
+        store = SQLiteVectorStore(cache_path)
+    unique_texts = list(dict.fromkeys(texts))
+    keys = {text: f"{namespace}|{text}" for text in unique_texts}
+    found = store.get_many(list(keys.values())) if store is not None else {}
+    missing = [text for text in unique_texts if keys[text] not in found]
+    if missing:
+        vectors = np.asarray(encode_batch(missing), dtype=np.float32)
+        computed = {keys[text]: vector for text, vector in zip(missing, vectors)}
+        if store is not None:
+            store.put_many(computed)
+        found.update(computed)
+    return np.asarray([found[keys[text]] for text in texts], dtype=np.float32)
+
+def calculate_relevance_batch(chatbot_responses: list, true_answers: list, encode_batch=None,
+                              cache_path: str | None = REFERENCE_CACHE_PATH, namespace: str = BERT_MODEL_NAME) -> list:
+    """
+    calculate_relevance pour tout un échantillon : réponses encodées par lots, références lues dans le cache.
+    """
+    encode_batch = encode_batch or bert_encode_batch
+    scores = [0.0] * len(chatbot_responses)
+    indices, responses, references = [], [], []
+    for i, (chatbot_response, true_answer) in enumerate(zip(chatbot_responses, true_answers)):
+        if not chatbot_response:
+            continue
+        indices.append(i)
+        if chatbot_response.get('type') == 'combined_response':
+            responses.append(chatbot_response['response'])
+            references.append(chatbot_response['db_answer'])
+        else:
+            responses.append(chatbot_response.get('response', ''))
+            references.append(true_answer)
+    if not indices:
+        return scores
+
+    similarities = compute_similarities_batch(
+        np.asarray(encode_batch(responses), dtype=np.float32),
+        encode_references(references, encode_batch, cache_path, namespace)
+    )
+    for i, similarity in zip(indices, similarities):
+        chatbot_response = chatbot_responses[i]
+        if chatbot_response.get('type') == 'combined_response':
+            scores[i] = float((similarity + (1 - float(chatbot_response['score']))) / 2)
+        else:
+            scores[i] = float(similarity)
+    return scores
 
 def was_answer_found_in_db(chatbot_response):
     """
@@ -41,19 +125,19 @@ def was_answer_found_in_db(chatbot_response):
         return False
     return chatbot_response.get('type') == 'database_match'
 
-def measure_response_time():
+def measure_response_time(fn, *args, **kwargs):
     """
-    Mesure le temps de réponse du chatbot.
+    Mesure le temps de réponse du chatbot : exécute fn et retourne (résultat, durée en secondes).
     """
-    start_time = time.time()
-    time.sleep(0.1)  # Simule un délai de réponse
-    return time.time() - start_time
+    start_time = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start_time
 
 def display_evaluation_results(results):
     """
     Affiche les résultats de l'évaluation du chatbot.
     """
-    print("\n📊 Résultats de l'évaluation sur 10 exemples aléatoires :")
+    print(f"\n📊 Résultats de l'évaluation sur {len(results)} exemples aléatoires :")
     print("-" * 50)
     
     avg_metrics = {
@@ -68,6 +152,6 @@ def display_evaluation_results(results):
     for i, result in enumerate(results[:10], 1):
         print(f"\nExemple {i}:")
         print(f"❓ Question: {result['question']}")
-        print(f"📂 Type de réponse: {result['chatbot_response'].get('type', 'unknown')}")
-        print(f"🔍 Score de similarité: {result['chatbot_response'].get('score', 'N/A')}")
+        print(f"📂 Type de réponse: {(result['chatbot_response'] or {}).get('type', 'unknown')}")
+        print(f"🔍 Score de similarité: {(result['chatbot_response'] or {}).get('score', 'N/A')}")
         print(f"✅ Pertinence: {result['relevance_score']:.4f}")